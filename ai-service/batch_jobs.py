@@ -0,0 +1,428 @@
+"""
+Carphatian AI Microservice - Batch Generation Jobs
+
+Durable bulk generation on Redis Streams.
+
+A job is a set of items of one kind (e.g. "job_draft"). Items are added to
+a shared stream and processed by worker tasks in every service process
+through a consumer group, using the same handlers as the synchronous
+endpoints (so cached results are reused). Items left pending by a crashed
+worker are reclaimed after an idle timeout.
+
+Redis layout:
+    ai:batch:stream              work items (consumer group ai-batch-workers)
+    ai:batch:job:{id}            job metadata and counters (hash)
+    ai:batch:results:{id}        item index -> JSON outcome (hash)
+    ai:batch:events:{id}         per-job progress events (stream)
+
+Built by Carphatian
+"""
+
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Type
+
+import structlog
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
+
+from cache import get_cache
+from config import get_settings
+from loop_monitor import get_loop_monitor
+
+logger = structlog.get_logger()
+
+
+STREAM_KEY = "ai:batch:stream"
+GROUP_NAME = "ai-batch-workers"
+JOB_KEY = "ai:batch:job:{}"
+RESULTS_KEY = "ai:batch:results:{}"
+EVENTS_KEY = "ai:batch:events:{}"
+
+
+# KEYS[1] = job hash
+# ARGV = item index
+# Returns the item's delivery count, or 0 if the job has expired (without
+# recreating its hash)
+ATTEMPT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+if redis.call('HGET', KEYS[1], 'status') == 'queued' then
+    redis.call('HSET', KEYS[1], 'status', 'running')
+end
+return redis.call('HINCRBY', KEYS[1], 'attempts:' .. ARGV[1], 1)
+"""
+
+# KEYS[1] = job hash, KEYS[2] = results hash, KEYS[3] = events stream
+# ARGV = item index, outcome JSON, counter ("completed" or "failed"), now,
+#        TTL (seconds), item event data
+# Claims the item's result slot, counts it and emits its events in one step,
+# so a redelivered item sees either all of them or none.
+# Returns {recorded (1, 0 if already recorded, -1 if the job has expired),
+#          final status or '', failed}
+RECORD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {-1, '', 0}
+end
+if redis.call('HSETNX', KEYS[2], ARGV[1], ARGV[2]) == 0 then
+    return {0, '', 0}
+end
+redis.call('HINCRBY', KEYS[1], ARGV[3], 1)
+redis.call('HSET', KEYS[1], 'updated_at', ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+redis.call('XADD', KEYS[3], '*', 'event', 'item', 'data', ARGV[6])
+redis.call('EXPIRE', KEYS[3], ARGV[5])
+
+local counts = redis.call('HMGET', KEYS[1], 'total', 'completed', 'failed')
+local total, completed, failed = tonumber(counts[1]), tonumber(counts[2]), tonumber(counts[3])
+if completed + failed < total then
+    return {1, '', failed}
+end
+local status = 'completed_with_errors'
+if failed == 0 then
+    status = 'completed'
+end
+redis.call('HSET', KEYS[1], 'status', status)
+redis.call('XADD', KEYS[3], '*', 'event', 'done', 'data',
+    '{"status": "' .. status .. '", "completed": ' .. completed .. ', "failed": ' .. failed .. '}')
+return {1, status, failed}
+"""
+
+
+class BatchUnavailable(RuntimeError):
+    """Raised when batch jobs are requested but Redis is not connected."""
+
+
+@dataclass
+class BatchHandler:
+    """Generation handler for one item kind."""
+    model: Type[BaseModel]
+    run: Callable[[BaseModel, Optional[str]], Awaitable[BaseModel]]
+
+
+# Handlers by item kind, registered by the application
+HANDLERS: Dict[str, BatchHandler] = {}
+
+
+def register_handler(
+    kind: str,
+    model: Type[BaseModel],
+    run: Callable[[BaseModel, Optional[str]], Awaitable[BaseModel]],
+) -> None:
+    """
+    Register the request model and generation function for an item kind.
+
+    The function is called with the validated item and the submitting tenant.
+    """
+    HANDLERS[kind] = BatchHandler(model=model, run=run)
+
+
+async def _client():
+    cache = await get_cache()
+    if cache._client is None:
+        raise BatchUnavailable("Batch jobs require Redis")
+    return cache._client
+
+
+async def _stream_client():
+    """Client for blocking event stream reads (a pool of its own, see AICache)."""
+    cache = await get_cache()
+    if cache._streams is None:
+        raise BatchUnavailable("Batch jobs require Redis")
+    return cache._streams
+
+
+async def _ensure_group(client) -> None:
+    try:
+        await client.xgroup_create(STREAM_KEY, GROUP_NAME, id="0", mkstream=True)
+    except Exception as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def validate_items(kind: str, items: List[dict]) -> List[BaseModel]:
+    """
+    Validate batch items against the handler's request model.
+
+    Raises:
+        HTTPException: 400 for an unknown kind, 422 for an invalid item
+    """
+    handler = HANDLERS.get(kind)
+    if handler is None:
+        raise HTTPException(status_code=400, detail=f"Unknown batch kind: {kind}")
+    validated = []
+    for index, item in enumerate(items):
+        try:
+            validated.append(handler.model.model_validate(item))
+        except ValidationError as e:
+            raise HTTPException(
+                status_code=422,
+                detail={"index": index, "errors": e.errors(include_url=False)},
+            )
+    return validated
+
+
+async def submit_job(kind: str, items: List[BaseModel], tenant: Optional[str] = None) -> dict:
+    """
+    Persist a job and enqueue its items.
+
+    Returns:
+        The job status dict
+    """
+    settings = get_settings()
+    client = await _client()
+    await _ensure_group(client)
+
+    job_id = uuid.uuid4().hex
+    job_key = JOB_KEY.format(job_id)
+    now = time.time()
+
+    async with client.pipeline(transaction=True) as pipe:
+        pipe.hset(job_key, mapping={
+            "kind": kind,
+            "status": "queued",
+            "total": len(items),
+            "completed": 0,
+            "failed": 0,
+            "created_at": now,
+            "updated_at": now,
+        })
+        pipe.expire(job_key, settings.batch_job_ttl)
+        for index, item in enumerate(items):
+            pipe.xadd(STREAM_KEY, {
+                "job_id": job_id,
+                "index": index,
+                "kind": kind,
+                "tenant": tenant or "",
+                "payload": item.model_dump_json(),
+            })
+        await pipe.execute()
+
+    logger.info("batch_job_submitted", job_id=job_id, kind=kind, items=len(items))
+    return await get_job(job_id)
+
+
+async def get_job(job_id: str, include_results: bool = False) -> Optional[dict]:
+    """Get job status, optionally with per-item outcomes ordered by index."""
+    client = await _client()
+    job = await client.hgetall(JOB_KEY.format(job_id))
+    if not job:
+        return None
+
+    status = {
+        "job_id": job_id,
+        "kind": job["kind"],
+        "status": job["status"],
+        "total": int(job["total"]),
+        "completed": int(job["completed"]),
+        "failed": int(job["failed"]),
+        "created_at": float(job["created_at"]),
+        "updated_at": float(job["updated_at"]),
+        "results": None,
+    }
+    if include_results:
+        raw = await client.hgetall(RESULTS_KEY.format(job_id))
+        status["results"] = [
+            {"index": int(index), **json.loads(outcome)}
+            for index, outcome in sorted(raw.items(), key=lambda kv: int(kv[0]))
+        ]
+    return status
+
+
+async def stream_events(job_id: str, last_event_id: str = "0") -> AsyncIterator[str]:
+    """
+    Yield job progress as Server-Sent Events.
+
+    Resumes after `last_event_id` (the SSE Last-Event-ID), and ends once
+    the job's final event has been sent.
+    """
+    client = await _client()
+    streams = await _stream_client()
+    events_key = EVENTS_KEY.format(job_id)
+    while True:
+        response = await streams.xread({events_key: last_event_id}, count=100, block=15000)
+        if not response:
+            # Keep the connection alive and stop if the job has expired
+            if not await client.exists(JOB_KEY.format(job_id)):
+                return
+            yield ": keep-alive\n\n"
+            continue
+        for event_id, fields in response[0][1]:
+            last_event_id = event_id
+            yield f"id: {event_id}\nevent: {fields['event']}\ndata: {fields['data']}\n\n"
+            if fields["event"] == "done":
+                return
+
+
+class BatchWorker:
+    """
+    Consumer-group workers processing batch items in this process.
+
+    Runs `concurrency` tasks, each handling one item at a time, so the
+    number of concurrent provider calls per process is bounded.
+    """
+
+    def __init__(self, concurrency: Optional[int] = None):
+        settings = get_settings()
+        self.concurrency = concurrency or settings.batch_worker_concurrency
+        self.consumer_prefix = f"{socket.gethostname()}-{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        self._scripts: Dict[str, Any] = {}
+        self._script_client = None
+
+    def start(self) -> None:
+        for i in range(self.concurrency):
+            consumer = f"{self.consumer_prefix}-{i}"
+            self._tasks.append(asyncio.create_task(self._run(consumer)))
+        logger.info("batch_workers_started", consumer=self.consumer_prefix, concurrency=self.concurrency)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("batch_workers_stopped", consumer=self.consumer_prefix)
+
+    async def _run(self, consumer: str) -> None:
+        settings = get_settings()
+        group_ready = False
+        last_claim = 0.0
+        # XAUTOCLAIM cursor while a scan of the pending items is in progress
+        claim_cursor: Optional[str] = None
+        while True:
+            try:
+                cache = await get_cache()
+                client, streams = cache._client, cache._worker_streams
+                if client is None or streams is None:
+                    await asyncio.sleep(5)
+                    continue
+                # Leave the loop to interactive requests while it is overloaded
+                if get_loop_monitor().overloaded:
+                    await asyncio.sleep(1)
+                    continue
+                if not group_ready:
+                    await _ensure_group(client)
+                    group_ready = True
+
+                entries = []
+                # Periodically take over items left pending by dead consumers,
+                # a batch at a time until the scan has covered all of them
+                if claim_cursor is not None or time.monotonic() - last_claim > settings.batch_claim_idle / 2:
+                    last_claim = time.monotonic()
+                    claim_cursor, entries = await self._claim(client, consumer, claim_cursor or "0-0")
+                if not entries:
+                    response = await streams.xreadgroup(
+                        GROUP_NAME, consumer, {STREAM_KEY: ">"}, count=1, block=5000
+                    )
+                    entries = response[0][1] if response else []
+
+                for entry_id, fields in entries:
+                    await self._process(client, entry_id, fields)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("batch_worker_error", consumer=consumer, error=str(e))
+                group_ready = False
+                await asyncio.sleep(1)
+
+    async def _claim(self, client, consumer: str, start_id: str):
+        """
+        Take over a batch of items pending longer than batch_claim_idle.
+
+        Returns:
+            (cursor of the next batch or None once the scan is done, entries)
+        """
+        settings = get_settings()
+        cursor, entries, *_ = await client.xautoclaim(
+            STREAM_KEY, GROUP_NAME, consumer,
+            min_idle_time=int(settings.batch_claim_idle * 1000),
+            start_id=start_id,
+            count=max(self.concurrency, 10),
+        )
+        if entries:
+            logger.info("batch_items_claimed", consumer=consumer, items=len(entries))
+        return (None if cursor == "0-0" else cursor), entries
+
+    def _script(self, client, name: str, source: str):
+        if self._script_client is not client:
+            self._scripts, self._script_client = {}, client
+        if name not in self._scripts:
+            self._scripts[name] = client.register_script(source)
+        return self._scripts[name]
+
+    async def _process(self, client, entry_id: str, fields: Dict[str, Any]) -> None:
+        """Run one item and record its outcome exactly once."""
+        settings = get_settings()
+        job_id = fields["job_id"]
+        index = fields["index"]
+        job_key = JOB_KEY.format(job_id)
+
+        attempts = await self._script(client, "attempt", ATTEMPT_SCRIPT)(keys=[job_key], args=[index])
+        if not attempts:
+            # The job expired while the item was pending: drop the item
+            logger.warning("batch_item_expired", job_id=job_id, index=index)
+            await self._ack(client, entry_id)
+            return
+
+        handler = HANDLERS.get(fields["kind"])
+        if handler is None:
+            outcome = {"status": "error", "error": f"Unknown batch kind: {fields['kind']}"}
+        elif attempts > settings.batch_max_attempts:
+            outcome = {"status": "error", "error": "Maximum attempts exceeded"}
+        else:
+            try:
+                result = await handler.run(
+                    handler.model.model_validate_json(fields["payload"]),
+                    fields.get("tenant") or None,
+                )
+                outcome = {"status": "ok", "result": result.model_dump()}
+            except HTTPException as e:
+                outcome = {"status": "error", "error": str(e.detail)}
+            except Exception as e:
+                outcome = {"status": "error", "error": str(e)}
+
+        await self._record(client, job_id, index, outcome)
+        await self._ack(client, entry_id)
+
+    async def _ack(self, client, entry_id: str) -> None:
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.xack(STREAM_KEY, GROUP_NAME, entry_id)
+            pipe.xdel(STREAM_KEY, entry_id)
+            await pipe.execute()
+
+    async def _record(self, client, job_id: str, index: str, outcome: dict) -> None:
+        """Record an item's outcome, counters and events atomically (once per item)."""
+        settings = get_settings()
+        recorded, status, failed = await self._script(client, "record", RECORD_SCRIPT)(
+            keys=[JOB_KEY.format(job_id), RESULTS_KEY.format(job_id), EVENTS_KEY.format(job_id)],
+            args=[
+                index,
+                json.dumps(outcome),
+                "completed" if outcome["status"] == "ok" else "failed",
+                time.time(),
+                settings.batch_job_ttl,
+                json.dumps({"index": int(index), **outcome}),
+            ],
+        )
+        if int(recorded) < 0:
+            logger.warning("batch_item_expired", job_id=job_id, index=index)
+        elif status:
+            logger.info("batch_job_finished", job_id=job_id, status=status, failed=int(failed))
+
+
+# Singleton instance
+_worker: Optional[BatchWorker] = None
+
+
+def get_batch_worker() -> BatchWorker:
+    """Get or create the batch worker for this process."""
+    global _worker
+    if _worker is None:
+        _worker = BatchWorker()
+    return _worker
@@ -0,0 +1,220 @@
+"""
+Carphatian AI Microservice - Cache Key Replay
+
+Replays a request log through the legacy and canonical cache key builders
+and reports the hit rate of each, assuming an unbounded cache.
+
+It also counts "stale hits": legacy hits whose prompt-affecting fields
+differ from the request that filled the entry, i.e. users who were served
+a response generated for a different prompt.
+
+Log format (JSONL), one request per line:
+    {"endpoint": "job_draft" | "cover_letter" | "embedding", "body": {...}}
+
+Usage:
+    python benchmarks/cache_key_replay.py [requests.jsonl] [--json]
+
+Without a log file a synthetic log with realistic spelling variants is
+generated (fixed seed).
+
+Built by Carphatian
+"""
+
+import json
+import os
+import random
+import sys
+from typing import Callable, Dict, Iterable, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_keys import cover_letter_key, embedding_key, job_draft_key  # noqa: E402
+
+
+# ============================================================================
+# Legacy key builders (as shipped before canonicalization)
+# ============================================================================
+
+def legacy_job_draft_key(body: dict) -> dict:
+    return {
+        "type": "job_draft",
+        "title": body["title"],
+        "category": body["category"],
+        "skills": sorted(body["skills"]),
+    }
+
+
+def legacy_cover_letter_key(body: dict) -> dict:
+    return {
+        "type": "cover_letter",
+        "job_title": body["job_title"],
+        "skills": sorted(body["freelancer_skills"]),
+    }
+
+
+def legacy_embedding_key(body: dict) -> dict:
+    return {
+        "type": "embedding",
+        "text": body["text"][:100],
+        "model": body.get("model") or "default",
+    }
+
+
+LEGACY: Dict[str, Callable[[dict], dict]] = {
+    "job_draft": legacy_job_draft_key,
+    "cover_letter": legacy_cover_letter_key,
+    "embedding": legacy_embedding_key,
+}
+
+CANONICAL: Dict[str, Callable[[dict], dict]] = {
+    "job_draft": lambda body: job_draft_key(
+        title=body["title"],
+        category=body["category"],
+        skills=body["skills"],
+        budget_min=body.get("budget_min"),
+        budget_max=body.get("budget_max"),
+        timeline=body.get("timeline"),
+        additional_context=body.get("additional_context"),
+        provider=body.get("provider"),
+    ),
+    "cover_letter": lambda body: cover_letter_key(
+        job_title=body["job_title"],
+        job_description=body["job_description"],
+        freelancer_name=body["freelancer_name"],
+        freelancer_skills=body["freelancer_skills"],
+        freelancer_experience=body.get("freelancer_experience"),
+        provider=body.get("provider"),
+    ),
+    "embedding": lambda body: embedding_key(body["text"], body.get("model")),
+}
+
+
+def _freeze(data: dict) -> str:
+    return json.dumps(data, sort_keys=True)
+
+
+def replay(log: Iterable[dict]) -> Dict[str, dict]:
+    """Replay a log and return hit statistics per endpoint and key scheme."""
+    report: Dict[str, dict] = {}
+    filled: Dict[Tuple[str, str], Dict[str, str]] = {}
+
+    for entry in log:
+        endpoint, body = entry["endpoint"], entry["body"]
+        stats = report.setdefault(endpoint, {
+            "requests": 0,
+            "legacy_hits": 0,
+            "legacy_stale_hits": 0,
+            "canonical_hits": 0,
+        })
+        stats["requests"] += 1
+
+        for scheme, builders in (("legacy", LEGACY), ("canonical", CANONICAL)):
+            store = filled.setdefault((scheme, endpoint), {})
+            key = _freeze(builders[endpoint](body))
+            # The canonical key covers every prompt-affecting field
+            prompt_identity = _freeze(CANONICAL[endpoint](body))
+            if key in store:
+                stats[f"{scheme}_hits"] += 1
+                if scheme == "legacy" and store[key] != prompt_identity:
+                    stats["legacy_stale_hits"] += 1
+            else:
+                store[key] = prompt_identity
+
+    for stats in report.values():
+        requests = stats["requests"]
+        stats["legacy_hit_rate"] = round(stats["legacy_hits"] / requests, 4)
+        stats["legacy_valid_hit_rate"] = round(
+            (stats["legacy_hits"] - stats["legacy_stale_hits"]) / requests, 4
+        )
+        stats["canonical_hit_rate"] = round(stats["canonical_hits"] / requests, 4)
+    return report
+
+
+# ============================================================================
+# Synthetic log
+# ============================================================================
+
+_SKILL_VARIANTS = {
+    "react": ["React", "react ", "ReactJS", "React.js"],
+    "node.js": ["Node.js", "NodeJS", "node"],
+    "typescript": ["TypeScript", "typescript", "TS"],
+    "postgresql": ["PostgreSQL", "Postgres"],
+    "python": ["Python", "python3", " Python"],
+    "kubernetes": ["Kubernetes", "k8s"],
+}
+
+_TITLES = [
+    "Build a marketplace dashboard",
+    "Senior backend engineer for payments API",
+    "Migrate legacy app to Kubernetes",
+    "Data pipeline for analytics",
+    "Landing page redesign",
+]
+
+
+def _vary_text(rng: random.Random, text: str) -> str:
+    choice = rng.random()
+    if choice < 0.3:
+        return text.title()
+    if choice < 0.5:
+        return f"  {text}  "
+    if choice < 0.6:
+        return text.replace(" ", "  ")
+    return text
+
+
+def synthetic_log(count: int = 2000, seed: int = 7) -> List[dict]:
+    """Requests drawn from a small set of intents with spelling noise."""
+    rng = random.Random(seed)
+    log = []
+    for _ in range(count):
+        title = _TITLES[rng.randrange(len(_TITLES))]
+        skills = rng.sample(sorted(_SKILL_VARIANTS), 3)
+        spelled = [rng.choice(_SKILL_VARIANTS[skill]) for skill in skills]
+        rng.shuffle(spelled)
+        budget_max = rng.choice([None, 2000, 5000])
+
+        if rng.random() < 0.6:
+            log.append({"endpoint": "job_draft", "body": {
+                "title": _vary_text(rng, title),
+                "category": _vary_text(rng, "Web Development"),
+                "skills": spelled,
+                "budget_min": 500 if budget_max else None,
+                "budget_max": budget_max,
+                "timeline": rng.choice([None, "2 weeks", "1 month"]),
+            }})
+        else:
+            log.append({"endpoint": "cover_letter", "body": {
+                "job_title": _vary_text(rng, title),
+                "job_description": f"We need help with: {title.lower()}.",
+                "freelancer_name": rng.choice(["Ana Pop", "Mihai Ionescu"]),
+                "freelancer_skills": spelled,
+            }})
+    return log
+
+
+def main(argv: List[str]) -> int:
+    paths = [arg for arg in argv if not arg.startswith("--")]
+    if paths:
+        with open(paths[0]) as f:
+            log = [json.loads(line) for line in f if line.strip()]
+    else:
+        log = synthetic_log()
+
+    report = replay(log)
+    if "--json" in argv:
+        print(json.dumps(report, indent=2))
+        return 0
+
+    print(f"{'endpoint':<14}{'requests':>10}{'legacy':>10}{'legacy ok':>11}{'canonical':>11}")
+    for endpoint, stats in sorted(report.items()):
+        print(
+            f"{endpoint:<14}{stats['requests']:>10}"
+            f"{stats['legacy_hit_rate']:>10.1%}{stats['legacy_valid_hit_rate']:>11.1%}"
+            f"{stats['canonical_hit_rate']:>11.1%}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,173 @@
+"""
+Carphatian AI Microservice - Embedding Dimension Benchmark
+
+Retrieval quality, search speed and memory against embedding dimensions,
+to choose EMBEDDING_DIMENSIONS / EMBEDDING_COLLECTION_DIMENSIONS.
+
+Full-size vectors are embedded once, then truncated and re-normalized
+(providers.base.truncate_embedding) to each dimension. Reported per
+dimension:
+
+    recall@1, recall@5, MRR     on the labelled set of local_embedding_bench
+    overlap@10                  share of each query's top 10 documents that
+                                are also in its full-dimension top 10
+    search ms                   scoring one query against --vectors float32
+                                vectors and selecting the top 10
+    MB per 1M vectors           float32 storage
+
+--source openai embeds with text-embedding-3-small (needs OPENAI_API_KEY);
+its leading components carry the most information (Matryoshka training).
+--source local uses the local hashing embedder, whose truncated vectors
+are those of a smaller random projection.
+
+Usage:
+    python benchmarks/dimension_bench.py [--source local|openai]
+        [--dims 64,128,256,512,768] [--vectors 100000]
+        [--save results/dimension.json]
+
+Built by Carphatian
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from local_embedding_bench import EVAL_SET, retrieval_quality  # noqa: E402
+
+TOP_K = 10
+
+
+# ============================================================================
+# Sources
+# ============================================================================
+
+def embed_local(dimensions: int) -> Tuple[str, np.ndarray, np.ndarray]:
+    from config import get_settings
+    from providers.local_embedding_provider import HashingEmbedder
+
+    settings = get_settings()
+    embedder = HashingEmbedder(dimensions, settings.local_embedding_buckets, settings.local_embedding_seed)
+    queries = np.array([embedder.embed(query) for query, _ in EVAL_SET])
+    docs = np.array([embedder.embed(doc) for _, doc in EVAL_SET])
+    return embedder.model_name, queries, docs
+
+
+async def embed_openai() -> Tuple[str, np.ndarray, np.ndarray]:
+    from providers.base import EmbeddingRequest
+    from providers.openai_provider import OpenAIProvider
+
+    provider = OpenAIProvider()
+
+    async def embed(text: str) -> List[float]:
+        return (await provider.embed(EmbeddingRequest(text=text))).embedding
+
+    queries = np.array([await embed(query) for query, _ in EVAL_SET])
+    docs = np.array([await embed(doc) for _, doc in EVAL_SET])
+    return provider.embedding_model, queries, docs
+
+
+# ============================================================================
+# Metrics
+# ============================================================================
+
+def truncate(vectors: np.ndarray, dimensions: int) -> np.ndarray:
+    """Row-wise truncate_embedding."""
+    head = vectors[:, :dimensions]
+    return head / np.maximum(np.linalg.norm(head, axis=1, keepdims=True), 1e-12)
+
+
+def top_k(queries: np.ndarray, docs: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-(queries @ docs.T), axis=1)[:, :k]
+
+
+def neighbor_overlap(queries: np.ndarray, docs: np.ndarray, reference: np.ndarray, k: int) -> float:
+    """Mean share of the reference top-k found in the top-k of these vectors."""
+    found = top_k(queries, docs, k)
+    return float(np.mean([len(set(row) & set(ref)) / k for row, ref in zip(found, reference)]))
+
+
+def search_ms(dimensions: int, vectors: int, repeat: int = 20) -> float:
+    """Median time to score one query against `vectors` vectors and take the top 10."""
+    rng = np.random.default_rng(0)
+    matrix = rng.standard_normal((vectors, dimensions), dtype=np.float32)
+    query = rng.standard_normal(dimensions, dtype=np.float32)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        scores = matrix @ query
+        np.argpartition(-scores, TOP_K)[:TOP_K]
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(float(np.median(timings)), 3)
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Embedding dimension quality/speed benchmark")
+    parser.add_argument("--source", choices=["local", "openai"], default="local")
+    parser.add_argument("--dims", default="64,128,256,512,768")
+    parser.add_argument("--vectors", type=int, default=100_000, help="Vectors scored per search timing")
+    parser.add_argument("--save", default=os.path.join(RESULTS_DIR, "dimension_latest.json"))
+    args = parser.parse_args(argv)
+
+    dims = sorted(int(value) for value in args.dims.split(","))
+    if args.source == "openai":
+        if not os.environ.get("OPENAI_API_KEY"):
+            print("OPENAI_API_KEY is not set", file=sys.stderr)
+            return 1
+        model, queries, docs = asyncio.run(embed_openai())
+    else:
+        model, queries, docs = embed_local(max(dims))
+    full = queries.shape[1]
+    dims = [d for d in dims if d <= full]
+    reference = top_k(queries, docs, TOP_K)
+
+    results: Dict[str, dict] = {}
+    for d in dims:
+        short_queries, short_docs = truncate(queries, d), truncate(docs, d)
+        results[str(d)] = {
+            **retrieval_quality(short_queries, short_docs),
+            f"overlap@{TOP_K}": round(neighbor_overlap(short_queries, short_docs, reference, TOP_K), 3),
+            "search_ms": search_ms(d, args.vectors),
+            "mb_per_1m_vectors": round(d * 4 * 1_000_000 / 1e6, 1),
+        }
+
+    print(f"{model}, {full} dims, search over {args.vectors} vectors")
+    print(f"{'dims':>6}{'R@1':>7}{'R@5':>7}{'MRR':>7}{'ovl@10':>8}{'search':>11}{'MB/1M':>9}")
+    for d, row in results.items():
+        print(
+            f"{d:>6}{row['recall@1']:>7.2f}{row['recall@5']:>7.2f}{row['mrr']:>7.2f}"
+            f"{row[f'overlap@{TOP_K}']:>8.2f}{row['search_ms']:>9.2f}ms{row['mb_per_1m_vectors']:>9.0f}"
+        )
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump({
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "platform": platform.platform(),
+                "source": args.source,
+                "model": model,
+                "full_dimensions": full,
+                "eval_pairs": len(EVAL_SET),
+                "search_vectors": args.vectors,
+                "results": results,
+            }, f, indent=2)
+        print(f"saved {args.save}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,195 @@
+"""
+Carphatian AI Microservice - Fake Providers
+
+Latency-injecting stand-ins for the real AI providers, for benchmarks.
+
+Each fake answers like its real counterpart (valid JSON for the
+generation prompts, deterministic embeddings) after a simulated delay:
+a log-normal time to first token plus generation time at the configured
+token rate. A share of calls fails with a retryable 503.
+
+Usage:
+    install_fake_providers({"openai": ProviderProfile(...), ...})
+
+Built by Carphatian
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import sys
+from dataclasses import dataclass
+from typing import Dict, Optional, Type, Union
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from providers import factory as factory_module  # noqa: E402
+from providers.base import (  # noqa: E402
+    BaseAIProvider,
+    CompletionRequest,
+    CompletionResponse,
+    EmbeddingRequest,
+    EmbeddingResponse,
+)
+
+
+@dataclass
+class ProviderProfile:
+    """Simulated behaviour of one provider."""
+    model: str
+    # Time to first token: log-normal with this median and p99 (milliseconds)
+    latency_p50_ms: float = 400.0
+    latency_p99_ms: float = 2000.0
+    # Generation speed for completion tokens
+    tokens_per_second: float = 80.0
+    completion_tokens: int = 350
+    # Share of calls failing with a retryable 503
+    error_rate: float = 0.0
+    supports_embeddings: bool = False
+    embedding_dimensions: int = 256
+    embedding_latency_ms: float = 60.0
+
+    def sample_latency(self, rng: random.Random) -> float:
+        """Seconds to first token."""
+        mu = math.log(self.latency_p50_ms)
+        # z(0.99) = 2.326
+        sigma = max(math.log(self.latency_p99_ms / self.latency_p50_ms) / 2.326, 1e-6)
+        return rng.lognormvariate(mu, sigma) / 1000
+
+
+# Rough profiles of the production providers (override per run as needed)
+DEFAULT_PROFILES: Dict[str, ProviderProfile] = {
+    "openai": ProviderProfile(
+        model="gpt-4o",
+        latency_p50_ms=450,
+        latency_p99_ms=2500,
+        tokens_per_second=90,
+        error_rate=0.01,
+        supports_embeddings=True,
+    ),
+    "anthropic": ProviderProfile(
+        model="claude-3-5-sonnet-20241022",
+        latency_p50_ms=700,
+        latency_p99_ms=3500,
+        tokens_per_second=70,
+        error_rate=0.01,
+    ),
+    "groq": ProviderProfile(
+        model="llama-3.1-70b-versatile",
+        latency_p50_ms=200,
+        latency_p99_ms=900,
+        tokens_per_second=250,
+        error_rate=0.02,
+    ),
+}
+
+
+class FakeProviderError(RuntimeError):
+    """Simulated transient provider failure (retried like a real 503)."""
+    status_code = 503
+
+
+def _fake_content(prompt: str) -> str:
+    if '"cover_letter"' in prompt:
+        return json.dumps({
+            "cover_letter": "Dear hiring manager,\n\nI would love to help with this project. " * 6,
+            "highlights": ["Relevant experience", "Fast delivery", "Clear communication"],
+        })
+    return json.dumps({
+        "description": "We are looking for an experienced freelancer to join our team. " * 8,
+        "requirements": ["3+ years of experience", "Strong communication", "Portfolio of work"],
+        "nice_to_have": ["Startup experience", "Open source contributions"],
+    })
+
+
+class FakeProvider(BaseAIProvider):
+    """Provider answering after a simulated delay."""
+
+    profile: ProviderProfile
+    time_scale: float = 1.0
+
+    def __init__(self):
+        self.model = self.profile.model
+        self.embedding_model = "text-embedding-3-small"
+        self.supports_embeddings = self.profile.supports_embeddings
+        # Read by the factory when choosing the budgeting model
+        self.client = self
+        self._rng = random.Random(f"{self.name}-{self.model}")
+
+    async def _maybe_fail(self) -> None:
+        if self._rng.random() < self.profile.error_rate:
+            await asyncio.sleep(self.profile.sample_latency(self._rng) * self.time_scale / 4)
+            raise FakeProviderError(f"{self.name} returned 503")
+
+    async def complete(self, request: CompletionRequest) -> CompletionResponse:
+        await self._maybe_fail()
+        prompt = "\n".join(message.content for message in request.messages)
+        completion_tokens = min(self.profile.completion_tokens, request.max_tokens)
+        delay = (
+            self.profile.sample_latency(self._rng)
+            + completion_tokens / self.profile.tokens_per_second
+        )
+        await asyncio.sleep(delay * self.time_scale)
+        prompt_tokens = len(prompt) // 4
+        return CompletionResponse(
+            content=_fake_content(prompt),
+            model=self.model,
+            provider=self.name,
+            usage={
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        )
+
+    async def embed(self, request: EmbeddingRequest) -> EmbeddingResponse:
+        if not self.supports_embeddings:
+            raise NotImplementedError(f"{self.name} does not support embeddings")
+        await self._maybe_fail()
+        await asyncio.sleep(self.profile.embedding_latency_ms / 1000 * self.time_scale)
+        seed = int.from_bytes(hashlib.sha256(request.text.encode()).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.profile.embedding_dimensions)
+        vector /= np.linalg.norm(vector)
+        return EmbeddingResponse(
+            embedding=vector.tolist(),
+            model=request.model or self.embedding_model,
+            dimensions=len(vector),
+            provider=self.name,
+            usage={"prompt_tokens": len(request.text) // 4, "total_tokens": len(request.text) // 4},
+        )
+
+    async def is_available(self) -> bool:
+        return True
+
+
+def install_fake_providers(
+    profiles: Optional[Dict[str, ProviderProfile]] = None,
+    time_scale: float = 1.0,
+) -> Dict[str, Union[str, Type[BaseAIProvider]]]:
+    """
+    Register fake providers in AIProviderFactory.PROVIDERS.
+
+    Resets the factory singleton so the next get_ai_factory() builds the
+    fakes.
+
+    Args:
+        profiles: Provider name -> profile (defaults to DEFAULT_PROFILES)
+        time_scale: Multiplier applied to every simulated delay
+
+    Returns:
+        The previous registry entries (to restore later)
+    """
+    previous = dict(factory_module.AIProviderFactory.PROVIDERS)
+    for name, profile in (profiles or DEFAULT_PROFILES).items():
+        factory_module.AIProviderFactory.PROVIDERS[name] = type(
+            f"Fake{name.title()}Provider",
+            (FakeProvider,),
+            {"name": name, "profile": profile, "time_scale": time_scale},
+        )
+    factory_module._factory = None
+    return previous
@@ -0,0 +1,356 @@
+"""
+Carphatian AI Microservice - Load Test
+
+In-process load generator for every endpoint, backed by latency-injecting
+fake providers (see fake_providers.py).
+
+Requests go through the full ASGI stack (middleware, validation, cache,
+provider factory, retries, parsing) at a fixed concurrency. A share of
+requests repeats earlier payloads, so cache hits are exercised as well.
+Reports throughput and latency percentiles per endpoint, saves the
+results as JSON and, given a baseline, fails on regressions.
+
+Redis modes:
+    --redis fake        in-memory fakeredis (default; pip install fakeredis)
+    --redis none        no Redis: local fallback cache, batch endpoint skipped
+    --redis URL         a real Redis, e.g. redis://localhost:6379/15
+
+Usage:
+    python benchmarks/load_test.py [--requests 200] [--concurrency 20]
+        [--scenarios job_draft,cover_letter] [--time-scale 0.1]
+        [--save results/load_test.json] [--baseline results/load_test_baseline.json]
+
+The committed baseline was recorded with --time-scale 0.1 and the other
+defaults; compare against it with the same options.
+
+Built by Carphatian
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+SERVICE_DIR = os.path.dirname(BENCHMARKS_DIR)
+
+
+@dataclass
+class Scenario:
+    """One endpoint under load."""
+    name: str
+    method: str
+    path: str
+    payload: Callable[[random.Random, str, int], Optional[dict]]
+    needs_redis: bool = False
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    latencies: List[float] = field(default_factory=list)
+    statuses: Counter = field(default_factory=Counter)
+    cached: int = 0
+    duration: float = 0.0
+
+    def summary(self, concurrency: int) -> dict:
+        import numpy as np
+
+        latencies = np.array(self.latencies) * 1000
+        total = len(self.latencies)
+        errors = sum(count for status, count in self.statuses.items() if status >= 400)
+        return {
+            "requests": total,
+            "concurrency": concurrency,
+            "duration_s": round(self.duration, 3),
+            "throughput_rps": round(total / self.duration, 2) if self.duration else 0.0,
+            "latency_ms": {
+                "mean": round(float(latencies.mean()), 2),
+                "p50": round(float(np.percentile(latencies, 50)), 2),
+                "p95": round(float(np.percentile(latencies, 95)), 2),
+                "p99": round(float(np.percentile(latencies, 99)), 2),
+                "max": round(float(latencies.max()), 2),
+            },
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+            "error_rate": round(errors / total, 4),
+            "cache_hit_rate": round(self.cached / total, 4),
+        }
+
+
+# ============================================================================
+# Payloads
+# ============================================================================
+
+_TITLES = [
+    "Build a marketplace dashboard",
+    "Senior backend engineer for payments API",
+    "Migrate legacy app to Kubernetes",
+    "Data pipeline for analytics",
+    "Landing page redesign",
+    "Mobile app for restaurant bookings",
+]
+_SKILLS = ["React", "Node.js", "TypeScript", "PostgreSQL", "Python", "Kubernetes", "AWS", "Figma"]
+
+
+def _job_draft(rng: random.Random, run_id: str, index: int) -> dict:
+    return {
+        "title": f"{rng.choice(_TITLES)} #{index} {run_id}",
+        "category": "Web Development",
+        "skills": rng.sample(_SKILLS, 3),
+        "budget_min": 500,
+        "budget_max": rng.choice([2000, 5000, 10000]),
+        "timeline": rng.choice(["2 weeks", "1 month", "3 months"]),
+    }
+
+
+def _cover_letter(rng: random.Random, run_id: str, index: int) -> dict:
+    title = rng.choice(_TITLES)
+    return {
+        "job_title": f"{title} #{index} {run_id}",
+        "job_description": f"We need help with: {title.lower()}. " * 20,
+        "freelancer_name": rng.choice(["Ana Pop", "Mihai Ionescu", "Elena Radu"]),
+        "freelancer_skills": rng.sample(_SKILLS, 4),
+        "freelancer_experience": "Eight years building web products for startups. " * 5,
+    }
+
+
+def _embed(rng: random.Random, run_id: str, index: int) -> dict:
+    return {"text": f"{rng.choice(_TITLES)} using {', '.join(rng.sample(_SKILLS, 3))} ({run_id}-{index})"}
+
+
+def _semantic_search(dimensions: int, candidates: int) -> Callable[[random.Random, str, int], dict]:
+    import numpy as np
+
+    matrix = np.random.default_rng(0).standard_normal((candidates, dimensions))
+    embeddings = (matrix / np.linalg.norm(matrix, axis=1, keepdims=True)).round(6).tolist()
+
+    def payload(rng: random.Random, run_id: str, index: int) -> dict:
+        return {
+            "query": f"{rng.choice(_TITLES)} ({run_id}-{index})",
+            "embeddings": embeddings,
+            "top_k": 10,
+        }
+    return payload
+
+
+def _batch_submit(rng: random.Random, run_id: str, index: int) -> dict:
+    return {"kind": "job_draft", "items": [_job_draft(rng, run_id, index * 10 + i) for i in range(10)]}
+
+
+def build_scenarios(dimensions: int, candidates: int) -> Dict[str, Scenario]:
+    return {
+        scenario.name: scenario for scenario in [
+            Scenario("health", "GET", "/health", lambda rng, run_id, index: None),
+            Scenario("job_draft", "POST", "/ai/job-draft", _job_draft),
+            Scenario("cover_letter", "POST", "/ai/cover-letter", _cover_letter),
+            Scenario("embed", "POST", "/ai/embed", _embed),
+            Scenario("semantic_search", "POST", "/ai/semantic-search", _semantic_search(dimensions, candidates)),
+            Scenario("batch_submit", "POST", "/ai/batch/jobs", _batch_submit, needs_redis=True),
+        ]
+    }
+
+
+# ============================================================================
+# Load Generation
+# ============================================================================
+
+async def run_scenario(
+    client,
+    scenario: Scenario,
+    requests: int,
+    concurrency: int,
+    repeat_ratio: float,
+    seed: int,
+) -> ScenarioResult:
+    """Send `requests` requests with at most `concurrency` in flight."""
+    rng = random.Random(f"{seed}-{scenario.name}")
+    run_id = uuid.uuid4().hex[:8]
+    payloads: List[Optional[dict]] = []
+    for index in range(requests):
+        if payloads and rng.random() < repeat_ratio:
+            payloads.append(rng.choice(payloads))
+        else:
+            payloads.append(scenario.payload(rng, run_id, index))
+
+    result = ScenarioResult(name=scenario.name)
+    queue: asyncio.Queue = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+
+    async def worker() -> None:
+        while not queue.empty():
+            payload = queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.request(scenario.method, scenario.path, json=payload)
+            result.latencies.append(time.perf_counter() - start)
+            result.statuses[response.status_code] += 1
+            if response.status_code == 200 and response.json().get("cached"):
+                result.cached += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.duration = time.perf_counter() - started
+    return result
+
+
+async def run(args) -> dict:
+    import httpx
+
+    from fake_providers import DEFAULT_PROFILES, install_fake_providers
+
+    profiles = DEFAULT_PROFILES
+    if args.error_rate is not None:
+        for profile in profiles.values():
+            profile.error_rate = args.error_rate
+    install_fake_providers(profiles, time_scale=args.time_scale)
+
+    import cache as cache_module
+    import main
+
+    if args.redis == "fake":
+        import fakeredis.aioredis
+
+        cache_module._cache = cache_module.AICache()
+        cache_module._cache._client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+
+    dimensions = profiles["openai"].embedding_dimensions
+    scenarios = build_scenarios(dimensions, args.candidates)
+    selected = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+
+    report = {}
+    async with main.lifespan(main.app):
+        redis_connected = (await cache_module.get_cache())._client is not None
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=120) as client:
+            for name in selected:
+                scenario = scenarios[name]
+                if scenario.needs_redis and not redis_connected:
+                    print(f"skipping {name}: requires Redis", file=sys.stderr)
+                    continue
+                result = await run_scenario(
+                    client, scenario, args.requests, args.concurrency, args.repeat_ratio, args.seed
+                )
+                report[name] = result.summary(args.concurrency)
+                print(f"finished {name} in {result.duration:.1f}s", file=sys.stderr)
+    return report
+
+
+# ============================================================================
+# Results & Regression Check
+# ============================================================================
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=SERVICE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Regressions of p95 latency or throughput beyond the tolerance."""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        p95, base_p95 = current["latency_ms"]["p95"], previous["latency_ms"]["p95"]
+        if p95 > base_p95 * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base_p95:.1f}ms -> {p95:.1f}ms")
+        rps, base_rps = current["throughput_rps"], previous["throughput_rps"]
+        if rps < base_rps * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base_rps:.1f} -> {rps:.1f} req/s")
+        if current["error_rate"] > previous["error_rate"] + 0.05:
+            regressions.append(f"{name}: error rate {previous['error_rate']:.1%} -> {current['error_rate']:.1%}")
+    return regressions
+
+
+def print_table(scenarios: dict) -> None:
+    print(f"{'scenario':<16}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}{'cached':>9}")
+    for name, stats in scenarios.items():
+        latency = stats["latency_ms"]
+        print(
+            f"{name:<16}{stats['throughput_rps']:>9.1f}{latency['p50']:>10.1f}{latency['p95']:>10.1f}"
+            f"{latency['p99']:>10.1f}{stats['error_rate']:>9.1%}{stats['cache_hit_rate']:>9.1%}"
+        )
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Load test the AI service against fake providers")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20, help="Requests in flight")
+    parser.add_argument(
+        "--scenarios",
+        default="health,job_draft,cover_letter,embed,semantic_search,batch_submit",
+        help="Comma-separated scenarios to run",
+    )
+    parser.add_argument("--redis", default="fake", help="fake, none or a Redis URL")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Multiplier for simulated provider delays")
+    parser.add_argument("--error-rate", type=float, default=None, help="Override every provider's error rate")
+    parser.add_argument("--repeat-ratio", type=float, default=0.3, help="Share of requests repeating a payload")
+    parser.add_argument("--candidates", type=int, default=200, help="Embeddings per semantic search request")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--save", default=os.path.join(RESULTS_DIR, "load_test_latest.json"))
+    parser.add_argument("--baseline", default=None, help="Results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args(argv)
+
+    # Settings are read at import time, so configure before importing the app
+    os.environ["RATE_LIMIT_ENABLED"] = "false"
+    # The client shares the server's event loop, so its own work shows up
+    # as loop lag; shedding would turn CPU-heavy scenarios into 503s
+    os.environ["LOAD_SHEDDING_ENABLED"] = "false"
+    os.environ["BATCH_WORKERS_ENABLED"] = "false"
+    if args.redis == "none":
+        os.environ["REDIS_URL"] = "redis://127.0.0.1:1/0"
+    elif args.redis != "fake":
+        os.environ["REDIS_URL"] = args.redis
+    sys.path.insert(0, SERVICE_DIR)
+    sys.path.insert(0, BENCHMARKS_DIR)
+
+    scenarios = asyncio.run(run(args))
+    results = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            key: getattr(args, key)
+            for key in ("requests", "concurrency", "redis", "time_scale", "error_rate", "repeat_ratio", "seed")
+        },
+        "scenarios": scenarios,
+    }
+
+    print_table(scenarios)
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"saved {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != results["config"]:
+            print(f"warning: baseline was run with {baseline.get('config')}", file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,200 @@
+"""
+Carphatian AI Microservice - Local Embedding Benchmark
+
+Latency and retrieval quality of the local hashing embedder, against the
+remote embedding model when an OpenAI key is configured.
+
+Quality is measured on a small labelled set of marketplace searches:
+each query has one relevant document (a job post or freelancer profile)
+among all documents. Queries paraphrase their document, so pure keyword
+overlap is not enough. Reported per model:
+
+    recall@1, recall@5, MRR     retrieval quality over the labelled set
+    latency p50/p95             per text, short (query) and long (document)
+
+Usage:
+    python benchmarks/local_embedding_bench.py [--dims 256,384,768]
+        [--remote] [--save results/local_embedding.json]
+
+Built by Carphatian
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+# (query, relevant document)
+EVAL_SET = [
+    ("react developer for online shop", "Looking for a frontend engineer experienced with React and Next.js to build the storefront of our e-commerce website, including cart and checkout."),
+    ("logo design for coffee brand", "Our new cafe needs a visual identity: logo, color palette and packaging design for our roasted coffee bags."),
+    ("fix wordpress site speed", "Our WordPress blog loads slowly. We need someone to optimize page speed, caching, image compression and plugins."),
+    ("python scraper for real estate listings", "Build a Python script that collects property listings (price, size, location) from several real estate portals every day."),
+    ("translate app from english to romanian", "We need a native Romanian translator to localize the strings of our mobile application from English."),
+    ("ios app developer swift", "Hiring an iPhone developer to build a native Swift app for booking fitness classes with Apple Pay."),
+    ("seo audit for dental clinic website", "Dental practice looking for a search engine optimization expert to audit our site and improve local Google rankings."),
+    ("video editing youtube channel", "Editor wanted for weekly YouTube videos: cutting, color grading, subtitles and thumbnails for a cooking channel."),
+    ("data analyst excel dashboards", "Need a spreadsheet expert to turn our sales data into Excel pivot tables and interactive dashboards for management."),
+    ("aws kubernetes devops engineer", "DevOps specialist to migrate our services to Amazon EKS, set up Helm charts, CI/CD pipelines and monitoring."),
+    ("copywriter for saas landing page", "Write persuasive marketing copy for the landing page of our B2B software product, including headlines and calls to action."),
+    ("machine learning model for churn prediction", "Data scientist to train a classifier predicting which subscribers will cancel, using our customer history in PostgreSQL."),
+    ("shopify store setup", "Set up a Shopify shop for our handmade jewelry: theme customization, product import, payments and shipping rules."),
+    ("unity game developer 2d platformer", "Indie studio seeks a Unity programmer to implement the player controller and levels of a side-scrolling platform game."),
+    ("accountant for small business taxes", "Freelance bookkeeper needed to prepare quarterly tax filings and reconcile accounts for a small retail company."),
+    ("illustrator for children's book", "Author looking for an artist to create 20 colorful illustrations for a picture book for kids aged 3 to 6."),
+    ("voice over for explainer video", "Seeking a narrator with a warm American accent to record a two-minute voiceover for our animated product video."),
+    ("django rest api backend", "Backend developer to build REST endpoints with Django REST Framework, authentication and PostgreSQL models for our app."),
+    ("social media manager instagram", "Manage our brand's Instagram and TikTok accounts: content calendar, posting, engagement and monthly reports."),
+    ("ux designer figma prototype", "Product designer to create wireframes and a clickable Figma prototype for a banking app onboarding flow."),
+    ("flutter cross platform mobile app", "Build an Android and iOS app from one codebase with Flutter for a food delivery startup, with maps and push notifications."),
+    ("legal contract review gdpr", "Lawyer to review our privacy policy and data processing agreements for compliance with European data protection law."),
+    ("3d product rendering furniture", "Create photorealistic 3D renders of our sofas and chairs for the online catalog, using Blender or 3ds Max."),
+    ("email marketing automation mailchimp", "Set up automated newsletter campaigns and customer journeys in Mailchimp, including segmentation and A/B tests."),
+    ("blockchain smart contract solidity", "Developer to write and audit Ethereum smart contracts in Solidity for an NFT minting platform."),
+    ("virtual assistant data entry", "Remote assistant to enter supplier invoices into our ERP system and keep the product database up to date."),
+    ("vue js dashboard charts", "Frontend developer to build an admin panel with Vue 3, charts of key metrics and tables with filtering."),
+    ("technical writer api documentation", "Write developer documentation for our public REST API: guides, reference pages and code samples."),
+    ("penetration test web application", "Security expert to perform an ethical hacking assessment of our web platform and report vulnerabilities."),
+    ("chatbot with openai for customer support", "Integrate a GPT-based assistant into our help center that answers customer questions from our knowledge base."),
+]
+
+
+# ============================================================================
+# Metrics
+# ============================================================================
+
+def retrieval_quality(query_vectors: np.ndarray, doc_vectors: np.ndarray) -> dict:
+    """recall@1, recall@5 and MRR when query i's relevant document is document i."""
+    queries = query_vectors / np.maximum(np.linalg.norm(query_vectors, axis=1, keepdims=True), 1e-12)
+    docs = doc_vectors / np.maximum(np.linalg.norm(doc_vectors, axis=1, keepdims=True), 1e-12)
+    scores = queries @ docs.T
+    # Rank of the relevant document (1 = first)
+    ranks = (scores > scores[np.arange(len(scores)), np.arange(len(scores))][:, None]).sum(axis=1) + 1
+    return {
+        "recall@1": round(float(np.mean(ranks <= 1)), 3),
+        "recall@5": round(float(np.mean(ranks <= 5)), 3),
+        "mrr": round(float(np.mean(1 / ranks)), 3),
+    }
+
+
+def latency(embed: Callable[[str], object], texts: List[str], repeat: int = 20) -> dict:
+    timings = []
+    for _ in range(repeat):
+        for text in texts:
+            start = time.perf_counter()
+            embed(text)
+            timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": round(float(np.percentile(timings, 50)), 3),
+        "p95_ms": round(float(np.percentile(timings, 95)), 3),
+    }
+
+
+# ============================================================================
+# Models
+# ============================================================================
+
+def bench_local(dims: int, buckets: int, seed: int) -> dict:
+    from providers.local_embedding_provider import HashingEmbedder
+
+    started = time.perf_counter()
+    embedder = HashingEmbedder(dims, buckets, seed)
+    init_ms = (time.perf_counter() - started) * 1000
+
+    queries = [query for query, _ in EVAL_SET]
+    docs = [doc for _, doc in EVAL_SET]
+    long_text = " ".join(docs)[:8000]
+    return {
+        "model": embedder.model_name,
+        "init_ms": round(init_ms, 1),
+        "memory_mb": round(embedder.projection.nbytes / 1e6, 1),
+        **retrieval_quality(
+            np.array([embedder.embed(text) for text in queries]),
+            np.array([embedder.embed(text) for text in docs]),
+        ),
+        "query_latency": latency(embedder.embed, queries),
+        "document_latency": latency(embedder.embed, docs),
+        "8k_chars_latency": latency(embedder.embed, [long_text], repeat=20),
+    }
+
+
+async def bench_remote() -> dict:
+    from providers.base import EmbeddingRequest
+    from providers.openai_provider import OpenAIProvider
+
+    provider = OpenAIProvider()
+    timings = []
+
+    async def embed(text: str) -> List[float]:
+        start = time.perf_counter()
+        response = await provider.embed(EmbeddingRequest(text=text))
+        timings.append((time.perf_counter() - start) * 1000)
+        return response.embedding
+
+    queries = [await embed(query) for query, _ in EVAL_SET]
+    docs = [await embed(doc) for _, doc in EVAL_SET]
+    return {
+        "model": provider.embedding_model,
+        **retrieval_quality(np.array(queries), np.array(docs)),
+        "latency": {
+            "p50_ms": round(float(np.percentile(timings, 50)), 1),
+            "p95_ms": round(float(np.percentile(timings, 95)), 1),
+        },
+    }
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Local embedding latency and quality benchmark")
+    parser.add_argument("--dims", default="256,384,768")
+    parser.add_argument("--buckets", type=int, default=32768)
+    parser.add_argument("--seed", type=int, default=1337)
+    parser.add_argument("--remote", action="store_true", help="Also benchmark the OpenAI model (needs OPENAI_API_KEY)")
+    parser.add_argument("--save", default=os.path.join(RESULTS_DIR, "local_embedding_latest.json"))
+    args = parser.parse_args(argv)
+
+    results: Dict[str, dict] = {}
+    for dims in [int(value) for value in args.dims.split(",")]:
+        results[f"local_{dims}"] = bench_local(dims, args.buckets, args.seed)
+    if args.remote:
+        if not os.environ.get("OPENAI_API_KEY"):
+            print("skipping remote: OPENAI_API_KEY is not set", file=sys.stderr)
+        else:
+            results["remote"] = asyncio.run(bench_remote())
+
+    print(f"{'model':<14}{'R@1':>7}{'R@5':>7}{'MRR':>7}{'query p50':>12}{'doc p50':>10}{'8k p50':>10}")
+    for name, row in results.items():
+        query_p50 = row.get("query_latency", row.get("latency"))["p50_ms"]
+        doc_p50 = row.get("document_latency", row.get("latency"))["p50_ms"]
+        long_p50 = row.get("8k_chars_latency", {}).get("p50_ms", float("nan"))
+        print(
+            f"{name:<14}{row['recall@1']:>7.2f}{row['recall@5']:>7.2f}{row['mrr']:>7.2f}"
+            f"{query_p50:>10.2f}ms{doc_p50:>8.2f}ms{long_p50:>8.2f}ms"
+        )
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump({
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "platform": platform.platform(),
+                "eval_pairs": len(EVAL_SET),
+                "results": results,
+            }, f, indent=2)
+        print(f"saved {args.save}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
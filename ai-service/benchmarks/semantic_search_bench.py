@@ -0,0 +1,294 @@
+"""
+Carphatian AI Microservice - Semantic Search Microbenchmarks
+
+Where /ai/semantic-search spends its time as the corpus grows.
+
+For synthetic corpora of N vectors at D dimensions this measures:
+
+    end-to-end stages   JSON decode, pydantic validation, scoring, top-k
+                        and response encoding, as the endpoint does them
+                        (encoding both via pydantic and via fast_response)
+    pure scoring        each scoring engine on data already in memory
+
+Engines:
+    loop                the endpoint's current per-vector NumPy loop
+    numpy_matrix        one matrix product over the request's lists
+                        (includes list -> array conversion)
+    numpy_prenormalized matrix product over a stored, pre-normalized
+                        float32 matrix (a server-side index)
+    faiss_flat          exact inner-product search with faiss, if installed
+
+Combinations whose data would not fit the memory budget are reported as
+skipped: request bodies cost ~40 bytes per float as JSON plus Python
+lists, stored float32 matrices 4 bytes per float.
+
+Usage:
+    python benchmarks/semantic_search_bench.py [--sizes 1000,10000,100000,1000000]
+        [--dims 256,768,1536,3072] [--engines loop,numpy_matrix,...]
+        [--max-memory-gb 1.5] [--save results/semantic_search.json]
+
+Built by Carphatian
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+# Approximate bytes per float for each representation
+LIST_BYTES_PER_FLOAT = 40  # JSON text + Python float objects + list slots
+ARRAY_BYTES_PER_FLOAT = 4
+
+TOP_K = 10
+
+
+# ============================================================================
+# Engines
+# ============================================================================
+
+def score_loop(query: List[float], embeddings: List[List[float]]) -> List[tuple]:
+    """The endpoint's current implementation: one NumPy call per vector."""
+    query_embedding = np.array(query)
+    results = []
+    for i, embedding in enumerate(embeddings):
+        embedding_array = np.array(embedding)
+        dot_product = np.dot(query_embedding, embedding_array)
+        norm_a = np.linalg.norm(query_embedding)
+        norm_b = np.linalg.norm(embedding_array)
+        similarity = dot_product / (norm_a * norm_b) if norm_a > 0 and norm_b > 0 else 0.0
+        results.append((i, float(similarity)))
+    results.sort(key=lambda x: x[1], reverse=True)
+    return results[:TOP_K]
+
+
+def _top_k(scores: np.ndarray, k: int) -> List[tuple]:
+    k = min(k, len(scores))
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    order = candidates[np.argsort(-scores[candidates])]
+    return [(int(i), float(scores[i])) for i in order]
+
+
+def score_matrix(query: List[float], embeddings: List[List[float]]) -> List[tuple]:
+    """Whole-corpus cosine similarity as one matrix product."""
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    q = np.asarray(query, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(q)
+    scores = np.divide(matrix @ q, norms, out=np.zeros(len(matrix), dtype=np.float32), where=norms > 0)
+    return _top_k(scores, TOP_K)
+
+
+def score_prenormalized(query: np.ndarray, matrix: np.ndarray) -> List[tuple]:
+    """Inner product over a stored matrix of unit vectors."""
+    q = query / np.linalg.norm(query)
+    return _top_k(matrix @ q, TOP_K)
+
+
+def make_faiss_engine() -> Optional[Callable]:
+    try:
+        import faiss
+    except ImportError:
+        return None
+
+    indexes: Dict[int, object] = {}
+
+    def search(query: np.ndarray, matrix: np.ndarray) -> List[tuple]:
+        index = indexes.get(id(matrix))
+        if index is None:
+            index = faiss.IndexFlatIP(matrix.shape[1])
+            index.add(matrix)
+            indexes.clear()
+            indexes[id(matrix)] = index
+        q = (query / np.linalg.norm(query)).reshape(1, -1)
+        scores, ids = index.search(q, TOP_K)
+        return [(int(i), float(s)) for i, s in zip(ids[0], scores[0])]
+
+    return search
+
+
+# ============================================================================
+# Timing
+# ============================================================================
+
+def measure(fn: Callable[[], object], min_time: float = 0.3, max_runs: int = 50) -> dict:
+    """Median and min wall time (ms) over repeated runs."""
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < max_runs and (len(timings) < 3 or time.perf_counter() - started < min_time):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+        # One run is enough for very slow cases
+        if timings[-1] > 5000:
+            break
+    return {"median_ms": round(float(np.median(timings)), 3), "min_ms": round(min(timings), 3), "runs": len(timings)}
+
+
+def corpus(size: int, dims: int) -> np.ndarray:
+    """Unit-norm float32 vectors with some cluster structure."""
+    rng = np.random.default_rng(size * 7919 + dims)
+    centers = rng.standard_normal((64, dims), dtype=np.float32)
+    matrix = centers[rng.integers(0, 64, size)] + 0.5 * rng.standard_normal((size, dims), dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix
+
+
+def end_to_end(matrix: np.ndarray, query: np.ndarray) -> dict:
+    """Time each stage the endpoint performs on one request."""
+    from fastapi.encoders import jsonable_encoder
+
+    from main import SemanticSearchRequest, SemanticSearchResponse, SemanticSearchResult
+    from responses import fast_response
+
+    body = json.dumps({
+        "query": "benchmark query",
+        "embeddings": matrix.tolist(),
+        "top_k": TOP_K,
+    }).encode()
+    stages = {"body_mb": round(len(body) / 1e6, 2)}
+
+    stages["json_decode"] = measure(lambda: json.loads(body))
+    data = json.loads(body)
+    stages["validation"] = measure(lambda: SemanticSearchRequest.model_validate(data))
+    request = SemanticSearchRequest.model_validate(data)
+    del data, body
+    gc.collect()
+
+    query_list = query.tolist()
+    stages["scoring_loop"] = measure(lambda: score_loop(query_list, request.embeddings))
+    top = score_loop(query_list, request.embeddings)
+
+    def encode() -> bytes:
+        # Pydantic path: response model validation, jsonable_encoder, json.dumps
+        response = SemanticSearchResponse(
+            results=[SemanticSearchResult(index=i, score=s) for i, s in top],
+            query_embedding=query_list,
+        )
+        return json.dumps(jsonable_encoder(response)).encode()
+
+    stages["response_encode"] = measure(encode)
+
+    def encode_fast() -> bytes:
+        # The endpoint's path: unvalidated content, orjson, NumPy query vector
+        return fast_response(
+            SemanticSearchResponse,
+            results=[{"index": i, "score": s} for i, s in top],
+            query_embedding=query,
+        ).body
+
+    # Alternative to response_encode, so not part of the total
+    stages["response_encode_fast"] = measure(encode_fast)
+    stages["total_ms"] = round(sum(
+        stage["median_ms"] for name, stage in stages.items()
+        if isinstance(stage, dict) and name != "response_encode_fast"
+    ), 3)
+    return stages
+
+
+def run(sizes: List[int], dims_list: List[int], engines: List[str], max_bytes: float, stages: bool) -> List[dict]:
+    faiss_search = make_faiss_engine() if "faiss_flat" in engines else None
+    rows = []
+    for dims in dims_list:
+        for size in sizes:
+            floats = size * dims
+            row = {"size": size, "dims": dims, "engines": {}, "skipped": []}
+            if floats * ARRAY_BYTES_PER_FLOAT * 2 > max_bytes:
+                row["skipped"].append("all (stored matrix exceeds memory budget)")
+                rows.append(row)
+                print(f"skip n={size} d={dims}", file=sys.stderr)
+                continue
+
+            matrix = corpus(size, dims)
+            query = corpus(1, dims)[0] + 0.1
+            fits_lists = floats * LIST_BYTES_PER_FLOAT <= max_bytes
+
+            if "numpy_prenormalized" in engines:
+                row["engines"]["numpy_prenormalized"] = measure(lambda: score_prenormalized(query, matrix))
+            if "faiss_flat" in engines:
+                if faiss_search is None:
+                    row["skipped"].append("faiss_flat (faiss not installed)")
+                else:
+                    faiss_search(query, matrix)  # build the index outside the timing
+                    row["engines"]["faiss_flat"] = measure(lambda: faiss_search(query, matrix))
+
+            if fits_lists:
+                embeddings = matrix.tolist()
+                query_list = query.tolist()
+                if "numpy_matrix" in engines:
+                    row["engines"]["numpy_matrix"] = measure(lambda: score_matrix(query_list, embeddings))
+                if "loop" in engines:
+                    row["engines"]["loop"] = measure(lambda: score_loop(query_list, embeddings))
+                del embeddings
+                gc.collect()
+                if stages:
+                    row["end_to_end"] = end_to_end(matrix, query)
+            else:
+                row["skipped"].append("request-based engines and end-to-end (JSON body exceeds memory budget)")
+
+            del matrix
+            gc.collect()
+            rows.append(row)
+            print(f"done n={size} d={dims}", file=sys.stderr)
+    return rows
+
+
+def print_table(rows: List[dict], engines: List[str]) -> None:
+    header = f"{'n':>9}{'dims':>6}" + "".join(f"{name:>21}" for name in engines) + f"{'e2e total':>12}{'decode':>10}{'validate':>10}{'encode':>9}"
+    print(header)
+    for row in rows:
+        cells = [
+            f"{row['engines'][name]['median_ms']:>19.2f}ms" if name in row["engines"] else f"{'-':>21}"
+            for name in engines
+        ]
+        e2e = row.get("end_to_end")
+        tail = (
+            f"{e2e['total_ms']:>10.1f}ms{e2e['json_decode']['median_ms']:>8.1f}ms"
+            f"{e2e['validation']['median_ms']:>8.1f}ms{e2e['response_encode']['median_ms']:>7.2f}ms"
+            if e2e else f"{'-':>12}{'-':>10}{'-':>10}{'-':>9}"
+        )
+        print(f"{row['size']:>9}{row['dims']:>6}" + "".join(cells) + tail)
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Semantic search scaling benchmark")
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+    parser.add_argument("--dims", default="256,768,1536,3072")
+    parser.add_argument("--engines", default="loop,numpy_matrix,numpy_prenormalized,faiss_flat")
+    parser.add_argument("--max-memory-gb", type=float, default=1.5, help="Skip cases needing more memory")
+    parser.add_argument("--no-stages", action="store_true", help="Skip the end-to-end stage breakdown")
+    parser.add_argument("--save", default=os.path.join(RESULTS_DIR, "semantic_search_latest.json"))
+    args = parser.parse_args(argv)
+
+    sizes = [int(value) for value in args.sizes.split(",")]
+    dims = [int(value) for value in args.dims.split(",")]
+    engines = [name.strip() for name in args.engines.split(",")]
+
+    rows = run(sizes, dims, engines, args.max_memory_gb * 1e9, not args.no_stages)
+    print_table(rows, engines)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump({
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "platform": platform.platform(),
+                "max_memory_gb": args.max_memory_gb,
+                "results": rows,
+            }, f, indent=2)
+        print(f"saved {args.save}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
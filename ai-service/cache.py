@@ -3,53 +3,247 @@ Carphatian AI Microservice - Redis Cache
 
 Caching layer for AI responses to reduce API costs.
 
+Entries can carry tags (e.g. "category:web development", "tenant:acme").
+Each tag is a Redis set of the keys written with it, so everything for a
+tag is dropped in O(tagged keys) without scanning the keyspace. Bulk
+invalidation uses incremental SCAN and batched UNLINK (deleted in the
+background by Redis), never KEYS or one huge DEL.
+
+Connectivity: commands use a bounded connection pool (callers wait for a
+free connection instead of failing) and every cache command has a
+timeout. Blocking stream reads (batch event streams and workers) use a
+pool of their own, so they cannot starve cache commands. A failed or
+slow command only triggers a health ping on a dedicated connection; if
+the ping fails too (or a periodic ping does), the cache switches to a
+bounded in-process TTL cache and a background task reconnects with
+exponential backoff. An exhausted pool or one slow command is not an
+outage. Other modules see the outage as `_client is None` and use their
+own fallbacks.
+
 Built by Carphatian
 """
 
+import asyncio
 import json
 import hashlib
-from typing import Optional, Any
+import random
+import time
+import uuid
+from typing import AsyncIterator, Awaitable, Iterable, List, Optional, Sequence, Tuple, Any, TypeVar
 import redis.asyncio as redis
 import structlog
+from cachetools import TTLCache
 
 from config import get_settings
+from metrics import CACHE_REDIS_CONNECTED, CACHE_REQUESTS
+from tracing import span
 
 logger = structlog.get_logger()
 
+# Namespaces under ai: owned by other modules (batch jobs, usage ledger, duplicate index, clusters)
+NON_CACHE_PREFIXES = ("ai:batch:", "ai:usage:", "ai:dedup:", "ai:clusters:")
+
+# Errors meaning the connection is unusable (as opposed to a bad command)
+CONNECTION_ERRORS = (redis.ConnectionError, redis.TimeoutError, asyncio.TimeoutError, OSError)
+
+T = TypeVar("T")
+
 
 class AICache:
     """
     Redis-based cache for AI responses.
     
     Caches identical prompts to avoid redundant API calls.
-    Uses consistent hashing for cache keys.
+    Uses consistent hashing for cache keys. Falls back to a local
+    in-process cache while Redis is unavailable.
     """
     
     def __init__(self):
         settings = get_settings()
         self.redis_url = settings.redis_url
         self.ttl = settings.cache_ttl
+        self.scan_count = settings.cache_scan_count
+        self.unlink_batch = settings.cache_unlink_batch
+        self.batch_size = settings.cache_batch_size
+        self.command_timeout = settings.redis_command_timeout
         self._client: Optional[redis.Redis] = None
+        # Blocking stream reads of batch event viewers (XREAD with BLOCK)
+        self._streams: Optional[redis.Redis] = None
+        # Blocking reads of the batch workers (XREADGROUP with BLOCK), apart
+        # from the viewers so open event streams cannot starve the workers
+        self._worker_streams: Optional[redis.Redis] = None
+        # Health pings, on one connection outside the pools
+        self._probe: Optional[redis.Redis] = None
+        # Set after a connection error to ping without waiting for the interval
+        self._ping_now = asyncio.Event()
+        # Serialized responses by key, used only while Redis is down
+        self._local: TTLCache = TTLCache(maxsize=settings.cache_local_max_entries, ttl=self.ttl)
+        self._watcher: Optional[asyncio.Task] = None
+        # Closing of the clients dropped by _mark_down (kept referenced until done)
+        self._closing: Optional[asyncio.Future] = None
+        self._state_since = time.time()
+        self._reconnect_attempts = 0
+        self._last_error: Optional[str] = None
+    
+    # ------------------------------------------------------------------
+    # Connection management
+    # ------------------------------------------------------------------
     
     async def connect(self):
-        """Connect to Redis."""
-        try:
-            self._client = redis.from_url(
+        """Connect to Redis and keep reconnecting in the background if it is down."""
+        await self._open()
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+    
+    async def _open(self) -> bool:
+        settings = get_settings()
+        options = dict(
+            encoding="utf-8",
+            decode_responses=True,
+            socket_connect_timeout=settings.redis_connect_timeout,
+            socket_keepalive=True,
+        )
+        # from_pool: closing the client also closes its pool
+        client = redis.Redis.from_pool(
+            redis.BlockingConnectionPool.from_url(
+                self.redis_url,
+                max_connections=settings.redis_max_connections,
+                # Wait for a free connection up to the command timeout
+                timeout=self.command_timeout,
+                socket_timeout=settings.redis_socket_timeout,
+                **options,
+            )
+        )
+        streams = redis.Redis.from_pool(
+            redis.BlockingConnectionPool.from_url(
                 self.redis_url,
-                encoding="utf-8",
-                decode_responses=True
+                max_connections=settings.redis_stream_max_connections,
+                timeout=settings.redis_socket_timeout,
+                # Above the longest blocking read
+                socket_timeout=settings.redis_socket_timeout,
+                **options,
             )
-            await self._client.ping()
-            logger.info("redis_connected", url=self.redis_url)
+        )
+        # One connection per batch worker task
+        worker_streams = redis.Redis.from_pool(
+            redis.BlockingConnectionPool.from_url(
+                self.redis_url,
+                max_connections=max(1, settings.batch_worker_concurrency),
+                timeout=settings.redis_socket_timeout,
+                socket_timeout=settings.redis_socket_timeout,
+                **options,
+            )
+        )
+        probe = redis.Redis.from_url(
+            self.redis_url,
+            single_connection_client=True,
+            socket_timeout=settings.redis_connect_timeout,
+            **options,
+        )
+        try:
+            await asyncio.wait_for(probe.ping(), settings.redis_connect_timeout)
         except Exception as e:
+            self._last_error = str(e)
             logger.warning("redis_connection_failed", error=str(e))
-            self._client = None
+            await asyncio.gather(
+                *(c.aclose() for c in (client, streams, worker_streams, probe)), return_exceptions=True
+            )
+            return False
+        
+        self._client, self._streams, self._worker_streams, self._probe = client, streams, worker_streams, probe
+        self._state_since = time.time()
+        self._reconnect_attempts = 0
+        self._last_error = None
+        # Entries written while degraded may have missed invalidations
+        self._local.clear()
+        CACHE_REDIS_CONNECTED.set(1)
+        logger.info("redis_connected", url=self.redis_url)
+        return True
+    
+    def _mark_down(self, error: BaseException) -> None:
+        """Switch to the local cache after a failed health ping."""
+        clients = (self._client, self._streams, self._worker_streams, self._probe)
+        self._client = self._streams = self._worker_streams = self._probe = None
+        if clients[0] is None:
+            return
+        self._state_since = time.time()
+        self._last_error = str(error) or type(error).__name__
+        CACHE_REDIS_CONNECTED.set(0)
+        logger.warning("redis_connection_lost", error=self._last_error)
+        self._closing = asyncio.gather(*(c.aclose() for c in clients), return_exceptions=True)
+    
+    def _failed(self, error: BaseException) -> None:
+        """Have the watcher ping Redis now if a command failed on the connection."""
+        if isinstance(error, CONNECTION_ERRORS) and self._client is not None:
+            self._ping_now.set()
+    
+    async def _watch(self) -> None:
+        """Reconnect with backoff while down; ping while connected."""
+        settings = get_settings()
+        delay = settings.redis_reconnect_base_delay
+        while True:
+            if self._client is None:
+                # Jittered exponential backoff
+                await asyncio.sleep(random.uniform(delay / 2, delay))
+                self._reconnect_attempts += 1
+                if await self._open():
+                    delay = settings.redis_reconnect_base_delay
+                else:
+                    delay = min(delay * 2, settings.redis_reconnect_max_delay)
+                continue
+            
+            try:
+                await asyncio.wait_for(self._ping_now.wait(), settings.redis_health_check_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._ping_now.clear()
+            await self._check()
+    
+    async def _check(self) -> bool:
+        """Ping Redis on the probe connection; mark it down if that fails."""
+        client, probe = self._client, self._probe
+        if client is None:
+            return False
+        try:
+            await asyncio.wait_for(probe.ping(), get_settings().redis_connect_timeout)
+            return True
+        except Exception as e:
+            if self._client is client:
+                self._mark_down(e)
+            return False
+    
+    async def _run(self, command: Awaitable[T]) -> T:
+        """Await a Redis command with the command timeout."""
+        return await asyncio.wait_for(command, self.command_timeout)
+    
+    @property
+    def connected(self) -> bool:
+        return self._client is not None
+    
+    def state(self) -> dict:
+        """Current cache backend state (for /health)."""
+        return {
+            "backend": "redis" if self._client is not None else "local",
+            "redis_connected": self._client is not None,
+            "state_since": round(self._state_since, 3),
+            "reconnect_attempts": self._reconnect_attempts,
+            "last_error": self._last_error,
+            "local_entries": len(self._local),
+        }
     
     async def disconnect(self):
-        """Disconnect from Redis."""
-        if self._client:
-            await self._client.close()
-            self._client = None
+        """Stop reconnecting and disconnect from Redis."""
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+        clients = [c for c in (self._client, self._streams, self._worker_streams, self._probe) if c is not None]
+        self._client = self._streams = self._worker_streams = self._probe = None
+        await asyncio.gather(*(c.aclose() for c in clients), return_exceptions=True)
+    
+    # ------------------------------------------------------------------
+    # Cache operations
+    # ------------------------------------------------------------------
     
     def _generate_key(self, prefix: str, data: dict) -> str:
         """Generate a consistent cache key from data."""
@@ -58,6 +252,10 @@ class AICache:
         hash_value = hashlib.sha256(serialized.encode()).hexdigest()[:16]
         return f"ai:{prefix}:{hash_value}"
     
+    @staticmethod
+    def _tag_key(tag: str) -> str:
+        return f"ai:tag:{tag}"
+    
     async def get(self, prefix: str, data: dict) -> Optional[dict]:
         """
         Get cached response if available.
@@ -69,23 +267,32 @@ class AICache:
         Returns:
             Cached response dict or None
         """
-        if not self._client:
-            return None
-        
         key = self._generate_key(prefix, data)
+        client = self._client
         
         try:
-            cached = await self._client.get(key)
+            with span("cache.get", prefix=prefix):
+                cached = await self._run(client.get(key)) if client else self._local.get(key)
             if cached:
+                CACHE_REQUESTS.labels(prefix, "hit").inc()
                 logger.info("cache_hit", key=key)
                 return json.loads(cached)
+            CACHE_REQUESTS.labels(prefix, "miss").inc()
             logger.debug("cache_miss", key=key)
             return None
         except Exception as e:
+            self._failed(e)
+            CACHE_REQUESTS.labels(prefix, "error").inc()
             logger.warning("cache_get_error", error=str(e))
             return None
     
-    async def set(self, prefix: str, data: dict, response: dict) -> bool:
+    async def set(
+        self,
+        prefix: str,
+        data: dict,
+        response: dict,
+        tags: Iterable[str] = (),
+    ) -> bool:
         """
         Cache a response.
         
@@ -93,64 +300,239 @@ class AICache:
             prefix: Cache key prefix
             data: Request data to hash
             response: Response to cache
+            tags: Tags to index the entry under (see invalidate_tag)
         
         Returns:
             True if cached successfully
         """
-        if not self._client:
-            return False
-        
         key = self._generate_key(prefix, data)
+        client = self._client
+        if client is None:
+            self._local[key] = json.dumps(response)
+            return True
         
         try:
-            await self._client.setex(
-                key,
-                self.ttl,
-                json.dumps(response)
-            )
+            with span("cache.set", prefix=prefix):
+                async with client.pipeline(transaction=False) as pipe:
+                    pipe.setex(key, self.ttl, json.dumps(response))
+                    for tag in tags:
+                        # Tag sets outlive their newest entry by one TTL at most
+                        pipe.sadd(self._tag_key(tag), key)
+                        pipe.expire(self._tag_key(tag), self.ttl)
+                    await self._run(pipe.execute())
             logger.info("cache_set", key=key, ttl=self.ttl)
             return True
         except Exception as e:
+            self._failed(e)
             logger.warning("cache_set_error", error=str(e))
             return False
     
+    async def get_many(self, prefix: str, items: Sequence[dict]) -> List[Optional[dict]]:
+        """
+        Get cached responses for many requests with MGET.
+        
+        Keys are fetched in chunks of CACHE_BATCH_SIZE, one round-trip
+        each. A chunk that fails is returned as misses (and counted as
+        errors); the rest are still returned.
+        
+        Args:
+            prefix: Cache key prefix
+            items: Request data to hash, one per entry
+        
+        Returns:
+            Cached response or None for each item, in order
+        """
+        results: List[Optional[dict]] = [None] * len(items)
+        if not items:
+            return results
+        
+        keys = [self._generate_key(prefix, data) for data in items]
+        # Keys of chunks that were actually read (failed chunks count as errors only)
+        looked_up = 0
+        for start in range(0, len(keys), self.batch_size):
+            chunk = keys[start:start + self.batch_size]
+            client = self._client
+            try:
+                with span("cache.get_many", prefix=prefix, keys=len(chunk)):
+                    if client is None:
+                        values = [self._local.get(key) for key in chunk]
+                    else:
+                        values = await self._run(client.mget(chunk))
+            except Exception as e:
+                self._failed(e)
+                CACHE_REQUESTS.labels(prefix, "error").inc(len(chunk))
+                logger.warning("cache_get_many_error", error=str(e), keys=len(chunk))
+                continue
+            looked_up += len(chunk)
+            for offset, value in enumerate(values):
+                if value is None:
+                    continue
+                try:
+                    results[start + offset] = json.loads(value)
+                except ValueError:
+                    logger.warning("cache_corrupt_entry", key=chunk[offset])
+        
+        hits = sum(result is not None for result in results)
+        CACHE_REQUESTS.labels(prefix, "hit").inc(hits)
+        CACHE_REQUESTS.labels(prefix, "miss").inc(looked_up - hits)
+        logger.info("cache_get_many", prefix=prefix, keys=len(keys), hits=hits, errors=len(keys) - looked_up)
+        return results
+    
+    async def set_many(
+        self,
+        prefix: str,
+        entries: Sequence[Tuple[dict, dict]],
+        tags: Iterable[str] = (),
+    ) -> int:
+        """
+        Cache many responses with pipelined SETEX.
+        
+        Each chunk of CACHE_BATCH_SIZE entries is one round-trip. Failed
+        commands or chunks are logged and skipped.
+        
+        Args:
+            prefix: Cache key prefix
+            entries: (request data, response) pairs
+            tags: Tags to index every entry under
+        
+        Returns:
+            Number of entries cached
+        """
+        if not entries:
+            return 0
+        
+        tags = list(tags)
+        stored = 0
+        for start in range(0, len(entries), self.batch_size):
+            chunk = entries[start:start + self.batch_size]
+            keys = [self._generate_key(prefix, data) for data, _ in chunk]
+            client = self._client
+            if client is None:
+                for key, (_, response) in zip(keys, chunk):
+                    self._local[key] = json.dumps(response)
+                stored += len(chunk)
+                continue
+            try:
+                with span("cache.set_many", prefix=prefix, keys=len(chunk)):
+                    async with client.pipeline(transaction=False) as pipe:
+                        for key, (_, response) in zip(keys, chunk):
+                            pipe.setex(key, self.ttl, json.dumps(response))
+                        for tag in tags:
+                            pipe.sadd(self._tag_key(tag), *keys)
+                            pipe.expire(self._tag_key(tag), self.ttl)
+                        replies = await self._run(pipe.execute(raise_on_error=False))
+            except Exception as e:
+                self._failed(e)
+                logger.warning("cache_set_many_error", error=str(e), keys=len(chunk))
+                continue
+            failed = [reply for reply in replies[:len(chunk)] if isinstance(reply, Exception)]
+            if failed:
+                logger.warning("cache_set_many_error", error=str(failed[0]), failed=len(failed))
+            stored += len(chunk) - len(failed)
+        
+        logger.info("cache_set_many", prefix=prefix, keys=len(entries), stored=stored, ttl=self.ttl)
+        return stored
+    
     async def invalidate(self, prefix: str, data: dict) -> bool:
         """Invalidate a cached entry."""
-        if not self._client:
-            return False
-        
         key = self._generate_key(prefix, data)
+        client = self._client
+        if client is None:
+            return self._local.pop(key, None) is not None
         
         try:
-            await self._client.delete(key)
+            await self._run(client.delete(key))
             logger.info("cache_invalidated", key=key)
             return True
         except Exception as e:
+            self._failed(e)
             logger.warning("cache_invalidate_error", error=str(e))
             return False
     
+    async def _unlink_batches(self, client: redis.Redis, keys: AsyncIterator[str]) -> int:
+        """UNLINK keys in batches as they are produced; returns the number removed."""
+        count = 0
+        batch: List[str] = []
+        async for key in keys:
+            batch.append(key)
+            if len(batch) >= self.unlink_batch:
+                count += await self._run(client.unlink(*batch))
+                batch = []
+        if batch:
+            count += await self._run(client.unlink(*batch))
+        return count
+    
+    async def invalidate_tag(self, tag: str) -> int:
+        """
+        Remove every entry cached with a tag.
+        
+        The tag set is renamed first, so entries written during the
+        invalidation start a fresh set instead of being missed.
+        
+        Args:
+            tag: Tag given to set()
+        
+        Returns:
+            Number of entries removed (expired entries are not counted)
+        """
+        client = self._client
+        if client is None:
+            # The local cache keeps no tag index: drop everything
+            count = len(self._local)
+            self._local.clear()
+            return count
+        
+        draining = f"{self._tag_key(tag)}:draining:{uuid.uuid4().hex}"
+        try:
+            try:
+                await self._run(client.rename(self._tag_key(tag), draining))
+            except redis.ResponseError:
+                # No such tag
+                return 0
+            count = await self._unlink_batches(
+                client, client.sscan_iter(draining, count=self.scan_count)
+            )
+            await self._run(client.unlink(draining))
+            logger.info("cache_tag_invalidated", tag=tag, count=count)
+            return count
+        except Exception as e:
+            self._failed(e)
+            logger.warning("cache_invalidate_error", tag=tag, error=str(e))
+            return 0
+    
     async def clear_all(self, prefix: Optional[str] = None) -> int:
         """
         Clear all cached entries.
         
+        Walks the keyspace with SCAN, so Redis keeps serving other
+        clients between batches. Batch job, usage, duplicate index
+        and cluster keys are kept.
+        
         Args:
             prefix: Optional prefix to filter keys
         
         Returns:
             Number of keys deleted
         """
-        if not self._client:
-            return 0
+        pattern = f"ai:{prefix}:*" if prefix else "ai:*"
+        client = self._client
+        if client is None:
+            keys = [key for key in list(self._local) if key.startswith(pattern[:-1])]
+            for key in keys:
+                self._local.pop(key, None)
+            return len(keys)
+        
+        async def cache_keys() -> AsyncIterator[str]:
+            async for key in client.scan_iter(match=pattern, count=self.scan_count):
+                if not key.startswith(NON_CACHE_PREFIXES):
+                    yield key
         
         try:
-            pattern = f"ai:{prefix}:*" if prefix else "ai:*"
-            keys = await self._client.keys(pattern)
-            if keys:
-                count = await self._client.delete(*keys)
-                logger.info("cache_cleared", count=count, pattern=pattern)
-                return count
-            return 0
+            count = await self._unlink_batches(client, cache_keys())
+            logger.info("cache_cleared", count=count, pattern=pattern)
+            return count
         except Exception as e:
+            self._failed(e)
             logger.warning("cache_clear_error", error=str(e))
             return 0
 
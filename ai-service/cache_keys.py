@@ -0,0 +1,166 @@
+"""
+Carphatian AI Microservice - Cache Key Canonicalization
+
+Builds the cache key data for each endpoint.
+
+Requests that differ only in presentation (casing, whitespace, Unicode
+forms, skill spelling or order) map to the same key, while every field
+that changes the prompt or the serving provider is part of the key.
+Keys carry the prompt template version, so editing a prompt invalidates
+its cached results.
+
+Built by Carphatian
+"""
+
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional
+
+
+# Bump when the corresponding prompt template in main.py changes
+PROMPT_VERSIONS: Dict[str, str] = {
+    "job_draft": "2",
+    "cover_letter": "2",
+}
+
+# Skill spellings mapped to one canonical name (keys are normalized)
+SKILL_ALIASES: Dict[str, str] = {
+    "reactjs": "react",
+    "react.js": "react",
+    "react js": "react",
+    "nodejs": "node.js",
+    "node": "node.js",
+    "node js": "node.js",
+    "nextjs": "next.js",
+    "next": "next.js",
+    "vuejs": "vue",
+    "vue.js": "vue",
+    "angularjs": "angular",
+    "js": "javascript",
+    "ecmascript": "javascript",
+    "ts": "typescript",
+    "py": "python",
+    "python3": "python",
+    "golang": "go",
+    "postgres": "postgresql",
+    "psql": "postgresql",
+    "mongo": "mongodb",
+    "k8s": "kubernetes",
+    "tailwind": "tailwindcss",
+    "tailwind css": "tailwindcss",
+    "c sharp": "c#",
+    "csharp": "c#",
+    "dotnet": ".net",
+    ".net core": ".net",
+    "amazon web services": "aws",
+    "gcp": "google cloud",
+    "ml": "machine learning",
+    "ai": "artificial intelligence",
+    "ui/ux": "ux/ui",
+    "ui ux": "ux/ui",
+    "ux ui": "ux/ui",
+}
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(value: Optional[str], casefold: bool = True) -> Optional[str]:
+    """Unicode-normalize (NFKC), collapse whitespace and optionally casefold."""
+    if value is None:
+        return None
+    value = _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", value)).strip()
+    return value.casefold() if casefold else value
+
+
+def canonical_skill(skill: str) -> str:
+    """Normalize one skill and resolve known aliases."""
+    normalized = normalize_text(skill)
+    return SKILL_ALIASES.get(normalized, normalized)
+
+
+def canonical_skills(skills: Iterable[str]) -> List[str]:
+    """Canonical, de-duplicated and sorted skill list."""
+    return sorted({canonical_skill(skill) for skill in skills if skill and skill.strip()})
+
+
+def job_draft_key(
+    title: str,
+    category: str,
+    skills: Iterable[str],
+    budget_min: Optional[int],
+    budget_max: Optional[int],
+    timeline: Optional[str],
+    additional_context: Optional[str],
+    provider: Optional[str],
+) -> dict:
+    """Cache key data for /ai/job-draft."""
+    return {
+        "type": "job_draft",
+        "v": PROMPT_VERSIONS["job_draft"],
+        "title": normalize_text(title),
+        "category": normalize_text(category),
+        "skills": canonical_skills(skills),
+        # The prompt only shows the minimum when a maximum is also set
+        "budget_min": budget_min if budget_min and budget_max else None,
+        "budget_max": budget_max or None,
+        "timeline": normalize_text(timeline) or None,
+        "additional_context": normalize_text(additional_context) or None,
+        "provider": provider,
+    }
+
+
+def cover_letter_key(
+    job_title: str,
+    job_description: str,
+    freelancer_name: str,
+    freelancer_skills: Iterable[str],
+    freelancer_experience: Optional[str],
+    provider: Optional[str],
+) -> dict:
+    """Cache key data for /ai/cover-letter."""
+    return {
+        "type": "cover_letter",
+        "v": PROMPT_VERSIONS["cover_letter"],
+        "job_title": normalize_text(job_title),
+        "job_description": normalize_text(job_description),
+        # Names are written into the letter as given, so keep their casing
+        "freelancer_name": normalize_text(freelancer_name, casefold=False),
+        "skills": canonical_skills(freelancer_skills),
+        "experience": normalize_text(freelancer_experience) or None,
+        "provider": provider,
+    }
+
+
+def embedding_key(
+    text: str,
+    model: Optional[str],
+    provider: Optional[str] = None,
+    dimensions: Optional[int] = None,
+) -> dict:
+    """
+    Cache key data for /ai/embed.
+
+    Embeddings depend on the exact text, so only Unicode and whitespace
+    are normalized and the full text is keyed (not a prefix). The output
+    dimensions and a provider chosen for the collection are part of the
+    key (default routing keeps the original provider-less keys).
+    """
+    key = {
+        "type": "embedding",
+        "text": normalize_text(text, casefold=False),
+        "model": model or "default",
+        "dimensions": dimensions,
+    }
+    if provider:
+        key["provider"] = provider
+    return key
+
+
+def cache_tags(category: Optional[str] = None, tenant: Optional[str] = None) -> List[str]:
+    """Invalidation tags for a cache entry (see AICache.invalidate_tag)."""
+    tags = []
+    if category:
+        tags.append(f"category:{normalize_text(category)}")
+    if tenant:
+        tags.append(f"tenant:{tenant}")
+    return tags
@@ -0,0 +1,175 @@
+"""
+Carphatian AI Microservice - Document Chunking
+
+Splits long texts into token-bounded, overlapping chunks for embedding,
+and pools chunk vectors into one document vector.
+
+Text is split into sentences (and words, for sentences longer than a
+chunk, and token windows, for words longer than a chunk), which are
+packed into chunks of at most `max_tokens` tokens.
+A chunk ends at the first paragraph break once it is at least half full,
+so chunk boundaries follow the document's paragraphs: editing a paragraph
+changes the chunks covering it (and the overlap of the next one) while
+the other chunks keep the same text, and therefore the same cache keys.
+
+Each chunk after the first starts with the last sentences of the previous
+chunk, up to `overlap_tokens` tokens, so text near a boundary is embedded
+with its context.
+
+Built by Carphatian
+"""
+
+import re
+from dataclasses import dataclass
+from typing import List, Sequence
+
+import numpy as np
+
+from prompt_budget import get_prompt_budget
+
+# Sentence ends (followed by whitespace) and paragraph breaks
+_SENTENCE_RE = re.compile(r"\S.*?(?:[.!?](?=\s)|(?=\n\s*\n)|$)", re.DOTALL)
+_PARAGRAPH_BREAK_RE = re.compile(r"\s*\n\s*\n")
+_WORD_RE = re.compile(r"\S+")
+_WORD_CHAR_RE = re.compile(r"\w")
+
+
+@dataclass
+class Chunk:
+    """A span of the document text."""
+    index: int
+    start: int  # character offsets in the document
+    end: int
+    tokens: int
+    text: str
+
+
+@dataclass
+class _Piece:
+    start: int
+    end: int
+    tokens: int
+    paragraph_end: bool  # followed by a paragraph break (or the end of the text)
+
+
+def _pieces(text: str, max_tokens: int, model: str) -> List[_Piece]:
+    """
+    Sentences of the text, with over-long sentences split into word runs
+    (and words longer than a chunk split on token boundaries).
+
+    Sentences without word characters (rules, "...", "!!!") are skipped,
+    so a text made only of them has no pieces.
+    """
+    budget = get_prompt_budget(model)
+    pieces: List[_Piece] = []
+    for match in _SENTENCE_RE.finditer(text):
+        start, end = match.start(), match.end()
+        sentence = text[start:end].rstrip()
+        end = start + len(sentence)
+        paragraph_end = end == len(text.rstrip()) or bool(_PARAGRAPH_BREAK_RE.match(text, end))
+        if not _WORD_CHAR_RE.search(sentence):
+            if paragraph_end and pieces:
+                pieces[-1].paragraph_end = True
+            continue
+        tokens = budget.count(sentence)
+        if tokens <= max_tokens:
+            pieces.append(_Piece(start, end, tokens, paragraph_end))
+            continue
+
+        # Runs of words that fit a chunk
+        run_start = run_end = None
+        run_tokens = 0
+        for word in _WORD_RE.finditer(sentence):
+            word_tokens = budget.count(" " + word.group())
+            if run_start is not None and run_tokens + word_tokens > max_tokens:
+                pieces.append(_Piece(start + run_start, start + run_end, run_tokens, False))
+                run_start = None
+                run_tokens = 0
+            if word_tokens > max_tokens:
+                # A URL, hash or encoded blob longer than a chunk: cut on token boundaries
+                offset = start + word.start()
+                for window_start, window_end in budget.windows(word.group(), max_tokens):
+                    window = word.group()[window_start:window_end]
+                    pieces.append(_Piece(offset + window_start, offset + window_end, budget.count(window), False))
+                continue
+            if run_start is None:
+                run_start = word.start()
+            run_end = word.end()
+            run_tokens += word_tokens
+        if run_start is not None:
+            pieces.append(_Piece(start + run_start, start + run_end, run_tokens, paragraph_end))
+        else:
+            pieces[-1].paragraph_end = paragraph_end
+    return pieces
+
+
+def chunk_text(text: str, max_tokens: int, overlap_tokens: int, model: str) -> List[Chunk]:
+    """
+    Split a text into overlapping chunks.
+
+    Args:
+        text: Document text
+        max_tokens: Maximum tokens per chunk (approximate: counted per sentence)
+        overlap_tokens: Tokens repeated from the previous chunk (at most half a chunk)
+        model: Embedding model whose tokenizer counts tokens
+
+    Returns:
+        Chunks in document order (one chunk for short texts, none for
+        texts without word characters)
+    """
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    pieces = _pieces(text, max_tokens, model)
+
+    groups: List[List[_Piece]] = []
+    current: List[_Piece] = []
+    current_tokens = 0
+    for piece in pieces:
+        if current and current_tokens + piece.tokens > max_tokens:
+            groups.append(current)
+            # Carry the last sentences into the next chunk
+            carried: List[_Piece] = []
+            carried_tokens = 0
+            for previous in reversed(current[1:]):
+                if carried_tokens + previous.tokens > overlap_tokens:
+                    break
+                carried.insert(0, previous)
+                carried_tokens += previous.tokens
+            while carried and carried_tokens + piece.tokens > max_tokens:
+                carried_tokens -= carried.pop(0).tokens
+            current, current_tokens = carried, carried_tokens
+        current.append(piece)
+        current_tokens += piece.tokens
+        if piece.paragraph_end and current_tokens >= max_tokens // 2:
+            groups.append(current)
+            current, current_tokens = [], 0
+    if current:
+        groups.append(current)
+
+    return [
+        Chunk(
+            index=index,
+            start=group[0].start,
+            end=group[-1].end,
+            tokens=sum(piece.tokens for piece in group),
+            text=text[group[0].start:group[-1].end],
+        )
+        for index, group in enumerate(groups)
+    ]
+
+
+def pool_embeddings(embeddings: Sequence[Sequence[float]], weights: Sequence[float], method: str = "mean") -> np.ndarray:
+    """
+    Pool chunk embeddings into one unit-length document embedding.
+
+    Args:
+        embeddings: Chunk embeddings (same model and dimensions)
+        weights: Chunk weights for "mean" (token counts, so short tail chunks count less)
+        method: "mean" (weighted average) or "max" (element-wise maximum)
+    """
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if method == "max":
+        pooled = matrix.max(axis=0)
+    else:
+        pooled = np.asarray(weights, dtype=np.float32) @ matrix
+    norm = np.linalg.norm(pooled)
+    return pooled / norm if norm > 0 else pooled
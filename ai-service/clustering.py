@@ -0,0 +1,544 @@
+"""
+Carphatian AI Microservice - Job Clustering
+
+Mini-batch k-means over job embeddings, for category and skill
+suggestions.
+
+Job embeddings (with the category and skills the client chose) are
+ingested in batches. The first CLUSTERING_INIT_POINTS jobs are buffered,
+seeded with k-means++ and refined with a few mini-batch epochs; after
+that every ingested batch updates the centroids incrementally (Sculley's
+mini-batch k-means: each centroid moves toward the mean of its new points
+with a learning rate of 1/points seen, floored at
+CLUSTERING_MIN_LEARNING_RATE so clusters keep following new postings).
+Vectors and centroids are unit length, so the nearest centroid is the
+one with the highest dot product (spherical k-means).
+
+Each cluster counts the categories and skills of the jobs assigned to it;
+its top skills label it. A new draft is embedded and compared with the
+few hundred centroids only, and the categories and skills of its nearest
+clusters are suggested, weighted by similarity.
+
+The model lives in Redis, so all workers share it and it survives
+restarts. Updates hold a Redis lock, extended while they run, and write
+the changed centroids, counts and label counts in one transaction that
+also bumps a version. Each worker keeps a copy of the model for
+suggestions, and reloads it when the version has changed (checked at
+most every CLUSTERING_REFRESH_INTERVAL seconds). CPU-heavy steps run in
+a thread on copies; the event loop only swaps the results in.
+
+Redis layout (prefix "ai:clusters:{k}"):
+    {prefix}:state           hash   model, dimensions, counts, version
+    {prefix}:centroids       hash   cluster -> centroid (base64 float32)
+    {prefix}:categories:{c}  hash   category -> jobs in cluster c
+    {prefix}:skills:{c}      hash   normalized skill -> jobs in cluster c
+    {prefix}:skill_names     hash   normalized skill -> display spelling
+    {prefix}:pending         list   jobs waiting for the first fit (JSON)
+    {prefix}:lock            lock of updates
+
+Built by Carphatian
+"""
+
+import asyncio
+import base64
+import json
+import time
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import structlog
+from redis.asyncio.lock import Lock
+from redis.exceptions import LockError
+
+from cache import CONNECTION_ERRORS, AICache, get_cache
+from config import get_settings
+
+logger = structlog.get_logger()
+
+
+class ClusterMismatch(ValueError):
+    """Vectors are from another embedding model than the clusters."""
+
+
+class ClustersUnavailable(RuntimeError):
+    """Raised when the clusters cannot be read or updated (Redis is down or busy)."""
+
+
+def _normalize(points: np.ndarray) -> np.ndarray:
+    return points / np.maximum(np.linalg.norm(points, axis=1, keepdims=True), 1e-12)
+
+
+def kmeans_plus_plus(points: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    """k-means++ seeding: each next centroid is drawn with probability proportional to its squared distance."""
+    centroids = np.empty((k, points.shape[1]), dtype=np.float32)
+    centroids[0] = points[rng.integers(len(points))]
+    # Squared Euclidean distance of unit vectors is 2 - 2 * cosine
+    distances = np.maximum(2 - 2 * points @ centroids[0], 0)
+    for i in range(1, k):
+        total = distances.sum()
+        index = rng.choice(len(points), p=distances / total) if total > 0 else rng.integers(len(points))
+        centroids[i] = points[index]
+        distances = np.minimum(distances, np.maximum(2 - 2 * points @ centroids[i], 0))
+    return centroids
+
+
+def assign(points: np.ndarray, centroids: np.ndarray, batch_size: int = 4096) -> Tuple[np.ndarray, np.ndarray]:
+    """Nearest centroid of each point and its cosine similarity."""
+    labels = np.empty(len(points), dtype=np.intp)
+    similarities = np.empty(len(points), dtype=np.float32)
+    for start in range(0, len(points), batch_size):
+        scores = points[start:start + batch_size] @ centroids.T
+        labels[start:start + batch_size] = scores.argmax(axis=1)
+        similarities[start:start + batch_size] = scores.max(axis=1)
+    return labels, similarities
+
+
+def minibatch_step(
+    centroids: np.ndarray,
+    counts: np.ndarray,
+    points: np.ndarray,
+    min_learning_rate: float,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    One mini-batch k-means update.
+
+    Returns:
+        (new centroids, new counts, labels of the points); inputs are not modified
+    """
+    labels, _ = assign(points, centroids)
+    batch_counts = np.bincount(labels, minlength=len(centroids))
+    sums = np.zeros_like(centroids)
+    np.add.at(sums, labels, points)
+
+    counts = counts + batch_counts
+    moved = np.flatnonzero(batch_counts)
+    # Per point the learning rate is 1 / points seen, so a batch of n moves a
+    # centroid n / count of the way to the batch mean (floored for drift)
+    rates = np.maximum(batch_counts[moved] / counts[moved], np.minimum(1.0, min_learning_rate * batch_counts[moved]))
+    means = sums[moved] / batch_counts[moved, None]
+    centroids = centroids.copy()
+    centroids[moved] += rates[:, None].astype(np.float32) * (means - centroids[moved])
+    centroids[moved] = _normalize(centroids[moved])
+    return centroids, counts, labels
+
+
+def _skill_key(skill: str) -> str:
+    return " ".join(skill.split()).casefold()
+
+
+def _encode(array: np.ndarray) -> str:
+    return base64.b64encode(np.ascontiguousarray(array).tobytes()).decode()
+
+
+def _decode(value: str, dtype) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(value), dtype=dtype).copy()
+
+
+# Label counts of a batch: per cluster, categories and normalized skills
+LabelCounts = Tuple[Dict[int, Counter], Dict[int, Counter], Dict[str, str]]
+
+
+def count_labels(clusters: np.ndarray, labels: Sequence[Tuple[Optional[str], Sequence[str]]]) -> LabelCounts:
+    """Categories and skills of jobs per assigned cluster, with the display spelling of skills."""
+    categories: Dict[int, Counter] = {}
+    skills: Dict[int, Counter] = {}
+    names: Dict[str, str] = {}
+    for cluster, (category, job_skills) in zip(clusters.tolist(), labels):
+        if category:
+            categories.setdefault(cluster, Counter())[category] += 1
+        for skill in job_skills:
+            key = _skill_key(skill)
+            if key:
+                names.setdefault(key, skill.strip())
+                skills.setdefault(cluster, Counter())[key] += 1
+    return categories, skills, names
+
+
+class JobClusters:
+    """
+    Clusters of job embeddings with their category and skill counts.
+
+    Args:
+        cache: Cache whose Redis client holds the model
+        prefix: Key prefix of the model
+        k: Number of clusters
+        init_points: Jobs buffered before the first fit (at least k)
+        batch_size: Mini-batch size
+        init_epochs: Mini-batch passes over the buffered jobs at the first fit
+        min_learning_rate: Lower bound of a centroid's learning rate per point
+        refresh_interval: Seconds between checks for updates by other workers
+        lock_timeout: Seconds an update may hold, or wait for, the lock
+        seed: Seed of the initialization
+    """
+
+    def __init__(
+        self,
+        cache: AICache,
+        prefix: str,
+        k: int,
+        init_points: int,
+        batch_size: int,
+        init_epochs: int,
+        min_learning_rate: float,
+        refresh_interval: float = 5.0,
+        lock_timeout: float = 30.0,
+        seed: int = 0,
+    ):
+        self.cache = cache
+        self.prefix = prefix
+        self.k = k
+        self.init_points = max(init_points, k)
+        self.batch_size = batch_size
+        self.init_epochs = init_epochs
+        self.min_learning_rate = min_learning_rate
+        self.refresh_interval = refresh_interval
+        self.lock_timeout = lock_timeout
+        self.seed = seed
+        self._state_key = f"{prefix}:state"
+        self._centroids_key = f"{prefix}:centroids"
+        self._skill_names_key = f"{prefix}:skill_names"
+        self._pending_key = f"{prefix}:pending"
+        # Local copy of the model, as of `version`
+        self.version: Optional[int] = None
+        self.model: Optional[str] = None
+        self.dimensions: Optional[int] = None
+        self.centroids: Optional[np.ndarray] = None
+        self.counts = np.zeros(k, dtype=np.int64)
+        self.categories: List[Counter] = [Counter() for _ in range(k)]
+        self.skills: List[Counter] = [Counter() for _ in range(k)]
+        # Display spelling of normalized skill names (first seen)
+        self._skill_names: Dict[str, str] = {}
+        # Jobs waiting for the first fit
+        self._pending = 0
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def jobs(self) -> int:
+        """Jobs ingested (including those waiting for the first fit)."""
+        return int(self.counts.sum()) + self._pending
+
+    def check_vectors(self, model: str, dimensions: int) -> None:
+        """
+        Raise ClusterMismatch if vectors of this model do not match the clusters.
+
+        The first ingested model and dimensions are kept, since vectors of
+        different models are not comparable.
+        """
+        if self.model is not None and (model, dimensions) != (self.model, self.dimensions):
+            raise ClusterMismatch(
+                f"Clusters use {self.model} ({self.dimensions} dims), not {model} ({dimensions} dims)"
+            )
+
+    def _client(self):
+        client = self.cache._client
+        if client is None:
+            raise ClustersUnavailable("Job clustering requires Redis")
+        return client
+
+    @contextmanager
+    def _connection(self) -> Iterator[None]:
+        """Report connection failures to the cache and surface them as ClustersUnavailable."""
+        try:
+            yield
+        except CONNECTION_ERRORS as e:
+            self.cache._failed(e)
+            raise ClustersUnavailable(f"Job clusters unavailable: {e}") from e
+        except LockError as e:
+            raise ClustersUnavailable(f"Job clusters are busy: {e}") from e
+
+    async def refresh(self, force: bool = False) -> None:
+        """
+        Reload the model if another worker has updated it.
+
+        Raises:
+            ClustersUnavailable: If Redis is unavailable
+        """
+        client = self._client()
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.refresh_interval:
+            return
+        with self._connection():
+            # A missing model (nothing ingested yet, or keys deleted) is version 0
+            version = int(await client.hget(self._state_key, "version") or 0)
+            self._checked_at = now
+            if version == self.version:
+                return
+            async with client.pipeline(transaction=True) as pipe:
+                pipe.hgetall(self._state_key)
+                pipe.hgetall(self._centroids_key)
+                pipe.hgetall(self._skill_names_key)
+                pipe.llen(self._pending_key)
+                for cluster in range(self.k):
+                    pipe.hgetall(f"{self.prefix}:categories:{cluster}")
+                    pipe.hgetall(f"{self.prefix}:skills:{cluster}")
+                state, centroids, skill_names, pending, *labels = await pipe.execute()
+        self.version = version
+        self.model = state.get("model")
+        self.dimensions = int(state["dimensions"]) if "dimensions" in state else None
+        self.counts = _decode(state["counts"], np.int64) if "counts" in state else np.zeros(self.k, dtype=np.int64)
+        self.centroids = None
+        if centroids:
+            self.centroids = np.stack([_decode(centroids[str(cluster)], np.float32) for cluster in range(self.k)])
+        self.categories = [Counter({name: int(count) for name, count in values.items()}) for values in labels[0::2]]
+        self.skills = [Counter({key: int(count) for key, count in values.items()}) for values in labels[1::2]]
+        self._skill_names = skill_names
+        self._pending = pending
+
+    async def add(
+        self,
+        vectors: Sequence[Sequence[float]],
+        model: str,
+        categories: Sequence[Optional[str]],
+        skills: Sequence[Sequence[str]],
+    ) -> None:
+        """
+        Ingest jobs: buffer them before the first fit, update the centroids after.
+
+        Raises:
+            ClusterMismatch: If the vectors are from another model than the clusters
+            ClustersUnavailable: If Redis is unavailable, or the lock was not acquired in time
+        """
+        points = _normalize(np.asarray(vectors, dtype=np.float32))
+        labels = list(zip(categories, skills))
+        client = self._client()
+        async with self._lock:
+            with self._connection():
+                async with self._update_lock(client) as lock:
+                    # Holding the lock, the local copy is the stored model
+                    await self.refresh(force=True)
+                    self.check_vectors(model, points.shape[1])
+                    if not self.ready:
+                        await self._buffer(client, lock, points, model, labels)
+                        if self._pending >= self.init_points:
+                            await self._initialize(client, lock)
+                    else:
+                        await self._update(client, lock, points, labels)
+
+    @asynccontextmanager
+    async def _update_lock(self, client) -> AsyncIterator[Lock]:
+        """
+        Hold the update lock, extending it while the update runs.
+
+        Writes call lock.reacquire() first, which fails (without writing)
+        if the lock was lost anyway.
+        """
+        lock = client.lock(f"{self.prefix}:lock", timeout=self.lock_timeout, blocking_timeout=self.lock_timeout)
+        if not await lock.acquire():
+            raise ClustersUnavailable("Job clusters are busy: the update lock was not acquired in time")
+
+        async def keep_alive() -> None:
+            while True:
+                await asyncio.sleep(self.lock_timeout / 3)
+                await lock.reacquire()
+
+        keeper = asyncio.create_task(keep_alive())
+        try:
+            yield lock
+        finally:
+            keeper.cancel()
+            await asyncio.gather(keeper, return_exceptions=True)
+            try:
+                await lock.release()
+            except LockError as e:
+                # Writes checked ownership; the update itself is applied
+                logger.warning("job_clusters_lock_lost", error=str(e))
+
+    async def _buffer(self, client, lock: Lock, points: np.ndarray, model: str, labels: list) -> None:
+        entries = [
+            json.dumps({"vector": _encode(point), "category": category, "skills": list(job_skills)})
+            for point, (category, job_skills) in zip(points, labels)
+        ]
+        await lock.reacquire()
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.rpush(self._pending_key, *entries)
+            pipe.hset(self._state_key, mapping={"model": model, "dimensions": points.shape[1]})
+            pipe.hincrby(self._state_key, "version", 1)
+            self._pending, _, self.version = await pipe.execute()
+        self.model, self.dimensions = model, points.shape[1]
+
+    async def _update(self, client, lock: Lock, points: np.ndarray, labels: list) -> None:
+        centroids, counts = self.centroids, self.counts
+        moved = set()
+        batch_labels: List[LabelCounts] = []
+        for start in range(0, len(points), self.batch_size):
+            centroids, counts, assigned = await asyncio.to_thread(
+                minibatch_step,
+                centroids,
+                counts,
+                points[start:start + self.batch_size],
+                self.min_learning_rate,
+            )
+            moved.update(assigned.tolist())
+            batch_labels.append(count_labels(assigned, labels[start:start + self.batch_size]))
+        await lock.reacquire()
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.hset(self._centroids_key, mapping={str(cluster): _encode(centroids[cluster]) for cluster in moved})
+            pipe.hset(self._state_key, "counts", _encode(counts))
+            for counted in batch_labels:
+                self._queue_labels(pipe, counted)
+            pipe.hincrby(self._state_key, "version", 1)
+            version = (await pipe.execute())[-1]
+        self.centroids, self.counts = centroids, counts
+        for counted in batch_labels:
+            self._apply_labels(counted)
+        self.version = version
+
+    async def _initialize(self, client, lock: Lock) -> None:
+        entries = [json.loads(entry) for entry in await client.lrange(self._pending_key, 0, -1)]
+        points = np.stack([_decode(entry["vector"], np.float32) for entry in entries])
+        centroids, assigned = await asyncio.to_thread(self._fit, points)
+        counts = np.bincount(assigned, minlength=self.k).astype(np.int64)
+        counted = count_labels(assigned, [(entry["category"], entry["skills"]) for entry in entries])
+        await lock.reacquire()
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.delete(self._pending_key)
+            pipe.hset(self._centroids_key, mapping={str(cluster): _encode(centroids[cluster]) for cluster in range(self.k)})
+            pipe.hset(self._state_key, "counts", _encode(counts))
+            self._queue_labels(pipe, counted)
+            pipe.hincrby(self._state_key, "version", 1)
+            version = (await pipe.execute())[-1]
+        self.centroids, self.counts, self._pending = centroids, counts, 0
+        self._apply_labels(counted)
+        self.version = version
+        logger.info(
+            "job_clusters_initialized",
+            k=self.k,
+            jobs=len(points),
+            empty_clusters=int((self.counts == 0).sum()),
+        )
+
+    def _fit(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """k-means++ seeding and mini-batch epochs over the buffered jobs (runs in a thread)."""
+        rng = np.random.default_rng(self.seed)
+        centroids = kmeans_plus_plus(points, self.k, rng)
+        counts = np.zeros(self.k, dtype=np.int64)
+        for _ in range(self.init_epochs):
+            order = rng.permutation(len(points))
+            for start in range(0, len(points), self.batch_size):
+                centroids, counts, _ = minibatch_step(
+                    centroids, counts, points[order[start:start + self.batch_size]], self.min_learning_rate
+                )
+        labels, _ = assign(points, centroids)
+        return centroids, labels
+
+    def _queue_labels(self, pipe, counted: LabelCounts) -> None:
+        categories, skills, names = counted
+        for cluster, counter in categories.items():
+            for name, count in counter.items():
+                pipe.hincrby(f"{self.prefix}:categories:{cluster}", name, count)
+        for cluster, counter in skills.items():
+            for key, count in counter.items():
+                pipe.hincrby(f"{self.prefix}:skills:{cluster}", key, count)
+        for key, name in names.items():
+            pipe.hsetnx(self._skill_names_key, key, name)
+
+    def _apply_labels(self, counted: LabelCounts) -> None:
+        categories, skills, names = counted
+        for cluster, counter in categories.items():
+            self.categories[cluster].update(counter)
+        for cluster, counter in skills.items():
+            self.skills[cluster].update(counter)
+        for key, name in names.items():
+            self._skill_names.setdefault(key, name)
+
+    def nearest(self, vector: Sequence[float], n: int) -> List[Tuple[int, float]]:
+        """The n nearest non-empty clusters: (cluster, cosine similarity)."""
+        query = _normalize(np.asarray(vector, dtype=np.float32)[None, :])[0]
+        scores = self.centroids @ query
+        scores[self.counts == 0] = -np.inf
+        n = min(n, int((self.counts > 0).sum()))
+        top = np.argpartition(-scores, n - 1)[:n] if n else np.zeros(0, dtype=np.intp)
+        top = top[np.argsort(-scores[top])]
+        return [(int(cluster), float(scores[cluster])) for cluster in top]
+
+    def suggest(self, vector: Sequence[float], clusters: int, limit: int) -> dict:
+        """
+        Categories and skills of the nearest clusters.
+
+        A suggestion's score is the share of jobs in those clusters that
+        have it, weighted by the clusters' similarity to the draft.
+        """
+        nearest = self.nearest(vector, clusters)
+        weights = {cluster: max(similarity, 0.0) for cluster, similarity in nearest}
+        total = sum(weights.values()) or 1.0
+        categories: Counter = Counter()
+        skills: Counter = Counter()
+        for cluster, weight in weights.items():
+            if not weight:
+                continue
+            size = int(self.counts[cluster])
+            for name, count in self.categories[cluster].items():
+                categories[name] += weight * count / size / total
+            for key, count in self.skills[cluster].items():
+                skills[key] += weight * count / size / total
+        return {
+            "categories": [
+                {"name": name, "score": round(score, 4)} for name, score in categories.most_common(limit)
+            ],
+            "skills": [
+                {"name": self._skill_names[key], "score": round(score, 4)} for key, score in skills.most_common(limit)
+            ],
+            "clusters": [
+                {"cluster": cluster, "similarity": round(similarity, 4), "size": int(self.counts[cluster])}
+                for cluster, similarity in nearest
+            ],
+        }
+
+    def label(self, cluster: int, top: int = 5) -> List[str]:
+        """Top skills of a cluster."""
+        return [self._skill_names[key] for key, _ in self.skills[cluster].most_common(top)]
+
+    def summary(self, top: int = 5) -> dict:
+        """State and non-empty clusters, largest first."""
+        clusters = []
+        if self.ready:
+            for cluster in np.argsort(-self.counts).tolist():
+                if not self.counts[cluster]:
+                    break
+                top_category = self.categories[cluster].most_common(1)
+                clusters.append({
+                    "cluster": cluster,
+                    "size": int(self.counts[cluster]),
+                    "category": top_category[0][0] if top_category else None,
+                    "skills": self.label(cluster, top),
+                })
+        return {
+            "ready": self.ready,
+            "model": self.model,
+            "dimensions": self.dimensions,
+            "k": self.k,
+            "jobs": self.jobs,
+            "init_points": self.init_points,
+            "clusters": clusters,
+        }
+
+
+# Singleton instance
+_job_clusters: Optional[JobClusters] = None
+
+
+async def get_job_clusters() -> JobClusters:
+    """Get or create this worker's view of the shared job clusters."""
+    global _job_clusters
+    if _job_clusters is None:
+        settings = get_settings()
+        _job_clusters = JobClusters(
+            await get_cache(),
+            f"ai:clusters:{settings.clustering_k}",
+            k=settings.clustering_k,
+            init_points=settings.clustering_init_points,
+            batch_size=settings.clustering_batch_size,
+            init_epochs=settings.clustering_init_epochs,
+            min_learning_rate=settings.clustering_min_learning_rate,
+            refresh_interval=settings.clustering_refresh_interval,
+            lock_timeout=settings.clustering_lock_timeout,
+            seed=settings.clustering_seed,
+        )
+    return _job_clusters
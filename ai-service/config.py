@@ -36,24 +36,220 @@ class Settings(BaseSettings):
         description="Redis connection string"
     )
     cache_ttl: int = Field(default=3600, description="Cache TTL in seconds (1 hour)")
+    cache_scan_count: int = Field(default=1000, description="Keys per SCAN/SSCAN step when invalidating")
+    cache_unlink_batch: int = Field(default=500, description="Keys per UNLINK command when invalidating")
+    cache_batch_size: int = Field(default=500, description="Keys per MGET or SETEX pipeline in batch operations")
+    cache_local_max_entries: int = Field(default=1000, description="Entries kept in the in-process cache while Redis is down")
+    redis_max_connections: int = Field(default=50, description="Maximum Redis connections per worker for cache commands")
+    redis_stream_max_connections: int = Field(
+        default=100,
+        description="Maximum Redis connections per worker for blocking reads of batch event streams (batch workers have their own)"
+    )
+    redis_connect_timeout: float = Field(default=2.0, description="Redis connect timeout in seconds")
+    redis_socket_timeout: float = Field(default=30.0, description="Redis socket read timeout in seconds (above blocking reads)")
+    redis_command_timeout: float = Field(default=1.0, description="Timeout for a cache command in seconds")
+    redis_reconnect_base_delay: float = Field(default=1.0, description="First reconnect delay in seconds (doubles per failure)")
+    redis_reconnect_max_delay: float = Field(default=30.0, description="Maximum reconnect delay in seconds")
+    redis_health_check_interval: float = Field(default=5.0, description="Seconds between pings while connected")
     
     # AI Provider Keys
     openai_api_key: Optional[str] = Field(default=None, description="OpenAI API key")
     anthropic_api_key: Optional[str] = Field(default=None, description="Anthropic API key")
     groq_api_key: Optional[str] = Field(default=None, description="Groq API key")
     
+    # Provider Key Pools (comma-separated; combined with the single keys above)
+    openai_api_keys: Optional[str] = Field(default=None, description="Additional OpenAI API keys")
+    openai_base_urls: Optional[str] = Field(
+        default=None,
+        description="OpenAI-compatible base URLs (e.g. self-hosted endpoints); defaults to OpenAI"
+    )
+    anthropic_api_keys: Optional[str] = Field(default=None, description="Additional Anthropic API keys")
+    anthropic_base_urls: Optional[str] = Field(default=None, description="Anthropic base URLs")
+    groq_api_keys: Optional[str] = Field(default=None, description="Additional Groq API keys")
+    groq_base_urls: Optional[str] = Field(default=None, description="Groq base URLs")
+    key_pool_throttle_cooldown: float = Field(
+        default=30.0,
+        description="Seconds a throttled key stays out of rotation when the provider gives no reset time"
+    )
+    
     # Default AI Models
     openai_model: str = Field(default="gpt-4o", description="Default OpenAI model")
     anthropic_model: str = Field(default="claude-3-5-sonnet-20241022", description="Default Anthropic model")
     groq_model: str = Field(default="llama-3.1-70b-versatile", description="Default Groq model")
     
+    # Prompt Budgeting (tokens)
+    job_draft_output_tokens: int = Field(default=800, description="Expected job draft output size")
+    cover_letter_output_tokens: int = Field(default=700, description="Expected cover letter output size")
+    cover_letter_job_description_tokens: int = Field(
+        default=600, description="Token budget for the job description in cover letter prompts"
+    )
+    cover_letter_experience_tokens: int = Field(
+        default=400, description="Token budget for freelancer experience in cover letter prompts"
+    )
+    output_token_margin: float = Field(default=0.25, description="Extra share of expected output allowed in max_tokens")
+    
     # Embedding Model
     embedding_model: str = Field(default="text-embedding-3-small", description="OpenAI embedding model")
-    embedding_dimensions: int = Field(default=1536, description="Embedding vector dimensions")
+    embedding_dimensions: int = Field(
+        default=1536,
+        description="Default embedding dimensions (longer vectors are shortened natively or truncated)"
+    )
+    embedding_collections: str = Field(
+        default="",
+        description="Embedding provider per collection, e.g. 'profiles=local,jobs=openai'"
+    )
+    embedding_collection_dimensions: str = Field(
+        default="",
+        description="Embedding dimensions per collection, e.g. 'jobs=512,profiles=256'"
+    )
+    embedding_chunk_tokens: int = Field(default=512, description="Maximum tokens per chunk of a document embedding")
+    embedding_chunk_overlap_tokens: int = Field(
+        default=64,
+        description="Tokens repeated from the previous chunk of a document embedding"
+    )
+    
+    # Near-Duplicate Detection (MinHash/LSH, indexes in Redis)
+    dedup_num_perm: int = Field(default=128, description="MinHash signature length")
+    dedup_bands: int = Field(default=16, description="LSH bands (divides dedup_num_perm; 16x8 collides from ~0.7 similarity)")
+    dedup_shingle_size: int = Field(default=5, description="Characters per shingle")
+    dedup_threshold: float = Field(default=0.8, description="Default minimum estimated Jaccard similarity of duplicates")
+    dedup_max_items: int = Field(default=50000, description="Items per index before the oldest are evicted")
+    dedup_seed: int = Field(default=1337, description="Seed of the MinHash functions")
+    
+    # Job Clustering (category & skill suggestions, model in Redis)
+    clustering_k: int = Field(default=256, description="Number of job clusters")
+    clustering_init_points: int = Field(default=2048, description="Jobs buffered before the first k-means fit")
+    clustering_batch_size: int = Field(default=256, description="Mini-batch size of k-means updates")
+    clustering_init_epochs: int = Field(default=5, description="Mini-batch passes over the buffered jobs at the first fit")
+    clustering_min_learning_rate: float = Field(
+        default=0.01,
+        description="Lower bound of a centroid's per-job learning rate (keeps clusters following new jobs)"
+    )
+    clustering_seed: int = Field(default=1337, description="Seed of the k-means initialization")
+    clustering_refresh_interval: float = Field(
+        default=5.0,
+        description="Seconds between checks for cluster updates by other workers"
+    )
+    clustering_lock_timeout: float = Field(
+        default=30.0,
+        description="Seconds a cluster update may hold, or wait for, the update lock"
+    )
+    clustering_suggest_clusters: int = Field(default=5, description="Nearest clusters used for suggestions")
+    
+    # Local Embeddings (in-process, no API key)
+    local_enabled: bool = Field(default=True, description="Enable the local embedding provider")
+    local_embedding_fallback: bool = Field(
+        default=False,
+        description="Serve embeddings locally when remote providers fail (vectors are not comparable across models, so search and cluster suggestions never use it)"
+    )
+    local_embedding_dimensions: int = Field(default=768, description="Local embedding vector dimensions")
+    local_embedding_buckets: int = Field(default=32768, description="Hashed feature buckets of the local embedder")
+    local_embedding_seed: int = Field(default=1337, description="Seed of the local embedder's projection")
+    
+    # Provider HTTP Connection Pool (one per worker, shared by all SDK clients)
+    http_pool_max_connections: int = Field(default=100, description="Maximum open connections per worker")
+    http_pool_max_keepalive: int = Field(default=20, description="Maximum idle keep-alive connections per worker")
+    http_pool_keepalive_expiry: float = Field(default=120.0, description="Seconds an idle connection is kept open")
+    http_connect_timeout: float = Field(default=5.0, description="TCP/TLS connect timeout in seconds")
+    http_read_timeout: float = Field(default=60.0, description="Socket read timeout in seconds")
+    http_write_timeout: float = Field(default=10.0, description="Socket write timeout in seconds")
+    http_pool_timeout: float = Field(default=5.0, description="Maximum wait for a free pooled connection in seconds")
+    http2_enabled: bool = Field(default=False, description="Negotiate HTTP/2 with providers (requires h2)")
+    http_pool_warm_connections: int = Field(default=2, description="Connections opened per provider host at startup")
+    
+    # Request Deadlines & Retries
+    deadline_header: str = Field(
+        default="X-Request-Timeout-Ms",
+        description="Header carrying the caller's remaining time budget in milliseconds"
+    )
+    deadline_completion: float = Field(default=25.0, description="Default deadline for generation endpoints in seconds")
+    deadline_embedding: float = Field(default=10.0, description="Default deadline for embedding endpoints in seconds")
+    deadline_safety_margin: float = Field(default=0.25, description="Seconds reserved for serializing the response")
+    provider_attempt_timeout: float = Field(default=15.0, description="Upper bound for a single provider attempt in seconds")
+    provider_max_attempts: int = Field(default=3, description="Maximum attempts per provider for retryable errors")
+    provider_retry_base_delay: float = Field(default=0.25, description="Base delay for jittered exponential backoff in seconds")
+    provider_retry_max_delay: float = Field(default=4.0, description="Maximum backoff delay in seconds")
+    provider_min_attempt_time: float = Field(default=1.0, description="Minimum remaining budget worth starting an attempt with")
+    
+    # Batch Generation Jobs
+    batch_workers_enabled: bool = Field(default=True, description="Run batch workers in this process")
+    batch_worker_concurrency: int = Field(default=2, description="Concurrent batch items per worker process")
+    batch_max_items: int = Field(default=500, description="Maximum items per batch job")
+    batch_max_attempts: int = Field(default=3, description="Deliveries before a batch item is marked failed")
+    batch_claim_idle: float = Field(default=120.0, description="Seconds before a pending item is reclaimed from a dead worker")
+    batch_job_ttl: int = Field(default=86400, description="Seconds job status and results are kept")
     
     # Rate Limiting
     rate_limit_requests: int = Field(default=100, description="Requests per minute")
     rate_limit_window: int = Field(default=60, description="Rate limit window in seconds")
+    rate_limit_enabled: bool = Field(default=True, description="Enforce per-client rate limits")
+    rate_limit_exempt_paths: str = Field(
+        default="/health,/metrics,/docs,/redoc,/openapi.json",
+        description="Comma-separated list of paths that are never rate limited"
+    )
+    rate_limit_trusted_proxies: str = Field(
+        default="",
+        description="Comma-separated IPs/CIDRs (e.g. the Next.js app) whose X-User-Id, X-API-Key and X-Forwarded-For are trusted"
+    )
+    rate_limit_identity_secret: Optional[str] = Field(
+        default=None,
+        description="Shared secret in X-Identity-Secret that makes identity headers trusted from any address"
+    )
+    
+    # Request Tracing
+    request_id_header: str = Field(default="X-Request-ID", description="Header carrying the request id (accepted and echoed)")
+    trace_service_name: str = Field(default="carphatian-ai-service", description="service.name of exported traces")
+    trace_export_file: Optional[str] = Field(default=None, description="Append OTLP/JSON traces to this file (one per line)")
+    trace_export_endpoint: Optional[str] = Field(
+        default=None,
+        description="POST OTLP/JSON traces to this URL (e.g. http://collector:4318/v1/traces)"
+    )
+    trace_export_min_duration_ms: float = Field(default=0.0, description="Only export requests slower than this")
+    
+    # Usage & Cost Ledger
+    usage_ledger_enabled: bool = Field(default=True, description="Record token usage and estimated cost")
+    usage_flush_interval: float = Field(default=10.0, description="Seconds between ledger flushes")
+    usage_ledger_file: Optional[str] = Field(default=None, description="Append-only JSONL ledger used when Redis is unavailable")
+    usage_retention_days: int = Field(default=90, description="Days of usage kept in Redis")
+    usage_price_overrides: Optional[str] = Field(
+        default=None,
+        description='JSON of model prefix -> [input, output] USD per million tokens, e.g. {"gpt-4o": [2.5, 10]}'
+    )
+    tenant_header: str = Field(default="X-Tenant-ID", description="Header identifying the tenant for usage accounting")
+    usage_tenants: Optional[str] = Field(
+        default=None,
+        description="Comma-separated known tenants; other tenant header values are accounted as 'other'"
+    )
+    usage_max_tenants: int = Field(
+        default=100,
+        description="Without USAGE_TENANTS, distinct tenants accepted per worker before the rest count as 'other'"
+    )
+    cost_aware_routing: bool = Field(
+        default=False,
+        description="Without a preferred provider, try the cheapest provider first (by observed cost per call)"
+    )
+    
+    # Admin
+    admin_api_key: Optional[str] = Field(default=None, description="Key required in X-Admin-Key for /admin endpoints")
+    
+    # Sampling Profiler
+    profiler_interval_ms: float = Field(default=5.0, description="Default sampling interval in milliseconds")
+    profiler_max_seconds: float = Field(default=60.0, description="Longest profile allowed via the admin endpoint")
+    profiler_signal_enabled: bool = Field(default=True, description="Profile a worker when it receives SIGUSR2")
+    profiler_signal_seconds: float = Field(default=15.0, description="Duration of SIGUSR2-triggered profiles")
+    profiler_output_dir: str = Field(default="/tmp", description="Directory for SIGUSR2-triggered profiles")
+    
+    # Event Loop Monitoring & Load Shedding
+    loop_monitor_interval: float = Field(default=0.1, description="Seconds between event loop lag samples")
+    load_shedding_enabled: bool = Field(default=True, description="Shed low-priority requests while the loop lags")
+    load_shed_low_lag_ms: float = Field(default=150.0, description="Smoothed loop lag above which low-priority paths are shed")
+    load_shed_low_paths: str = Field(
+        default="/ai/batch,/ai/semantic-search,/ai/clusters/jobs,/admin/usage",
+        description="Comma-separated path prefixes shed first"
+    )
+    load_shed_high_lag_ms: float = Field(default=500.0, description="Smoothed loop lag above which high-tier paths are also shed")
+    load_shed_high_paths: str = Field(default="/ai/embed", description="Comma-separated path prefixes shed under heavy lag")
+    load_shed_retry_after: int = Field(default=2, description="Retry-After seconds for shed requests")
     
     # Sentry (Error Tracking)
     sentry_dsn: Optional[str] = Field(default=None, description="Sentry DSN for error tracking")
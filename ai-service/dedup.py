@@ -0,0 +1,330 @@
+"""
+Carphatian AI Microservice - Near-Duplicate Detection
+
+MinHash signatures with an LSH banding index, to find reposted jobs and
+copy-pasted proposals without scoring every stored text.
+
+Text is normalized (Unicode, case, whitespace) and reduced to its set of
+character shingles (overlapping k-character windows). A MinHash signature
+keeps, for each of `num_perm` hash functions, the minimum hash over the
+shingles; the share of equal positions in two signatures estimates the
+Jaccard similarity of their shingle sets.
+
+Signatures are split into `bands` bands of `rows` positions, and each band
+is a bucket key. Two texts become candidates when any band matches, which
+happens with probability 1 - (1 - J^rows)^bands: texts above roughly
+(1/bands)^(1/rows) similarity almost always collide, dissimilar ones
+almost never do. A query only reads its own buckets, so it costs
+O(bands + candidates) instead of O(N). Candidates are then filtered by
+their estimated similarity.
+
+Indexes live in Redis, one per (tenant, collection), so every worker
+sees the same items and they survive restarts. Commands use the cache's
+REDIS_COMMAND_TIMEOUT. Each is bounded by DEDUP_MAX_ITEMS (oldest entries
+are evicted first). The DEDUP_* settings are part of the key prefix,
+since signatures are only comparable under the same settings.
+
+Redis layout (prefix "ai:dedup:{collection}:{tenant}:{num_perm}.{bands}.{shingle_size}.{seed}"):
+    {prefix}:sig             hash   item id -> signature (hex of uint32s)
+    {prefix}:order           zset   item id -> insertion time
+    {prefix}:band:{key}      set    item ids whose band hashes to key
+
+Updates are pipelined rather than atomic: a concurrent update can leave
+an item id in a stale bucket, which costs a lookup but never a wrong
+result, since candidates are scored against their stored signature.
+
+Built by Carphatian
+"""
+
+import asyncio
+import re
+import time
+import unicodedata
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Collection, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+import structlog
+
+from cache import CONNECTION_ERRORS, AICache, get_cache
+from config import get_settings
+
+logger = structlog.get_logger()
+
+# Texts longer than this are hashed in a thread to keep the event loop responsive
+INLINE_MAX_CHARS = 4000
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Multiplier for polynomial hashing of codepoint windows (odd, 64-bit)
+_BASE = np.uint64(0x100000001B3)
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """Finalize 64-bit hashes (splitmix64)."""
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def normalize(text: str) -> str:
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", text).casefold()).strip()
+
+
+def shingles(text: str, size: int) -> np.ndarray:
+    """Distinct 64-bit hashes of the `size`-character windows of the normalized text."""
+    text = normalize(text)
+    if not text:
+        return np.zeros(0, dtype=np.uint64)
+    codepoints = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(codepoints) < size:
+        # Short texts are a single shingle
+        windows = codepoints[None, :]
+    else:
+        windows = np.lib.stride_tricks.sliding_window_view(codepoints, size)
+    powers = _BASE ** np.arange(windows.shape[1], dtype=np.uint64)[::-1]
+    with np.errstate(over="ignore"):
+        return np.unique(_mix(windows @ powers))
+
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    """Exact Jaccard similarity of two shingle sets."""
+    if not len(a) and not len(b):
+        return 1.0
+    return len(np.intersect1d(a, b, assume_unique=True)) / len(np.union1d(a, b))
+
+
+class MinHasher:
+    """
+    MinHash signatures with `num_perm` multiply-shift hash functions.
+
+    Args:
+        num_perm: Signature length
+        seed: Seed of the hash functions (signatures are only comparable
+            with signatures from the same settings)
+    """
+
+    def __init__(self, num_perm: int, seed: int):
+        self.num_perm = num_perm
+        rng = np.random.default_rng(seed)
+        # h(x) = high 32 bits of (a * x + b) mod 2^64, with odd a
+        self._a = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+
+    def signature(self, shingle_hashes: np.ndarray) -> np.ndarray:
+        """uint32 signature of a shingle set (all ones for an empty set)."""
+        if not len(shingle_hashes):
+            return np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+        with np.errstate(over="ignore"):
+            hashed = (shingle_hashes[:, None] * self._a + self._b) >> np.uint64(32)
+        return hashed.min(axis=0).astype(np.uint32)
+
+
+def estimate_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Jaccard similarity estimated from two signatures."""
+    return float(np.mean(a == b))
+
+
+def _encode(signature: np.ndarray) -> str:
+    return signature.astype("<u4").tobytes().hex()
+
+
+def _decode(value: str) -> np.ndarray:
+    return np.frombuffer(bytes.fromhex(value), dtype="<u4").astype(np.uint32)
+
+
+@lru_cache(maxsize=8)
+def _hasher(num_perm: int, seed: int) -> MinHasher:
+    return MinHasher(num_perm, seed)
+
+
+class DedupUnavailable(RuntimeError):
+    """Raised when the duplicate index cannot be reached (Redis is down)."""
+
+
+class MinHashIndex:
+    """
+    LSH banding index of MinHash signatures, stored in Redis.
+
+    Args:
+        cache: Connected cache whose Redis client holds the index
+        prefix: Key prefix of this index
+        num_perm: Signature length
+        bands: Number of bands (must divide num_perm)
+        shingle_size: Characters per shingle
+        seed: Seed of the hash functions
+        max_items: Oldest items are evicted beyond this size
+    """
+
+    def __init__(
+        self,
+        cache: AICache,
+        prefix: str,
+        num_perm: int,
+        bands: int,
+        shingle_size: int,
+        seed: int,
+        max_items: int,
+    ):
+        if num_perm % bands:
+            raise ValueError(f"bands ({bands}) must divide num_perm ({num_perm})")
+        self.cache = cache
+        self.client = cache._client
+        self.prefix = prefix
+        self.hasher = _hasher(num_perm, seed)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.max_items = max_items
+        self._signatures_key = f"{prefix}:sig"
+        self._order_key = f"{prefix}:order"
+        self._row_powers = _BASE ** np.arange(self.rows, dtype=np.uint64)
+        self._band_salts = _mix(np.arange(1, bands + 1, dtype=np.uint64))
+
+    @property
+    def threshold(self) -> float:
+        """Similarity at which two texts collide in some band with probability ~0.5."""
+        return (1 / self.bands) ** (1 / self.rows)
+
+    def signature(self, text: str) -> np.ndarray:
+        """
+        Signature of a text (CPU-bound; may run in a thread).
+
+        Raises:
+            ValueError: If the text is empty once normalized (its signature
+                would match every other empty text)
+        """
+        text_shingles = shingles(text, self.shingle_size)
+        if not len(text_shingles):
+            raise ValueError("Text has no characters to compare")
+        return self.hasher.signature(text_shingles)
+
+    async def signature_async(self, text: str) -> np.ndarray:
+        """Signature of a text, computed in a thread for long texts."""
+        if len(text) > INLINE_MAX_CHARS:
+            return await asyncio.to_thread(self.signature, text)
+        return self.signature(text)
+
+    def _band_keys(self, signature: np.ndarray) -> List[str]:
+        bands = signature.reshape(self.bands, self.rows).astype(np.uint64)
+        with np.errstate(over="ignore"):
+            hashes = _mix(bands @ self._row_powers ^ self._band_salts).tolist()
+        return [f"{self.prefix}:band:{value:016x}" for value in hashes]
+
+    @contextmanager
+    def _connection(self) -> Iterator[None]:
+        """Report connection failures to the cache and surface them as DedupUnavailable."""
+        try:
+            yield
+        except CONNECTION_ERRORS as e:
+            self.cache._failed(e)
+            raise DedupUnavailable(f"Duplicate index unavailable: {e}") from e
+
+    async def count(self) -> int:
+        """Items in the index."""
+        with self._connection():
+            return await self.cache._run(self.client.hlen(self._signatures_key))
+
+    async def contains(self, item_id: str) -> bool:
+        with self._connection():
+            return bool(await self.cache._run(self.client.hexists(self._signatures_key, item_id)))
+
+    async def insert(self, item_id: str, signature: np.ndarray) -> None:
+        """Add or replace an item, evicting the oldest items beyond max_items."""
+        with self._connection():
+            await self._remove_many([item_id])
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.hset(self._signatures_key, item_id, _encode(signature))
+                pipe.zadd(self._order_key, {item_id: time.time()})
+                for key in self._band_keys(signature):
+                    pipe.sadd(key, item_id)
+                pipe.zcard(self._order_key)
+                size = (await self.cache._run(pipe.execute()))[-1]
+            if size > self.max_items:
+                oldest = await self.cache._run(self.client.zrange(self._order_key, 0, size - self.max_items - 1))
+                await self._remove_many(oldest)
+                logger.debug("dedup_evicted", index=self.prefix, items=len(oldest))
+
+    async def remove(self, item_id: str) -> bool:
+        """Remove an item; returns whether it was indexed."""
+        with self._connection():
+            return await self._remove_many([item_id]) > 0
+
+    async def _remove_many(self, item_ids: Iterable[str]) -> int:
+        item_ids = list(item_ids)
+        if not item_ids:
+            return 0
+        stored = await self.cache._run(self.client.hmget(self._signatures_key, item_ids))
+        found = [(item_id, value) for item_id, value in zip(item_ids, stored) if value is not None]
+        async with self.client.pipeline(transaction=False) as pipe:
+            for item_id, value in found:
+                for key in self._band_keys(_decode(value)):
+                    pipe.srem(key, item_id)
+            pipe.hdel(self._signatures_key, *item_ids)
+            pipe.zrem(self._order_key, *item_ids)
+            await self.cache._run(pipe.execute())
+        return len(found)
+
+    async def candidates(self, signature: np.ndarray) -> Set[str]:
+        """Items sharing at least one band with the signature."""
+        with self._connection():
+            async with self.client.pipeline(transaction=False) as pipe:
+                for key in self._band_keys(signature):
+                    pipe.smembers(key)
+                buckets = await self.cache._run(pipe.execute())
+        return set().union(*buckets)
+
+    async def query(
+        self,
+        signature: np.ndarray,
+        min_similarity: float,
+        limit: int,
+        exclude: Collection[str] = (),
+    ) -> List[Tuple[str, float]]:
+        """
+        Likely duplicates of a signature.
+
+        Returns:
+            (item id, estimated Jaccard similarity), most similar first
+        """
+        candidates = sorted(await self.candidates(signature) - set(exclude))
+        if not candidates:
+            return []
+        with self._connection():
+            stored = await self.cache._run(self.client.hmget(self._signatures_key, candidates))
+        scored = []
+        for item_id, value in zip(candidates, stored):
+            if value is None:
+                # Left in a bucket by a concurrent update
+                continue
+            similarity = estimate_similarity(signature, _decode(value))
+            if similarity >= min_similarity:
+                scored.append((item_id, similarity))
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored[:limit]
+
+
+async def get_dedup_index(collection: str, tenant: Optional[str] = None) -> MinHashIndex:
+    """
+    Get the duplicate index of a collection.
+
+    Raises:
+        DedupUnavailable: If Redis is unavailable
+    """
+    cache = await get_cache()
+    if cache._client is None:
+        raise DedupUnavailable("Duplicate detection requires Redis")
+    settings = get_settings()
+    version = f"{settings.dedup_num_perm}.{settings.dedup_bands}.{settings.dedup_shingle_size}.{settings.dedup_seed}"
+    return MinHashIndex(
+        cache,
+        f"ai:dedup:{collection}:{tenant or '-'}:{version}",
+        settings.dedup_num_perm,
+        settings.dedup_bands,
+        settings.dedup_shingle_size,
+        settings.dedup_seed,
+        settings.dedup_max_items,
+    )
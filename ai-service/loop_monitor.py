@@ -0,0 +1,151 @@
+"""
+Carphatian AI Microservice - Event Loop Lag & Load Shedding
+
+Measures how late the event loop runs timers and sheds low-priority work
+while it is overloaded.
+
+CPU-bound work on the loop (scoring, validating and encoding large
+payloads) delays every other request in the worker. The monitor sleeps
+for a fixed interval and records how much later than scheduled it woke
+up. While the smoothed lag is above a tier's threshold, requests to that
+tier's paths get 503 with Retry-After and batch workers pause, so /health
+and interactive generation keep their latency.
+
+Tiers (path prefixes, comma-separated):
+    low     LOAD_SHED_LOW_PATHS   shed above LOAD_SHED_LOW_LAG_MS
+    high    LOAD_SHED_HIGH_PATHS  shed above LOAD_SHED_HIGH_LAG_MS
+
+Built by Carphatian
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+import structlog
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from config import get_settings
+from metrics import LOAD_SHED, LOOP_LAG, LOOP_LAG_SECONDS, route_label
+
+logger = structlog.get_logger()
+
+
+# Weight of the newest sample in the smoothed lag
+EWMA_ALPHA = 0.3
+
+# Shedding stops once lag falls below this share of the threshold
+RECOVERY_RATIO = 0.5
+
+
+def _paths(value: str) -> Tuple[str, ...]:
+    return tuple(path.strip() for path in value.split(",") if path.strip())
+
+
+class LoopLagMonitor:
+    """Tracks event loop lag and which shedding tiers are active."""
+
+    def __init__(self):
+        settings = get_settings()
+        self.interval = settings.loop_monitor_interval
+        self.lag = 0.0
+        self.recent: Deque[float] = deque(maxlen=max(1, int(10 / self.interval)))
+        # (tier, threshold seconds, path prefixes)
+        self.tiers: List[Tuple[str, float, Tuple[str, ...]]] = [
+            ("low", settings.load_shed_low_lag_ms / 1000, _paths(settings.load_shed_low_paths)),
+            ("high", settings.load_shed_high_lag_ms / 1000, _paths(settings.load_shed_high_paths)),
+        ]
+        self.shedding = {tier: False for tier, _, _ in self.tiers}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            scheduled = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.observe(max(0.0, time.perf_counter() - scheduled))
+
+    def observe(self, lag: float) -> None:
+        """Record one lag sample and update the shedding tiers."""
+        self.lag = EWMA_ALPHA * lag + (1 - EWMA_ALPHA) * self.lag
+        self.recent.append(lag)
+        LOOP_LAG.set(self.lag)
+        LOOP_LAG_SECONDS.observe(lag)
+
+        for tier, threshold, _ in self.tiers:
+            active = self.shedding[tier]
+            if not active and self.lag > threshold:
+                self.shedding[tier] = True
+                logger.warning("load_shedding_started", tier=tier, lag_ms=round(self.lag * 1000, 1))
+            elif active and self.lag < threshold * RECOVERY_RATIO:
+                self.shedding[tier] = False
+                logger.info("load_shedding_stopped", tier=tier, lag_ms=round(self.lag * 1000, 1))
+
+    @property
+    def overloaded(self) -> bool:
+        """True while any tier is being shed (background work should wait)."""
+        return any(self.shedding.values())
+
+    def should_shed(self, path: str) -> bool:
+        for tier, _, prefixes in self.tiers:
+            if self.shedding[tier] and path.startswith(prefixes):
+                return True
+        return False
+
+    def snapshot(self) -> dict:
+        return {
+            "lag_ms": round(self.lag * 1000, 2),
+            "max_lag_ms_10s": round(max(self.recent, default=0.0) * 1000, 2),
+            "shedding": [tier for tier, active in self.shedding.items() if active],
+        }
+
+
+# Singleton instance
+_monitor: Optional[LoopLagMonitor] = None
+
+
+def get_loop_monitor() -> LoopLagMonitor:
+    """Get or create the loop lag monitor for this worker."""
+    global _monitor
+    if _monitor is None:
+        _monitor = LoopLagMonitor()
+    return _monitor
+
+
+class LoadShedMiddleware:
+    """ASGI middleware rejecting shed paths with 503 while the loop lags."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        settings = get_settings()
+        self.enabled = settings.load_shedding_enabled
+        self.retry_after = settings.load_shed_retry_after
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.enabled or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        monitor = get_loop_monitor()
+        if not monitor.should_shed(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        LOAD_SHED.labels(route_label(scope)).inc()
+        logger.warning("request_shed", path=scope["path"], lag_ms=round(monitor.lag * 1000, 1))
+        response = JSONResponse(
+            status_code=503,
+            content={"detail": "Service overloaded, retry later"},
+            headers={"Retry-After": str(self.retry_after)},
+        )
+        await response(scope, receive, send)
@@ -10,27 +10,58 @@ FastAPI application for AI-powered features:
 Built by Carphatian
 """
 
+import time
+
+# Measured for the startup report
+_imports_started = time.perf_counter()
+
+import asyncio
+import hmac
 from contextlib import asynccontextmanager
-from typing import List, Optional
-from fastapi import FastAPI, HTTPException, Depends, status
+from typing import Annotated, List, Literal, Optional
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 import structlog
-import sentry_sdk
 
 from config import get_settings
 from cache import get_cache, AICache
+from rate_limit import RateLimitMiddleware
+from metrics import MetricsMiddleware, MetricsRoute, mark_worker_dead, render_metrics, track_stage
+from tracing import TracingMiddleware
+from loop_monitor import LoadShedMiddleware, get_loop_monitor
+from usage_ledger import get_usage_ledger
+import profiler
+from startup import get_startup_report
+from responses import fast_response
+from chunking import chunk_text, pool_embeddings
+from dedup import DedupUnavailable, get_dedup_index
+from clustering import ClusterMismatch, ClustersUnavailable, get_job_clusters
+from prompt_budget import get_prompt_budget, preload_encodings
+from cache_keys import job_draft_key, cover_letter_key, embedding_key, cache_tags
+from structured_output import parse_structured, JobDraftOutput, CoverLetterOutput
+from structured_output import snapshot as structured_output_snapshot
+import batch_jobs
+from batch_jobs import BatchUnavailable, get_batch_worker
 from providers import (
     get_ai_factory,
     AIProviderFactory,
     Message,
     CompletionRequest,
     EmbeddingRequest,
+    EmbeddingBatchRequest,
+    Deadline,
+    DeadlineExceeded,
+    warm_http_pool,
+    close_http_client,
+    pool_stats,
 )
 
 # Initialize logging
 structlog.configure(
     processors=[
+        structlog.contextvars.merge_contextvars,
         structlog.stdlib.filter_by_level,
         structlog.stdlib.add_logger_name,
         structlog.stdlib.add_log_level,
@@ -45,8 +76,12 @@ structlog.configure(
 logger = structlog.get_logger()
 settings = get_settings()
 
-# Initialize Sentry if configured
+get_startup_report().record("imports", time.perf_counter() - _imports_started)
+
+# Initialize Sentry if configured (imported only when used)
 if settings.sentry_dsn:
+    import sentry_sdk
+    
     sentry_sdk.init(
         dsn=settings.sentry_dsn,
         traces_sample_rate=0.1,
@@ -103,6 +138,10 @@ class EmbedRequest(BaseModel):
     """Request for text embedding."""
     text: str = Field(..., min_length=1, max_length=10000, description="Text to embed")
     model: Optional[str] = Field(None, description="Embedding model to use")
+    collection: Optional[str] = Field(None, description="Collection the vectors belong to (selects its embedding provider)")
+    dimensions: Optional[int] = Field(
+        None, ge=8, le=3072, description="Output dimensions (default: the collection's, else EMBEDDING_DIMENSIONS)"
+    )
 
 
 class EmbedResponse(BaseModel):
@@ -113,17 +152,81 @@ class EmbedResponse(BaseModel):
     cached: bool = False
 
 
+class EmbedBatchRequest(BaseModel):
+    """Request for embedding many texts."""
+    texts: List[Annotated[str, Field(min_length=1, max_length=10000)]] = Field(
+        ..., min_length=1, max_length=100, description="Texts to embed"
+    )
+    model: Optional[str] = Field(None, description="Embedding model to use")
+    collection: Optional[str] = Field(None, description="Collection the vectors belong to (selects its embedding provider)")
+    dimensions: Optional[int] = Field(
+        None, ge=8, le=3072, description="Output dimensions (default: the collection's, else EMBEDDING_DIMENSIONS)"
+    )
+
+
+class EmbedBatchResponse(BaseModel):
+    """Batch embedding response (embeddings in request order)."""
+    embeddings: List[EmbedResponse]
+    cached: int = Field(0, description="Number of texts served from cache")
+
+
+class EmbedDocumentRequest(BaseModel):
+    """Request for embedding a long document in chunks."""
+    text: str = Field(..., min_length=1, max_length=100000, description="Document text")
+    model: Optional[str] = Field(None, description="Embedding model to use")
+    collection: Optional[str] = Field(None, description="Collection the vectors belong to (selects its embedding provider)")
+    dimensions: Optional[int] = Field(
+        None, ge=8, le=3072, description="Output dimensions (default: the collection's, else EMBEDDING_DIMENSIONS)"
+    )
+    chunk_tokens: Optional[int] = Field(
+        None, ge=32, le=8000, description="Maximum tokens per chunk (default: EMBEDDING_CHUNK_TOKENS)"
+    )
+    overlap_tokens: Optional[int] = Field(
+        None, ge=0, le=4000, description="Tokens repeated between chunks (default: EMBEDDING_CHUNK_OVERLAP_TOKENS)"
+    )
+    pooling: Literal["mean", "max"] = Field("mean", description="Pooling of chunk vectors into the document vector")
+    include_chunks: bool = Field(False, description="Also return the chunk vectors (for chunk-level search)")
+
+
+class DocumentChunk(BaseModel):
+    """Embedded chunk of a document."""
+    index: int
+    start: int = Field(..., description="Character offset of the chunk in the document")
+    end: int
+    tokens: int
+    embedding: List[float]
+
+
+class EmbedDocumentResponse(BaseModel):
+    """Document embedding response."""
+    embedding: List[float]
+    dimensions: int
+    model: str
+    chunk_count: int
+    cached_chunks: int = Field(0, description="Number of chunks served from cache")
+    chunks: Optional[List[DocumentChunk]] = None
+
+
 class SemanticSearchRequest(BaseModel):
     """Request for semantic search."""
     query: str = Field(..., min_length=3, max_length=500, description="Search query")
     embeddings: List[List[float]] = Field(..., description="Embeddings to search against")
     top_k: int = Field(default=10, ge=1, le=100, description="Number of results")
+    collection: Optional[str] = Field(None, description="Collection the vectors belong to (selects its embedding provider)")
+    dimensions: Optional[int] = Field(
+        None, ge=8, le=3072, description="Query dimensions (default: those of the embeddings searched)"
+    )
+    documents: Optional[List[int]] = Field(
+        None,
+        description="Document of each embedding (e.g. chunk vectors): results are per document, scored by its best chunk",
+    )
 
 
 class SemanticSearchResult(BaseModel):
     """Single search result."""
     index: int
     score: float
+    chunk: Optional[int] = Field(None, description="Best-matching embedding of the document (with `documents`)")
 
 
 class SemanticSearchResponse(BaseModel):
@@ -132,12 +235,130 @@ class SemanticSearchResponse(BaseModel):
     query_embedding: List[float]
 
 
+DuplicateCollection = Literal["jobs", "proposals"]
+
+
+class DuplicateSearchRequest(BaseModel):
+    """Request for near-duplicates of a text."""
+    collection: DuplicateCollection
+    text: str = Field(..., min_length=1, max_length=20000, description="Job or proposal text")
+    threshold: Optional[float] = Field(
+        None, ge=0, le=1, description="Minimum estimated Jaccard similarity (default: DEDUP_THRESHOLD)"
+    )
+    limit: int = Field(default=10, ge=1, le=100, description="Maximum candidates")
+    exclude_id: Optional[str] = Field(None, description="Item to leave out (the text's own entry)")
+    insert_id: Optional[str] = Field(None, max_length=200, description="Index the text under this id after searching")
+
+
+class DuplicateCandidate(BaseModel):
+    """Likely duplicate of the searched text."""
+    id: str
+    similarity: float = Field(..., description="Estimated Jaccard similarity of the texts' shingles")
+
+
+class DuplicateSearchResponse(BaseModel):
+    """Near-duplicate candidates, most similar first."""
+    candidates: List[DuplicateCandidate]
+    indexed: int = Field(..., description="Items in the collection's index")
+
+
+class DuplicateItemRequest(BaseModel):
+    """Text to index for duplicate detection."""
+    text: str = Field(..., min_length=1, max_length=20000, description="Job or proposal text")
+
+
+class DuplicateItemResponse(BaseModel):
+    """Duplicate index change."""
+    id: str
+    collection: str
+    indexed: int = Field(..., description="Items in the collection's index")
+
+
+class ClusterJob(BaseModel):
+    """Job to cluster: its stored embedding, or its text to embed."""
+    embedding: Optional[List[float]] = Field(None, description="Embedding from /ai/embed (collection 'jobs')")
+    text: Optional[str] = Field(None, min_length=1, max_length=10000, description="Job text, if no embedding is given")
+    category: Optional[str] = Field(None, description="Job category")
+    skills: List[str] = Field(default_factory=list, description="Job skills")
+
+
+class ClusterJobsRequest(BaseModel):
+    """Jobs to add to the clusters."""
+    jobs: List[ClusterJob] = Field(..., min_length=1, max_length=500)
+    model: Optional[str] = Field(None, description="Model of the given embeddings (default: EMBEDDING_MODEL)")
+
+
+class ClusterJobsResponse(BaseModel):
+    """Clustering state after ingesting jobs."""
+    added: int
+    jobs: int = Field(..., description="Jobs ingested by this worker")
+    ready: bool = Field(..., description="Whether the clusters are fitted and serve suggestions")
+
+
+class JobSuggestionRequest(BaseModel):
+    """Draft to suggest a category and skills for."""
+    title: str = Field(..., min_length=5, max_length=200, description="Job title")
+    description: Optional[str] = Field(None, max_length=10000, description="Draft description")
+    limit: int = Field(default=5, ge=1, le=20, description="Suggestions per kind")
+
+
+class Suggestion(BaseModel):
+    """Suggested value with the share of similar jobs that use it."""
+    name: str
+    score: float
+
+
+class ClusterMatch(BaseModel):
+    """Cluster near the draft."""
+    cluster: int
+    similarity: float
+    size: int
+
+
+class JobSuggestionResponse(BaseModel):
+    """Category and skill suggestions from the nearest job clusters."""
+    categories: List[Suggestion]
+    skills: List[Suggestion]
+    clusters: List[ClusterMatch]
+
+
+class BatchJobRequest(BaseModel):
+    """Request to generate many items asynchronously."""
+    kind: str = Field(..., description="Item kind: job_draft or cover_letter")
+    items: List[dict] = Field(..., min_length=1, description="Request bodies for the chosen kind")
+
+
+class BatchItemResult(BaseModel):
+    """Outcome of one batch item."""
+    index: int
+    status: str
+    result: Optional[dict] = None
+    error: Optional[str] = None
+
+
+class BatchJobResponse(BaseModel):
+    """Batch job status."""
+    job_id: str
+    kind: str
+    status: str
+    total: int
+    completed: int
+    failed: int
+    created_at: float
+    updated_at: float
+    results: Optional[List[BatchItemResult]] = None
+
+
 class HealthResponse(BaseModel):
     """Health check response."""
     status: str
     version: str
     providers: dict
     cache_connected: bool
+    cache: dict = {}
+    http_pool: dict = {}
+    event_loop: dict = {}
+    structured_output: dict = {}
 
 
 # ============================================================================
@@ -149,25 +370,58 @@ async def lifespan(app: FastAPI):
     """Application lifespan - startup and shutdown."""
     # Startup
     logger.info("ai_service_starting", version=settings.app_version)
+    report = get_startup_report()
+    
+    # Measure event loop lag (drives load shedding)
+    get_loop_monitor().start()
     
     # Initialize cache
-    cache = await get_cache()
+    with report.phase("cache"):
+        cache = await get_cache()
+    
+    # Initialize AI providers (imports the SDKs of configured providers only)
+    with report.phase("providers"):
+        factory = get_ai_factory()
+    
+    # Open provider connections before taking traffic
+    with report.phase("http_pool"):
+        await warm_http_pool(factory.base_urls())
     
-    # Initialize AI providers
-    factory = get_ai_factory()
+    # Load tokenizers off the event loop (may download BPE files)
+    with report.phase("encodings"):
+        await asyncio.to_thread(preload_encodings, factory.models())
     
+    with report.phase("workers"):
+        # Start batch job consumers
+        if settings.batch_workers_enabled:
+            get_batch_worker().start()
+        
+        # Flush usage counters in the background
+        if settings.usage_ledger_enabled:
+            get_usage_ledger().start()
+        
+        # Profile this worker on SIGUSR2
+        profiler.install_signal_handler()
+    
+    report.log(providers=factory.init_timings)
     logger.info(
         "ai_service_started",
         providers=factory.list_providers(),
-        cache_connected=cache._client is not None
+        cache_connected=cache.connected
     )
     
     yield
     
     # Shutdown
     logger.info("ai_service_stopping")
-    if cache._client:
-        await cache.disconnect()
+    if settings.batch_workers_enabled:
+        await get_batch_worker().stop()
+    if settings.usage_ledger_enabled:
+        await get_usage_ledger().stop()
+    await get_loop_monitor().stop()
+    await cache.disconnect()
+    await close_http_client()
+    mark_worker_dead()
     logger.info("ai_service_stopped")
 
 
@@ -182,6 +436,15 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+# Time request parsing and response serialization around each endpoint
+app.router.route_class = MetricsRoute
+
+# Per-client token bucket rate limiting (added first so CORS wraps 429s)
+app.add_middleware(RateLimitMiddleware)
+
+# Shed low-priority requests while the event loop lags (before rate limiting)
+app.add_middleware(LoadShedMiddleware)
+
 # CORS middleware
 origins = settings.cors_origins.split(",")
 app.add_middleware(
@@ -192,6 +455,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request id, per-request spans and Server-Timing header
+app.add_middleware(TracingMiddleware)
+
+# Request latency metrics (added last so it also times the other middleware)
+app.add_middleware(MetricsMiddleware)
+
 
 # ============================================================================
 # Dependencies
@@ -207,6 +476,37 @@ async def get_ai_cache() -> AICache:
     return await get_cache()
 
 
+def request_deadline(default: float):
+    """
+    Dependency factory for the request deadline.
+    
+    Uses the caller's remaining budget from the deadline header, capped
+    at the endpoint default.
+    """
+    async def dependency(request: Request) -> Deadline:
+        return Deadline.from_header(request.headers.get(settings.deadline_header), default)
+    return dependency
+
+
+async def request_tenant(request: Request) -> Optional[str]:
+    """Dependency to get the tenant used for usage accounting (bounded, see UsageLedger.tenant)."""
+    return get_usage_ledger().tenant(request.headers.get(settings.tenant_header))
+
+
+async def require_admin(x_admin_key: Optional[str] = Header(None)):
+    """Dependency guarding admin endpoints with the admin API key."""
+    if not settings.admin_api_key:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin endpoints are disabled (ADMIN_API_KEY not set)"
+        )
+    if not x_admin_key or not hmac.compare_digest(x_admin_key, settings.admin_api_key):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid admin key"
+        )
+
+
 # ============================================================================
 # Endpoints
 # ============================================================================
@@ -218,18 +518,30 @@ async def health_check(
 ):
     """Check service health and provider status."""
     return HealthResponse(
-        status="healthy",
+        status="healthy" if cache.connected else "degraded",
         version=settings.app_version,
         providers=factory.list_providers(),
-        cache_connected=cache._client is not None,
+        cache_connected=cache.connected,
+        cache=cache.state(),
+        http_pool=pool_stats.snapshot(),
+        event_loop=get_loop_monitor().snapshot(),
+        structured_output=structured_output_snapshot(),
     )
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics."""
+    return render_metrics()
+
+
 @app.post("/ai/job-draft", response_model=JobDraftResponse, tags=["AI Generation"])
 async def generate_job_draft(
     request: JobDraftRequest,
     factory: AIProviderFactory = Depends(get_factory),
     cache: AICache = Depends(get_ai_cache),
+    deadline: Deadline = Depends(request_deadline(settings.deadline_completion)),
+    tenant: Optional[str] = Depends(request_tenant),
 ):
     """
     Generate a professional job description using AI.
@@ -240,15 +552,21 @@ async def generate_job_draft(
     - Nice-to-have skills
     """
     # Check cache
-    cache_data = {
-        "type": "job_draft",
-        "title": request.title,
-        "category": request.category,
-        "skills": sorted(request.skills),
-    }
-    
-    cached = await cache.get("job_draft", cache_data)
+    cache_data = job_draft_key(
+        title=request.title,
+        category=request.category,
+        skills=request.skills,
+        budget_min=request.budget_min,
+        budget_max=request.budget_max,
+        timeline=request.timeline,
+        additional_context=request.additional_context,
+        provider=request.provider,
+    )
+    
+    with track_stage("/ai/job-draft", "cache_lookup"):
+        cached = await cache.get("job_draft", cache_data)
     if cached:
+        get_usage_ledger().record_cache_hit("job_draft", tenant, cached)
         return JobDraftResponse(**cached, cached=True)
     
     # Build prompt
@@ -278,49 +596,58 @@ Generate a response in this exact JSON format:
 Make the description engaging, professional, and specific. Include what the freelancer will accomplish.
 Requirements should be essential skills/experience. Nice-to-have are bonus qualifications."""
 
+    budget = get_prompt_budget(factory.model_for(request.provider))
+
     try:
         completion_request = CompletionRequest(
             messages=[Message(role="user", content=prompt)],
-            max_tokens=1500,
+            max_tokens=budget.max_output_tokens(
+                budget.count_messages([prompt]), settings.job_draft_output_tokens
+            ),
             temperature=0.7,
+            json_mode=True,
         )
         
-        response = await factory.complete(completion_request, request.provider)
+        with track_stage("/ai/job-draft", "provider_call"):
+            response = await factory.complete(completion_request, request.provider, deadline)
         
-        # Parse JSON response
-        import json
-        try:
-            # Try to extract JSON from response
-            content = response.content.strip()
-            if content.startswith("```json"):
-                content = content[7:]
-            if content.startswith("```"):
-                content = content[3:]
-            if content.endswith("```"):
-                content = content[:-3]
-            
-            data = json.loads(content.strip())
-        except json.JSONDecodeError:
-            # Fallback if JSON parsing fails
-            data = {
-                "description": response.content,
-                "requirements": request.skills,
-                "nice_to_have": [],
-            }
+        # Parse JSON response (repairing locally rather than regenerating)
+        with track_stage("/ai/job-draft", "json_parse"):
+            data, _ = parse_structured(
+                response.content,
+                JobDraftOutput,
+                lambda: JobDraftOutput(
+                    description=response.content,
+                    requirements=request.skills,
+                ),
+            )
+        
+        get_usage_ledger().record_call(
+            "job_draft", tenant, response.provider, response.model, response.usage
+        )
         
         result = {
-            "description": data.get("description", response.content),
-            "requirements": data.get("requirements", request.skills),
-            "nice_to_have": data.get("nice_to_have", []),
+            "description": data.description,
+            "requirements": data.requirements or request.skills,
+            "nice_to_have": data.nice_to_have,
             "model": response.model,
             "provider": response.provider,
+            "usage": response.usage,
         }
         
         # Cache the result
-        await cache.set("job_draft", cache_data, result)
+        await cache.set(
+            "job_draft", cache_data, result, tags=cache_tags(category=request.category, tenant=tenant)
+        )
         
         return JobDraftResponse(**result, cached=False)
         
+    except DeadlineExceeded as e:
+        logger.error("job_draft_error", error=str(e), deadline_exceeded=True)
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error("job_draft_error", error=str(e))
         raise HTTPException(
@@ -334,6 +661,8 @@ async def generate_cover_letter(
     request: CoverLetterRequest,
     factory: AIProviderFactory = Depends(get_factory),
     cache: AICache = Depends(get_ai_cache),
+    deadline: Deadline = Depends(request_deadline(settings.deadline_completion)),
+    tenant: Optional[str] = Depends(request_tenant),
 ):
     """
     Generate a personalized cover letter for a job application.
@@ -341,27 +670,41 @@ async def generate_cover_letter(
     Tailored to the specific job and freelancer's skills.
     """
     # Check cache
-    cache_data = {
-        "type": "cover_letter",
-        "job_title": request.job_title,
-        "skills": sorted(request.freelancer_skills),
-    }
+    cache_data = cover_letter_key(
+        job_title=request.job_title,
+        job_description=request.job_description,
+        freelancer_name=request.freelancer_name,
+        freelancer_skills=request.freelancer_skills,
+        freelancer_experience=request.freelancer_experience,
+        provider=request.provider,
+    )
     
-    cached = await cache.get("cover_letter", cache_data)
+    with track_stage("/ai/cover-letter", "cache_lookup"):
+        cached = await cache.get("cover_letter", cache_data)
     if cached:
+        get_usage_ledger().record_cache_hit("cover_letter", tenant, cached)
         return CoverLetterResponse(**cached, cached=True)
     
+    # Trim long inputs on token boundaries for the serving model
+    budget = get_prompt_budget(factory.model_for(request.provider))
+    job_description = budget.truncate(
+        request.job_description, settings.cover_letter_job_description_tokens
+    )
+    experience = budget.truncate(
+        request.freelancer_experience, settings.cover_letter_experience_tokens
+    )
+    
     prompt = f"""You are an expert career coach helping freelancers write compelling cover letters.
 
 Write a cover letter for the following application:
 
 **Freelancer:** {request.freelancer_name}
 **Skills:** {', '.join(request.freelancer_skills)}
-{f'**Relevant Experience:** {request.freelancer_experience}' if request.freelancer_experience else ''}
+{f'**Relevant Experience:** {experience}' if experience else ''}
 
 **Applying For:** {request.job_title}
 **Job Description:**
-{request.job_description[:2000]}
+{job_description}
 
 Generate a response in this exact JSON format:
 {{
@@ -379,42 +722,50 @@ Make the cover letter:
     try:
         completion_request = CompletionRequest(
             messages=[Message(role="user", content=prompt)],
-            max_tokens=1500,
+            max_tokens=budget.max_output_tokens(
+                budget.count_messages([prompt]), settings.cover_letter_output_tokens
+            ),
             temperature=0.7,
+            json_mode=True,
         )
         
-        response = await factory.complete(completion_request, request.provider)
+        with track_stage("/ai/cover-letter", "provider_call"):
+            response = await factory.complete(completion_request, request.provider, deadline)
         
-        # Parse JSON response
-        import json
-        try:
-            content = response.content.strip()
-            if content.startswith("```json"):
-                content = content[7:]
-            if content.startswith("```"):
-                content = content[3:]
-            if content.endswith("```"):
-                content = content[:-3]
-            
-            data = json.loads(content.strip())
-        except json.JSONDecodeError:
-            data = {
-                "cover_letter": response.content,
-                "highlights": request.freelancer_skills[:3],
-            }
+        # Parse JSON response (repairing locally rather than regenerating)
+        with track_stage("/ai/cover-letter", "json_parse"):
+            data, _ = parse_structured(
+                response.content,
+                CoverLetterOutput,
+                lambda: CoverLetterOutput(
+                    cover_letter=response.content,
+                    highlights=request.freelancer_skills[:3],
+                ),
+            )
+        
+        get_usage_ledger().record_call(
+            "cover_letter", tenant, response.provider, response.model, response.usage
+        )
         
         result = {
-            "cover_letter": data.get("cover_letter", response.content),
-            "highlights": data.get("highlights", []),
+            "cover_letter": data.cover_letter,
+            "highlights": data.highlights,
             "model": response.model,
             "provider": response.provider,
+            "usage": response.usage,
         }
         
         # Cache the result
-        await cache.set("cover_letter", cache_data, result)
+        await cache.set("cover_letter", cache_data, result, tags=cache_tags(tenant=tenant))
         
         return CoverLetterResponse(**result, cached=False)
         
+    except DeadlineExceeded as e:
+        logger.error("cover_letter_error", error=str(e), deadline_exceeded=True)
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error("cover_letter_error", error=str(e))
         raise HTTPException(
@@ -428,73 +779,400 @@ async def create_embedding(
     request: EmbedRequest,
     factory: AIProviderFactory = Depends(get_factory),
     cache: AICache = Depends(get_ai_cache),
+    deadline: Deadline = Depends(request_deadline(settings.deadline_embedding)),
+    tenant: Optional[str] = Depends(request_tenant),
 ):
     """
     Create a vector embedding for text.
     
-    Used for semantic search and similarity matching.
-    Currently uses OpenAI's text-embedding-3-small model.
+    Used for semantic search and similarity matching. Uses the provider
+    configured for the collection, otherwise OpenAI's
+    text-embedding-3-small model (with the local provider as fallback
+    if enabled).
+    
+    Vectors have the requested dimensions, else the collection's, else
+    EMBEDDING_DIMENSIONS: text-embedding-3 models shorten them natively,
+    other models' vectors are truncated and re-normalized.
     """
+    provider_name = factory.embedding_provider_for(request.collection)
+    dimensions = factory.embedding_dimensions_for(request.collection, request.dimensions)
+    
     # Check cache
-    cache_data = {
-        "type": "embedding",
-        "text": request.text[:100],  # Hash first 100 chars for key
-        "model": request.model or "default",
-    }
+    cache_data = embedding_key(request.text, request.model, provider_name, dimensions)
     
-    cached = await cache.get("embedding", cache_data)
+    with track_stage("/ai/embed", "cache_lookup"):
+        cached = await cache.get("embedding", cache_data)
     if cached:
-        return EmbedResponse(**cached, cached=True)
+        get_usage_ledger().record_cache_hit("embedding", tenant, cached)
+        with track_stage("/ai/embed", "response_encode"):
+            return fast_response(
+                EmbedResponse,
+                embedding=cached["embedding"],
+                dimensions=cached["dimensions"],
+                model=cached["model"],
+                cached=True,
+            )
     
     try:
         embed_request = EmbeddingRequest(
             text=request.text,
             model=request.model,
+            dimensions=dimensions,
         )
         
-        response = await factory.embed(embed_request)
+        with track_stage("/ai/embed", "provider_call"):
+            response = await factory.embed(embed_request, deadline, provider_name)
+        
+        get_usage_ledger().record_call(
+            "embedding", tenant, response.provider, response.model, response.usage
+        )
         
         result = {
             "embedding": response.embedding,
             "dimensions": response.dimensions,
             "model": response.model,
+            "provider": response.provider,
+            "usage": response.usage,
         }
         
-        # Cache the result
-        await cache.set("embedding", cache_data, result)
+        # Cache the result (fallback vectors are from another model: not under this key)
+        if not factory.is_embedding_fallback(response, provider_name):
+            await cache.set("embedding", cache_data, result, tags=cache_tags(tenant=tenant))
         
-        return EmbedResponse(**result, cached=False)
+        with track_stage("/ai/embed", "response_encode"):
+            return fast_response(
+                EmbedResponse,
+                embedding=response.embedding,
+                dimensions=response.dimensions,
+                model=response.model,
+                cached=False,
+            )
+        
+    except NotImplementedError:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Embedding not supported by available providers"
+        )
+    except DeadlineExceeded as e:
+        logger.error("embedding_error", error=str(e), deadline_exceeded=True)
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error("embedding_error", error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Embedding service unavailable: {str(e)}"
+        )
+
+
+@app.post("/ai/embed/batch", response_model=EmbedBatchResponse, tags=["Embeddings"])
+async def create_embeddings(
+    request: EmbedBatchRequest,
+    factory: AIProviderFactory = Depends(get_factory),
+    cache: AICache = Depends(get_ai_cache),
+    deadline: Deadline = Depends(request_deadline(settings.deadline_embedding)),
+    tenant: Optional[str] = Depends(request_tenant),
+):
+    """
+    Create vector embeddings for many texts.
+    
+    Cached embeddings are fetched in one round-trip; only the misses
+    (each distinct text once) go to the provider, in one call. If that
+    call falls back to the local model, the cached texts are embedded
+    with it too, so all vectors of a response are comparable.
+    """
+    provider_name = factory.embedding_provider_for(request.collection)
+    dimensions = factory.embedding_dimensions_for(request.collection, request.dimensions)
+    keys = [embedding_key(text, request.model, provider_name, dimensions) for text in request.texts]
+    
+    with track_stage("/ai/embed/batch", "cache_lookup"):
+        results = await cache.get_many("embedding", keys)
+    
+    ledger = get_usage_ledger()
+    hits = 0
+    misses = {}
+    for index, (key, result) in enumerate(zip(keys, results)):
+        if result is not None:
+            hits += 1
+            ledger.record_cache_hit("embedding", tenant, result)
+        else:
+            # Texts that differ only in whitespace share one key and one call
+            misses.setdefault(key["text"], []).append(index)
+    
+    groups = list(misses.values())
+    new_indexes = {index for indexes in groups for index in indexes}
+    try:
+        if groups:
+            with track_stage("/ai/embed/batch", "provider_call"):
+                # One provider call, so all new vectors come from the same model
+                response = await factory.embed_batch(
+                    EmbeddingBatchRequest(
+                        texts=[request.texts[indexes[0]] for indexes in groups],
+                        model=request.model,
+                        dimensions=dimensions,
+                    ),
+                    deadline,
+                    provider_name,
+                )
+                fallback = factory.is_embedding_fallback(response, provider_name)
+                if fallback and hits:
+                    # Cached vectors are from the requested model: embed those texts with the fallback too
+                    ledger.record_call("embedding", tenant, response.provider, response.model, response.usage)
+                    groups = [[index] for index in range(len(request.texts))]
+                    new_indexes = set(range(len(request.texts)))
+                    hits = 0
+                    response = await factory.embed_batch(
+                        EmbeddingBatchRequest(texts=request.texts, model=request.model, dimensions=dimensions),
+                        deadline,
+                        response.provider,
+                    )
+            ledger.record_call("embedding", tenant, response.provider, response.model, response.usage)
+            
+            budget = get_prompt_budget(request.model or settings.embedding_model)
+            new_entries = []
+            for indexes, embedding in zip(groups, response.embeddings):
+                tokens = budget.count(request.texts[indexes[0]])
+                result = {
+                    "embedding": embedding,
+                    "dimensions": response.dimensions,
+                    "model": response.model,
+                    "provider": response.provider,
+                    # Per-text share of the batch usage (estimated)
+                    "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+                }
+                # Fallback vectors are from another model: not under these keys
+                if not fallback:
+                    new_entries.append((keys[indexes[0]], result))
+                for index in indexes:
+                    results[index] = result
+            await cache.set_many("embedding", new_entries, tags=cache_tags(tenant=tenant))
+        
+    except NotImplementedError:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Embedding not supported by available providers"
+        )
+    except DeadlineExceeded as e:
+        logger.error("embedding_error", error=str(e), deadline_exceeded=True)
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error("embedding_error", error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Embedding service unavailable: {str(e)}"
+        )
+    
+    with track_stage("/ai/embed/batch", "response_encode"):
+        return fast_response(
+            EmbedBatchResponse,
+            embeddings=[
+                {
+                    "embedding": result["embedding"],
+                    "dimensions": result["dimensions"],
+                    "model": result["model"],
+                    "cached": index not in new_indexes,
+                }
+                for index, result in enumerate(results)
+            ],
+            cached=hits,
+        )
+
+
+@app.post("/ai/embed/document", response_model=EmbedDocumentResponse, tags=["Embeddings"])
+async def create_document_embedding(
+    request: EmbedDocumentRequest,
+    factory: AIProviderFactory = Depends(get_factory),
+    cache: AICache = Depends(get_ai_cache),
+    deadline: Deadline = Depends(request_deadline(settings.deadline_embedding)),
+    tenant: Optional[str] = Depends(request_tenant),
+):
+    """
+    Create a vector embedding for a long document.
+    
+    The text is split into token-bounded, overlapping chunks that follow
+    its paragraphs. Chunks are cached like /ai/embed texts, so after an
+    edit only the changed chunks are embedded, in one provider call. The
+    document vector pools the chunk vectors (token-weighted mean by
+    default); include_chunks also returns the chunk vectors for
+    chunk-level search.
+    """
+    provider_name = factory.embedding_provider_for(request.collection)
+    dimensions = factory.embedding_dimensions_for(request.collection, request.dimensions)
+    
+    with track_stage("/ai/embed/document", "chunking"):
+        chunks = chunk_text(
+            request.text,
+            request.chunk_tokens or settings.embedding_chunk_tokens,
+            request.overlap_tokens if request.overlap_tokens is not None else settings.embedding_chunk_overlap_tokens,
+            request.model or settings.embedding_model,
+        )
+    if not chunks:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Document has no text to embed"
+        )
+    keys = [embedding_key(chunk.text, request.model, provider_name, dimensions) for chunk in chunks]
+    
+    with track_stage("/ai/embed/document", "cache_lookup"):
+        results = await cache.get_many("embedding", keys)
+    
+    ledger = get_usage_ledger()
+    misses = {}
+    for index, (key, result) in enumerate(zip(keys, results)):
+        if result is not None:
+            ledger.record_cache_hit("embedding", tenant, result)
+        else:
+            misses.setdefault(key["text"], []).append(index)
+    cached_chunks = len(chunks) - sum(len(indexes) for indexes in misses.values())
+    
+    try:
+        groups = list(misses.values())
+        if groups:
+            with track_stage("/ai/embed/document", "provider_call"):
+                response = await factory.embed_batch(
+                    EmbeddingBatchRequest(
+                        texts=[chunks[indexes[0]].text for indexes in groups],
+                        model=request.model,
+                        dimensions=dimensions,
+                    ),
+                    deadline,
+                    provider_name,
+                )
+                fallback = factory.is_embedding_fallback(response, provider_name)
+                if fallback and cached_chunks:
+                    # Cached chunks are from the requested model: embed them with the fallback too
+                    ledger.record_call("embedding", tenant, response.provider, response.model, response.usage)
+                    groups = [[index] for index in range(len(chunks))]
+                    cached_chunks = 0
+                    response = await factory.embed_batch(
+                        EmbeddingBatchRequest(
+                            texts=[chunk.text for chunk in chunks], model=request.model, dimensions=dimensions
+                        ),
+                        deadline,
+                        response.provider,
+                    )
+            ledger.record_call("embedding", tenant, response.provider, response.model, response.usage)
+            
+            new_entries = []
+            for indexes, embedding in zip(groups, response.embeddings):
+                tokens = chunks[indexes[0]].tokens
+                result = {
+                    "embedding": embedding,
+                    "dimensions": response.dimensions,
+                    "model": response.model,
+                    "provider": response.provider,
+                    # Per-chunk share of the batch usage (estimated)
+                    "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+                }
+                if not fallback:
+                    new_entries.append((keys[indexes[0]], result))
+                for index in indexes:
+                    results[index] = result
+            await cache.set_many("embedding", new_entries, tags=cache_tags(tenant=tenant))
         
     except NotImplementedError:
         raise HTTPException(
             status_code=status.HTTP_501_NOT_IMPLEMENTED,
             detail="Embedding not supported by available providers"
         )
+    except DeadlineExceeded as e:
+        logger.error("embedding_error", error=str(e), deadline_exceeded=True)
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error("embedding_error", error=str(e))
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail=f"Embedding service unavailable: {str(e)}"
         )
+    
+    with track_stage("/ai/embed/document", "pooling"):
+        embedding = pool_embeddings(
+            [result["embedding"] for result in results],
+            [chunk.tokens for chunk in chunks],
+            request.pooling,
+        )
+    
+    with track_stage("/ai/embed/document", "response_encode"):
+        return fast_response(
+            EmbedDocumentResponse,
+            embedding=embedding,
+            dimensions=len(embedding),
+            model=results[0]["model"],
+            chunk_count=len(chunks),
+            cached_chunks=cached_chunks,
+            chunks=[
+                {
+                    "index": chunk.index,
+                    "start": chunk.start,
+                    "end": chunk.end,
+                    "tokens": chunk.tokens,
+                    "embedding": result["embedding"],
+                }
+                for chunk, result in zip(chunks, results)
+            ] if request.include_chunks else None,
+        )
 
 
 @app.post("/ai/semantic-search", response_model=SemanticSearchResponse, tags=["Search"])
 async def semantic_search(
     request: SemanticSearchRequest,
     factory: AIProviderFactory = Depends(get_factory),
+    deadline: Deadline = Depends(request_deadline(settings.deadline_embedding)),
+    tenant: Optional[str] = Depends(request_tenant),
 ):
     """
     Perform semantic search using vector similarity.
     
     Compares query embedding against provided embeddings
-    using cosine similarity and returns top-k results.
+    using cosine similarity and returns top-k results. With `documents`
+    the embeddings are chunks and the top-k documents are returned, each
+    scored by its best chunk.
     """
     import numpy as np
     
+    if request.documents is not None and len(request.documents) != len(request.embeddings):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="documents must have one entry per embedding"
+        )
+    stored_dimensions = {len(embedding) for embedding in request.embeddings}
+    if len(stored_dimensions) > 1:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Embeddings must have the same dimensions"
+        )
+    
     try:
         # Generate embedding for query
-        embed_request = EmbeddingRequest(text=request.query)
-        query_response = await factory.embed(embed_request)
+        # Match the stored vectors, which may have been shortened
+        embed_request = EmbeddingRequest(
+            text=request.query,
+            dimensions=request.dimensions or (len(request.embeddings[0]) if request.embeddings else None),
+        )
+        with track_stage("/ai/semantic-search", "provider_call"):
+            # The fallback model's vectors are not comparable with the stored ones
+            query_response = await factory.embed(
+                embed_request, deadline, factory.embedding_provider_for(request.collection), allow_fallback=False
+            )
+        get_usage_ledger().record_call(
+            "semantic_search", tenant, query_response.provider, query_response.model, query_response.usage
+        )
+        if stored_dimensions and stored_dimensions != {query_response.dimensions}:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=(
+                    f"Query embedding from {query_response.model} has {query_response.dimensions} dimensions, "
+                    f"the embeddings searched have {stored_dimensions.pop()}"
+                ),
+            )
         query_embedding = np.array(query_response.embedding)
         
         # Calculate cosine similarity with all embeddings
@@ -512,25 +1190,42 @@ async def semantic_search(
             else:
                 similarity = 0.0
             
-            results.append(SemanticSearchResult(
-                index=i,
-                score=float(similarity)
-            ))
+            results.append((i, float(similarity)))
         
         # Sort by score and take top-k
-        results.sort(key=lambda x: x.score, reverse=True)
-        top_results = results[:request.top_k]
+        results.sort(key=lambda x: x[1], reverse=True)
+        if request.documents is not None:
+            # Chunk-level search: each document ranks by its best chunk
+            seen = set()
+            top_results = []
+            for i, score in results:
+                document = request.documents[i]
+                if document not in seen:
+                    seen.add(document)
+                    top_results.append({"index": document, "score": score, "chunk": i})
+        else:
+            top_results = [{"index": index, "score": score} for index, score in results]
         
-        return SemanticSearchResponse(
-            results=top_results,
-            query_embedding=query_response.embedding,
-        )
+        with track_stage("/ai/semantic-search", "response_encode"):
+            return fast_response(
+                SemanticSearchResponse,
+                results=top_results[:request.top_k],
+                query_embedding=query_embedding,
+            )
         
+    except HTTPException:
+        raise
     except NotImplementedError:
         raise HTTPException(
             status_code=status.HTTP_501_NOT_IMPLEMENTED,
             detail="Embeddings not supported by available providers"
         )
+    except DeadlineExceeded as e:
+        logger.error("semantic_search_error", error=str(e), deadline_exceeded=True)
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error("semantic_search_error", error=str(e))
         raise HTTPException(
@@ -539,6 +1234,409 @@ async def semantic_search(
         )
 
 
+@app.post("/ai/duplicates/search", response_model=DuplicateSearchResponse, tags=["Search"])
+async def search_duplicates(
+    request: DuplicateSearchRequest,
+    tenant: Optional[str] = Depends(request_tenant),
+):
+    """
+    Find near-duplicate jobs or proposals.
+    
+    Looks the text's MinHash signature up in the collection's LSH index,
+    so the cost depends on the number of candidates rather than on the
+    number of indexed items. With insert_id the text is indexed after the
+    search (check-then-add in one call). The index is kept in Redis and
+    shared by all workers; without Redis the endpoint returns 503.
+    """
+    try:
+        index = await get_dedup_index(request.collection, tenant)
+        with track_stage("/ai/duplicates/search", "signature"):
+            signature = await index.signature_async(request.text)
+        with track_stage("/ai/duplicates/search", "lsh_query"):
+            candidates = await index.query(
+                signature,
+                request.threshold if request.threshold is not None else settings.dedup_threshold,
+                request.limit,
+                exclude={request.exclude_id, request.insert_id} - {None},
+            )
+        if request.insert_id:
+            await index.insert(request.insert_id, signature)
+        indexed = await index.count()
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    except DedupUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    return DuplicateSearchResponse(
+        candidates=[DuplicateCandidate(id=item_id, similarity=similarity) for item_id, similarity in candidates],
+        indexed=indexed,
+    )
+
+
+@app.put("/ai/duplicates/{collection}/{item_id}", response_model=DuplicateItemResponse, tags=["Search"])
+async def index_duplicate_item(
+    collection: DuplicateCollection,
+    item_id: str,
+    request: DuplicateItemRequest,
+    tenant: Optional[str] = Depends(request_tenant),
+):
+    """Add or replace a job or proposal in the duplicate index."""
+    try:
+        index = await get_dedup_index(collection, tenant)
+        await index.insert(item_id, await index.signature_async(request.text))
+        indexed = await index.count()
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    except DedupUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    return DuplicateItemResponse(id=item_id, collection=collection, indexed=indexed)
+
+
+@app.delete("/ai/duplicates/{collection}/{item_id}", response_model=DuplicateItemResponse, tags=["Search"])
+async def remove_duplicate_item(
+    collection: DuplicateCollection,
+    item_id: str,
+    tenant: Optional[str] = Depends(request_tenant),
+):
+    """Remove a job or proposal from the duplicate index."""
+    try:
+        index = await get_dedup_index(collection, tenant)
+        removed = await index.remove(item_id)
+        indexed = await index.count()
+    except DedupUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    if not removed:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item not indexed")
+    return DuplicateItemResponse(id=item_id, collection=collection, indexed=indexed)
+
+
+@app.post("/ai/clusters/jobs", response_model=ClusterJobsResponse, tags=["Search"])
+async def add_cluster_jobs(
+    request: ClusterJobsRequest,
+    factory: AIProviderFactory = Depends(get_factory),
+    deadline: Deadline = Depends(request_deadline(settings.deadline_embedding)),
+    tenant: Optional[str] = Depends(request_tenant),
+):
+    """
+    Add jobs to the category/skill clusters.
+    
+    Jobs with a stored embedding are used as is; the others are embedded
+    in one provider call. Clusters are fitted once enough jobs have been
+    buffered, then updated incrementally with every batch. The model is
+    kept in Redis and shared by all workers; without Redis the endpoint
+    returns 503.
+    """
+    clusters = await get_job_clusters()
+    embedded = [job for job in request.jobs if job.embedding]
+    texts = [job for job in request.jobs if not job.embedding]
+    if any(not job.text for job in texts):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Each job needs an embedding or a text"
+        )
+    if len({len(job.embedding) for job in embedded}) > 1:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Embeddings must have the same dimensions"
+        )
+    
+    try:
+        # Fail before paying for embeddings if the clusters cannot be updated
+        await clusters.refresh()
+        if embedded:
+            await clusters.add(
+                [job.embedding for job in embedded],
+                request.model or settings.embedding_model,
+                [job.category for job in embedded],
+                [job.skills for job in embedded],
+            )
+        if texts:
+            with track_stage("/ai/clusters/jobs", "provider_call"):
+                response = await factory.embed_batch(
+                    EmbeddingBatchRequest(
+                        texts=[job.text for job in texts],
+                        dimensions=factory.embedding_dimensions_for("jobs"),
+                    ),
+                    deadline,
+                    factory.embedding_provider_for("jobs"),
+                    # Fallback vectors would not match the clusters' model
+                    allow_fallback=False,
+                )
+            get_usage_ledger().record_call(
+                "clustering", tenant, response.provider, response.model, response.usage
+            )
+            await clusters.add(
+                response.embeddings,
+                response.model,
+                [job.category for job in texts],
+                [job.skills for job in texts],
+            )
+    except ClusterMismatch as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    except ClustersUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except DeadlineExceeded as e:
+        logger.error("clustering_error", error=str(e), deadline_exceeded=True)
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(e))
+    except Exception as e:
+        logger.error("clustering_error", error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Embedding service unavailable: {str(e)}"
+        )
+    
+    return ClusterJobsResponse(added=len(request.jobs), jobs=clusters.jobs, ready=clusters.ready)
+
+
+@app.post("/ai/job-draft/suggestions", response_model=JobSuggestionResponse, tags=["AI Generation"])
+async def suggest_job_fields(
+    request: JobSuggestionRequest,
+    factory: AIProviderFactory = Depends(get_factory),
+    cache: AICache = Depends(get_ai_cache),
+    deadline: Deadline = Depends(request_deadline(settings.deadline_embedding)),
+    tenant: Optional[str] = Depends(request_tenant),
+):
+    """
+    Suggest a category and skills for a job draft.
+    
+    The draft is embedded and compared with the job cluster centroids
+    only (a few hundred dot products); the categories and skills of the
+    nearest clusters are returned, weighted by similarity. While Redis is
+    down, the model last loaded by this worker is used.
+    """
+    clusters = await get_job_clusters()
+    try:
+        await clusters.refresh()
+    except ClustersUnavailable as e:
+        if not clusters.ready:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+        logger.warning("clusters_refresh_failed", error=str(e))
+    if not clusters.ready:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Job clusters are not fitted yet ({clusters.jobs}/{clusters.init_points} jobs)"
+        )
+    
+    text = request.title if not request.description else f"{request.title}\n\n{request.description}"
+    provider_name = factory.embedding_provider_for("jobs")
+    dimensions = factory.embedding_dimensions_for("jobs")
+    cache_data = embedding_key(text, None, provider_name, dimensions)
+    
+    with track_stage("/ai/job-draft/suggestions", "cache_lookup"):
+        result = await cache.get("embedding", cache_data)
+    if result:
+        get_usage_ledger().record_cache_hit("embedding", tenant, result)
+    else:
+        try:
+            with track_stage("/ai/job-draft/suggestions", "provider_call"):
+                response = await factory.embed(
+                    EmbeddingRequest(text=text, dimensions=dimensions), deadline, provider_name, allow_fallback=False
+                )
+        except DeadlineExceeded as e:
+            logger.error("suggestion_error", error=str(e), deadline_exceeded=True)
+            raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(e))
+        except Exception as e:
+            logger.error("suggestion_error", error=str(e))
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Embedding service unavailable: {str(e)}"
+            )
+        get_usage_ledger().record_call("embedding", tenant, response.provider, response.model, response.usage)
+        result = {
+            "embedding": response.embedding,
+            "dimensions": response.dimensions,
+            "model": response.model,
+            "provider": response.provider,
+            "usage": response.usage,
+        }
+        await cache.set("embedding", cache_data, result, tags=cache_tags(tenant=tenant))
+    
+    try:
+        clusters.check_vectors(result["model"], result["dimensions"])
+    except ClusterMismatch as e:
+        # e.g. EMBEDDING_COLLECTIONS changed since the clusters were fitted
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    
+    with track_stage("/ai/job-draft/suggestions", "nearest_centroids"):
+        suggestions = clusters.suggest(result["embedding"], settings.clustering_suggest_clusters, request.limit)
+    return suggestions
+
+
+@app.post(
+    "/ai/batch/jobs",
+    response_model=BatchJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    tags=["Batch"],
+)
+async def create_batch_job(
+    request: BatchJobRequest,
+    tenant: Optional[str] = Depends(request_tenant),
+):
+    """
+    Submit many generation requests as one asynchronous job.
+    
+    Items are validated up front, persisted in Redis Streams and processed
+    by background workers. Poll the job or stream its events for results.
+    """
+    if len(request.items) > settings.batch_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch jobs are limited to {settings.batch_max_items} items"
+        )
+    
+    items = batch_jobs.validate_items(request.kind, request.items)
+    try:
+        return await batch_jobs.submit_job(request.kind, items, tenant)
+    except BatchUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+
+@app.get("/ai/batch/jobs/{job_id}", response_model=BatchJobResponse, tags=["Batch"])
+async def get_batch_job(job_id: str, include_results: bool = False):
+    """Get batch job progress, optionally with per-item results."""
+    try:
+        job = await batch_jobs.get_job(job_id, include_results)
+    except BatchUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Batch job not found")
+    return job
+
+
+@app.get("/ai/batch/jobs/{job_id}/events", tags=["Batch"])
+async def stream_batch_job(job_id: str, last_event_id: Optional[str] = Header(None)):
+    """
+    Stream batch job progress as Server-Sent Events.
+    
+    Emits one `item` event per finished item and a final `done` event.
+    Reconnecting clients resume from Last-Event-ID.
+    """
+    try:
+        job = await batch_jobs.get_job(job_id)
+    except BatchUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Batch job not found")
+    
+    return StreamingResponse(
+        batch_jobs.stream_events(job_id, last_event_id or "0"),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+# ============================================================================
+# Admin Endpoints
+# ============================================================================
+
+@app.get("/admin/usage", tags=["Admin"], dependencies=[Depends(require_admin)])
+async def usage_report(days: int = Query(1, ge=1, le=90)):
+    """
+    Token usage and estimated cost.
+    
+    Totals for the last `days` days (UTC), broken down by endpoint,
+    provider, model and tenant, including cost avoided by cache hits.
+    """
+    return await get_usage_ledger().report(days)
+
+
+@app.get("/admin/clusters", tags=["Admin"], dependencies=[Depends(require_admin)])
+async def cluster_report(top_skills: int = Query(5, ge=1, le=20)):
+    """Job clusters, largest first, labelled with their top skills."""
+    clusters = await get_job_clusters()
+    try:
+        await clusters.refresh(force=True)
+    except ClustersUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    return clusters.summary(top_skills)
+
+
+@app.delete("/admin/cache", tags=["Admin"], dependencies=[Depends(require_admin)])
+async def clear_cache(
+    prefix: Optional[str] = Query(None, description="Cache prefix, e.g. job_draft or embedding"),
+    category: Optional[str] = Query(None, description="Job category, e.g. Web Development"),
+    tenant: Optional[str] = Query(None, description="Tenant id, as sent in the tenant header"),
+    cache: AICache = Depends(get_ai_cache),
+):
+    """
+    Invalidate cached AI responses.
+    
+    With `category` or `tenant`, removes the entries tagged with it (the
+    tag is built like at write time, so category spelling and case do not
+    matter); otherwise removes all entries, or those of one `prefix`.
+    Returns 503 while Redis is down: only the serving worker's local cache
+    could be cleared (each worker clears it when it reconnects).
+    
+    Entries are shared across tenants (the cache key does not include the
+    tenant) and are tagged with the tenant that wrote them, so `tenant`
+    removes only those entries, not everything the tenant was served.
+    """
+    if category and tenant:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Give either category or tenant, not both"
+        )
+    if not cache.connected:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Cache unavailable"
+        )
+    tags = cache_tags(category=category, tenant=tenant)
+    if tags:
+        deleted = await cache.invalidate_tag(tags[0])
+    else:
+        deleted = await cache.clear_all(prefix)
+    return {"deleted": deleted}
+
+
+@app.post(
+    "/admin/profile",
+    tags=["Admin"],
+    dependencies=[Depends(require_admin)],
+    response_class=PlainTextResponse,
+)
+async def profile_worker(
+    seconds: float = Query(10.0, gt=0),
+    interval_ms: float = Query(settings.profiler_interval_ms, ge=1, le=1000),
+    mode: str = Query("all", pattern="^(all|cpu|tasks)$"),
+):
+    """
+    Sample the stacks of the worker serving this request.
+    
+    Returns collapsed stacks for flamegraph tools. "cpu" keeps thread
+    stacks (where CPU time goes), "tasks" keeps asyncio task await chains
+    (where requests wait). Each call profiles one worker only.
+    """
+    if seconds > settings.profiler_max_seconds:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Profiles are limited to {settings.profiler_max_seconds} seconds"
+        )
+    try:
+        return await profiler.profile(seconds, interval_ms / 1000, mode)
+    except profiler.ProfilerBusy as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+
+# ============================================================================
+# Batch Handlers
+# ============================================================================
+
+async def _batch_job_draft(request: JobDraftRequest, tenant: Optional[str]) -> JobDraftResponse:
+    return await generate_job_draft(
+        request, get_ai_factory(), await get_cache(), Deadline(settings.deadline_completion), tenant
+    )
+
+
+async def _batch_cover_letter(request: CoverLetterRequest, tenant: Optional[str]) -> CoverLetterResponse:
+    return await generate_cover_letter(
+        request, get_ai_factory(), await get_cache(), Deadline(settings.deadline_completion), tenant
+    )
+
+
+batch_jobs.register_handler("job_draft", JobDraftRequest, _batch_job_draft)
+batch_jobs.register_handler("cover_letter", CoverLetterRequest, _batch_cover_letter)
+
+
 # ============================================================================
 # Run with Uvicorn
 # ============================================================================
@@ -0,0 +1,252 @@
+"""
+Carphatian AI Microservice - Prometheus Metrics
+
+Request, stage, cache and provider metrics exposed on /metrics.
+
+Works with uvicorn's multi-process workers: when PROMETHEUS_MULTIPROC_DIR
+is set (it must be set before this module is imported, and emptied before
+the workers start), every worker writes its samples to that directory
+and /metrics aggregates them across workers.
+
+Built by Carphatian
+"""
+
+import functools
+import inspect
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, List, Optional
+
+from fastapi.routing import APIRoute
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from tracing import span
+
+
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+# Generation calls take seconds; cache and parsing take microseconds
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0,
+)
+
+
+REQUEST_LATENCY = Histogram(
+    "ai_request_duration_seconds",
+    "HTTP request latency by endpoint",
+    ["method", "endpoint", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "ai_requests_in_flight",
+    "Requests currently being handled",
+    ["endpoint"],
+    multiprocess_mode="livesum",
+)
+STAGE_LATENCY = Histogram(
+    "ai_stage_duration_seconds",
+    "Latency of request stages (request_parse, cache_lookup, provider_call, json_parse, response_encode, serialization)",
+    ["endpoint", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    "ai_cache_requests_total",
+    "Cache lookups by key prefix and result (hit, miss, error)",
+    ["prefix", "result"],
+)
+CACHE_REDIS_CONNECTED = Gauge(
+    "ai_cache_redis_connected",
+    "1 while the worker is connected to Redis, 0 while it uses the local fallback cache",
+    multiprocess_mode="liveall",
+)
+PROVIDER_ERRORS = Counter(
+    "ai_provider_errors_total",
+    "Failed provider calls after retries",
+    ["provider", "operation"],
+)
+PROVIDER_RETRIES = Counter(
+    "ai_provider_retries_total",
+    "Provider call retries",
+    ["provider"],
+)
+PROVIDER_FALLBACKS = Counter(
+    "ai_provider_fallbacks_total",
+    "Requests that moved on from a failed provider to the next one",
+    ["from_provider"],
+)
+HTTP_POOL_WAIT = Histogram(
+    "ai_http_pool_wait_seconds",
+    "Time provider requests waited for a pooled connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+HTTP_POOL_NEW_CONNECTIONS = Counter(
+    "ai_http_pool_new_connections_total",
+    "New TCP connections opened to provider APIs",
+)
+STRUCTURED_OUTPUT = Counter(
+    "ai_structured_output_total",
+    "Structured output parse outcomes (parsed, repaired, fallback)",
+    ["schema", "outcome"],
+)
+RATE_LIMITED = Counter(
+    "ai_rate_limited_total",
+    "Requests rejected by the rate limiter",
+    ["endpoint"],
+)
+LOOP_LAG = Gauge(
+    "ai_event_loop_lag_seconds",
+    "Smoothed event loop lag per worker",
+    multiprocess_mode="liveall",
+)
+LOOP_LAG_SECONDS = Histogram(
+    "ai_event_loop_lag_sample_seconds",
+    "Event loop lag samples",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LOAD_SHED = Counter(
+    "ai_load_shed_total",
+    "Requests rejected while the event loop was overloaded",
+    ["endpoint"],
+)
+
+
+@contextmanager
+def track_stage(endpoint: str, stage: str) -> Iterator[None]:
+    """Time a block as one stage of an endpoint (also recorded as a trace span)."""
+    start = time.perf_counter()
+    try:
+        with span(stage):
+            yield
+    finally:
+        STAGE_LATENCY.labels(endpoint, stage).observe(time.perf_counter() - start)
+
+
+def route_label(scope: Scope) -> str:
+    """
+    Route path template for a request (e.g. /ai/batch/jobs/{job_id}).
+
+    Keeps label cardinality bounded: unknown paths share one label.
+    """
+    app = scope.get("app")
+    for route in getattr(getattr(app, "router", None), "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency and in-flight requests."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = route_label(scope)
+        in_flight = REQUESTS_IN_FLIGHT.labels(endpoint)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            REQUEST_LATENCY.labels(scope["method"], endpoint, str(status_code)).observe(
+                time.perf_counter() - start
+            )
+
+
+# [endpoint started, endpoint returned] for the request being handled
+_endpoint_timing: ContextVar[Optional[List[Optional[float]]]] = ContextVar(
+    "endpoint_timing", default=None
+)
+
+
+class MetricsRoute(APIRoute):
+    """
+    Route that times the work FastAPI does around an endpoint.
+
+    Records "request_parse" (body decoding, validation and dependencies)
+    and "serialization" (response validation and encoding) stages.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        if inspect.iscoroutinefunction(endpoint):
+            original = endpoint
+
+            @functools.wraps(original)
+            async def endpoint(*args: Any, **kw: Any) -> Any:
+                timing = _endpoint_timing.get()
+                if timing is not None:
+                    timing[0] = time.perf_counter()
+                try:
+                    return await original(*args, **kw)
+                finally:
+                    if timing is not None:
+                        timing[1] = time.perf_counter()
+
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        label = self.path
+
+        async def timed_handler(request: Request) -> Response:
+            timing: List[Optional[float]] = [None, None]
+            token = _endpoint_timing.set(timing)
+            start = time.perf_counter()
+            try:
+                response = await handler(request)
+            finally:
+                _endpoint_timing.reset(token)
+                if timing[0] is not None:
+                    STAGE_LATENCY.labels(label, "request_parse").observe(timing[0] - start)
+            if timing[1] is not None:
+                STAGE_LATENCY.labels(label, "serialization").observe(time.perf_counter() - timing[1])
+            return response
+
+        return timed_handler
+
+
+def render_metrics() -> Response:
+    """Render all metrics, aggregated across workers in multi-process mode."""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        data = generate_latest(registry)
+    else:
+        from prometheus_client import REGISTRY
+        data = generate_latest(REGISTRY)
+    return Response(content=data, media_type=CONTENT_TYPE_LATEST)
+
+
+def mark_worker_dead() -> None:
+    """Drop this worker's live gauges when it shuts down."""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
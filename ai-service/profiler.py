@@ -0,0 +1,223 @@
+"""
+Carphatian AI Microservice - Sampling Profiler
+
+On-demand statistical profiler for a live worker, using only the stdlib.
+
+A background thread samples the Python stack of every thread at a fixed
+interval (sys._current_frames), which catches CPU-bound code running on
+the event loop thread even while the loop is blocked. When the loop is
+responsive, the await chains of all asyncio tasks are sampled too,
+showing where requests are waiting.
+
+Output is in collapsed-stack format ("frame;frame;frame count" per line),
+ready for flamegraph.pl, speedscope or inferno. Profiles are taken via
+POST /admin/profile or by sending SIGUSR2 to a worker, which writes the
+profile to PROFILER_OUTPUT_DIR.
+
+Built by Carphatian
+"""
+
+import asyncio
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+from typing import Iterator, List, Optional
+
+import structlog
+
+from config import get_settings
+
+logger = structlog.get_logger()
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Task stacks are sampled once per this many thread samples
+TASK_SAMPLE_EVERY = 10
+
+
+class ProfilerBusy(RuntimeError):
+    """Raised when a profile is requested while another one is running."""
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    if filename.startswith(SERVICE_DIR):
+        filename = os.path.relpath(filename, SERVICE_DIR)
+    elif "site-packages" in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[1]
+    else:
+        filename = os.path.basename(filename)
+    name = getattr(code, "co_qualname", code.co_name)
+    # ";" separates frames in collapsed stacks
+    return f"{name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _walk(frame: Optional[FrameType]) -> List[str]:
+    """Frame labels from the outermost caller to `frame`."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def _await_chain(coro) -> Iterator[FrameType]:
+    """Frames of a suspended coroutine and everything it is awaiting."""
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is not None:
+            yield frame
+        coro = (
+            getattr(coro, "cr_await", None)
+            or getattr(coro, "gi_yieldfrom", None)
+            or getattr(coro, "ag_await", None)
+        )
+
+
+class StackSampler:
+    """
+    Samples thread stacks (and asyncio task await chains) into counts.
+
+    Args:
+        interval: Seconds between samples
+        loop: Event loop whose tasks are sampled (None for threads only)
+    """
+
+    def __init__(self, interval: float, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.interval = interval
+        self.loop = loop
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._task_sample_pending = False
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        return self.counts
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or names.get(ident) == "signal-profiler":
+                    continue
+                stack = [f"thread:{names.get(ident, ident)}"] + _walk(frame)
+                self.counts[";".join(stack)] += 1
+            self.samples += 1
+
+            # Task stacks must be read on the loop thread; skip if it is busy
+            if self.loop and self.samples % TASK_SAMPLE_EVERY == 0 and not self._task_sample_pending:
+                self._task_sample_pending = True
+                self.loop.call_soon_threadsafe(self._sample_tasks)
+
+    def _sample_tasks(self) -> None:
+        self._task_sample_pending = False
+        for task in asyncio.all_tasks(self.loop):
+            frames = list(_await_chain(task.get_coro()))
+            if not frames:
+                continue
+            stack = [f"task:{task.get_name()}"] + [_frame_label(frame) for frame in frames]
+            # Weighted to be comparable with thread samples
+            self.counts[";".join(stack)] += TASK_SAMPLE_EVERY
+
+
+def collapse(counts: Counter, mode: str = "all") -> str:
+    """Collapsed stacks, most frequent first; mode "cpu" or "tasks" filters."""
+    prefix = {"cpu": "thread:", "tasks": "task:"}.get(mode, "")
+    return "\n".join(
+        f"{stack} {count}" for stack, count in counts.most_common() if stack.startswith(prefix)
+    ) + "\n"
+
+
+# One profile at a time per worker
+_active = threading.Lock()
+
+
+async def profile(seconds: float, interval: float, mode: str = "all") -> str:
+    """
+    Profile this worker for `seconds` and return collapsed stacks.
+
+    Raises:
+        ProfilerBusy: If a profile is already running
+    """
+    if not _active.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running in this worker")
+    try:
+        sampler = StackSampler(interval, asyncio.get_running_loop())
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            counts = await asyncio.to_thread(sampler.stop)
+        logger.info(
+            "profile_completed",
+            seconds=round(time.perf_counter() - started, 2),
+            samples=sampler.samples,
+            stacks=len(counts),
+        )
+        return collapse(counts, mode)
+    finally:
+        _active.release()
+
+
+def _profile_to_file(seconds: float, interval: float) -> None:
+    """Sample threads for `seconds` and write the profile (signal path)."""
+    try:
+        sampler = StackSampler(interval)
+        sampler.start()
+        time.sleep(seconds)
+        counts = sampler.stop()
+        path = os.path.join(
+            get_settings().profiler_output_dir,
+            f"profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.collapsed",
+        )
+        with open(path, "w") as f:
+            f.write(collapse(counts))
+        logger.info("profile_written", path=path, samples=sampler.samples)
+    except Exception as e:
+        logger.error("profile_failed", error=str(e))
+    finally:
+        _active.release()
+
+
+def install_signal_handler() -> None:
+    """
+    Profile the worker on SIGUSR2.
+
+    Uses a plain signal handler rather than loop.add_signal_handler so it
+    fires even while the event loop is pinned by CPU-bound code. Thread
+    stacks only: task stacks need a responsive loop.
+    """
+    settings = get_settings()
+    if not settings.profiler_signal_enabled or not hasattr(signal, "SIGUSR2"):
+        return
+    if threading.current_thread() is not threading.main_thread():
+        return
+
+    def handler(signum, frame) -> None:
+        if not _active.acquire(blocking=False):
+            return
+        threading.Thread(
+            target=_profile_to_file,
+            args=(settings.profiler_signal_seconds, settings.profiler_interval_ms / 1000),
+            name="signal-profiler",
+            daemon=True,
+        ).start()
+
+    signal.signal(signal.SIGUSR2, handler)
+    logger.info("profiler_signal_installed", signal="SIGUSR2", pid=os.getpid())
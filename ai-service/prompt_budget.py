@@ -0,0 +1,190 @@
+"""
+Carphatian AI Microservice - Prompt Budgeting
+
+Token-aware sizing of prompts and completions.
+
+Counts tokens with tiktoken for the model that will serve the request,
+trims long inputs on token boundaries, and picks max_tokens from the
+expected output size instead of a fixed ceiling.
+
+Built by Carphatian
+"""
+
+import hashlib
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+
+import structlog
+from cachetools import LRUCache
+
+from config import get_settings
+
+logger = structlog.get_logger()
+
+
+# Context windows by model name prefix (longest prefix wins)
+MODEL_CONTEXT_WINDOWS: Dict[str, int] = {
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+    "claude-3": 200000,
+    "llama-3.1": 131072,
+    "llama3": 8192,
+    "mixtral": 32768,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Tokenizer per model name prefix; non-OpenAI models are estimated with
+# cl100k_base, which is close enough for budgeting.
+MODEL_ENCODINGS: Dict[str, str] = {
+    "gpt-4o": "o200k_base",
+    "gpt-4": "cl100k_base",
+    "gpt-3.5-turbo": "cl100k_base",
+}
+DEFAULT_ENCODING = "cl100k_base"
+
+# Average characters per token, used until an encoding is loaded
+CHARS_PER_TOKEN = 4
+
+# Tokens reserved for chat formatting overhead per message
+MESSAGE_OVERHEAD_TOKENS = 8
+
+# Loaded tiktoken encodings by name. Loading may download BPE files, so it
+# only happens in preload_encodings() at startup, never on a request.
+_encodings: Dict[str, object] = {}
+
+# Token counts keyed by (encoding, text hash)
+_token_counts: LRUCache = LRUCache(maxsize=10000)
+
+
+def _lookup(table: Dict[str, object], model: str, default):
+    matches = [prefix for prefix in table if model.startswith(prefix)]
+    return table[max(matches, key=len)] if matches else default
+
+
+def encoding_name_for(model: str) -> str:
+    """Tokenizer name used to budget a model."""
+    return _lookup(MODEL_ENCODINGS, model, DEFAULT_ENCODING)
+
+
+def context_window_for(model: str) -> int:
+    """Context window size of a model in tokens."""
+    return _lookup(MODEL_CONTEXT_WINDOWS, model, DEFAULT_CONTEXT_WINDOW)
+
+
+def preload_encodings(models: List[str]) -> List[str]:
+    """
+    Load tiktoken encodings for the given models.
+
+    Blocking (may fetch BPE files); call from a thread during startup.
+    Models whose encoding cannot be loaded fall back to cl100k_base, and
+    to a character estimate if that is unavailable too.
+
+    Returns:
+        Names of the encodings now loaded
+    """
+    import tiktoken
+
+    for name in {encoding_name_for(model) for model in models} | {DEFAULT_ENCODING}:
+        if name in _encodings:
+            continue
+        try:
+            _encodings[name] = tiktoken.get_encoding(name)
+        except Exception as e:
+            logger.warning("tiktoken_encoding_unavailable", encoding=name, error=str(e))
+    logger.info("tiktoken_encodings_loaded", encodings=sorted(_encodings))
+    return sorted(_encodings)
+
+
+class PromptBudget:
+    """Token counting and trimming for one model."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.context_window = context_window_for(model)
+        name = encoding_name_for(model)
+        if name not in _encodings:
+            name = DEFAULT_ENCODING
+        self.encoding_name = name
+        self.encoding = _encodings.get(name)
+
+    def count(self, text: str) -> int:
+        """Count tokens in text, cached by content hash."""
+        if not text:
+            return 0
+        if self.encoding is None:
+            return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+        key = (self.encoding_name, hashlib.sha1(text.encode()).digest())
+        count = _token_counts.get(key)
+        if count is None:
+            count = len(self.encoding.encode(text, disallowed_special=()))
+            _token_counts[key] = count
+        return count
+
+    def count_messages(self, contents: List[str]) -> int:
+        """Count prompt tokens for a list of chat message contents."""
+        return sum(self.count(text) + MESSAGE_OVERHEAD_TOKENS for text in contents)
+
+    def truncate(self, text: Optional[str], max_tokens: int) -> Optional[str]:
+        """
+        Trim text to at most max_tokens tokens.
+
+        Cuts on a token boundary, then backs off to the last whitespace so
+        words are not split. Short texts are returned unchanged.
+        """
+        if not text or self.count(text) <= max_tokens:
+            return text
+
+        if self.encoding is None:
+            trimmed = text[:max_tokens * CHARS_PER_TOKEN]
+        else:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            trimmed = self.encoding.decode(tokens[:max_tokens])
+
+        match = re.search(r"\s\S*$", trimmed)
+        if match and match.start() > len(trimmed) // 2:
+            trimmed = trimmed[:match.start()]
+        return trimmed.rstrip()
+
+    def windows(self, text: str, max_tokens: int) -> List[Tuple[int, int]]:
+        """
+        Split text into consecutive (start, end) character spans of at most
+        max_tokens tokens each, cut on token boundaries.
+
+        For runs without whitespace (URLs, hashes, encoded data) that
+        truncate() cannot cut between words.
+        """
+        if self.encoding is None:
+            step = max_tokens * CHARS_PER_TOKEN
+            return [(start, min(start + step, len(text))) for start in range(0, len(text), step)]
+
+        _, offsets = self.encoding.decode_with_offsets(self.encoding.encode(text, disallowed_special=()))
+        bounds = sorted(set(offsets[::max_tokens]) | {0, len(text)})
+        spans = []
+        for start, end in zip(bounds, bounds[1:]):
+            # A span can tokenize differently on its own; split it again if it grew
+            if self.count(text[start:end]) > max_tokens and end - start > 1:
+                spans.extend((start + a, start + b) for a, b in self.windows(text[start:end], max_tokens))
+            else:
+                spans.append((start, end))
+        return spans
+
+    def max_output_tokens(self, prompt_tokens: int, expected_output: int) -> int:
+        """
+        Choose max_tokens for a completion.
+
+        Allows the expected output size plus a safety margin, bounded by
+        what is left of the context window after the prompt.
+        """
+        settings = get_settings()
+        wanted = math.ceil(expected_output * (1 + settings.output_token_margin))
+        available = self.context_window - prompt_tokens
+        return max(1, min(wanted, available))
+
+
+def get_prompt_budget(model: str) -> PromptBudget:
+    """Get a budget for a model (cheap; encodings are shared)."""
+    return PromptBudget(model)
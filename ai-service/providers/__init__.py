@@ -11,11 +11,14 @@ from .base import (
     CompletionResponse,
     EmbeddingRequest,
     EmbeddingResponse,
+    EmbeddingBatchRequest,
+    EmbeddingBatchResponse,
+    truncate_embedding,
 )
-from .openai_provider import OpenAIProvider
-from .anthropic_provider import AnthropicProvider
-from .groq_provider import GroqProvider
+from .deadline import Deadline, DeadlineExceeded
 from .factory import AIProviderFactory, get_ai_factory
+from .key_pool import KeyPool, KeyPoolExhausted
+from .http_pool import get_http_client, warm_http_pool, close_http_client, pool_stats
 
 __all__ = [
     "BaseAIProvider",
@@ -24,9 +27,35 @@ __all__ = [
     "CompletionResponse",
     "EmbeddingRequest",
     "EmbeddingResponse",
+    "EmbeddingBatchRequest",
+    "EmbeddingBatchResponse",
+    "truncate_embedding",
     "OpenAIProvider",
     "AnthropicProvider",
     "GroqProvider",
+    "LocalEmbeddingProvider",
+    "Deadline",
+    "DeadlineExceeded",
     "AIProviderFactory",
     "get_ai_factory",
+    "KeyPool",
+    "KeyPoolExhausted",
+    "get_http_client",
+    "warm_http_pool",
+    "close_http_client",
+    "pool_stats",
 ]
+
+# Provider classes import their SDKs, so they are loaded on first access
+_LAZY_PROVIDERS = {
+    "OpenAIProvider": "openai",
+    "AnthropicProvider": "anthropic",
+    "GroqProvider": "groq",
+    "LocalEmbeddingProvider": "local",
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY_PROVIDERS:
+        return AIProviderFactory.resolve(_LAZY_PROVIDERS[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
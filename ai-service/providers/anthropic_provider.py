@@ -17,6 +17,8 @@ from .base import (
     EmbeddingRequest, 
     EmbeddingResponse
 )
+from .http_pool import get_http_client
+from .key_pool import KeyPool, parse_list
 from config import get_settings
 
 logger = structlog.get_logger()
@@ -34,12 +36,24 @@ class AnthropicProvider(BaseAIProvider):
         self.model = settings.anthropic_model
         self.client: Optional[AsyncAnthropic] = None
         
-        if self.api_key:
-            self.client = AsyncAnthropic(api_key=self.api_key)
+        # One client per key/base URL; retries are handled by the factory
+        self.pool = KeyPool.build(
+            self.name,
+            lambda key, url: AsyncAnthropic(
+                api_key=key,
+                base_url=url,
+                http_client=get_http_client(),
+                max_retries=0,
+            ),
+            parse_list(settings.anthropic_api_keys, settings.anthropic_api_key),
+            parse_list(settings.anthropic_base_urls),
+        )
+        if self.pool:
+            self.client = self.pool.members[0].client
     
     async def is_available(self) -> bool:
-        """Check if Anthropic is configured."""
-        return self.client is not None
+        """Check if Anthropic is configured and has an unthrottled key."""
+        return self.client is not None and self.pool.has_capacity()
     
     async def complete(self, request: CompletionRequest) -> CompletionResponse:
         """Generate completion using Claude model."""
@@ -57,6 +71,11 @@ class AnthropicProvider(BaseAIProvider):
             else:
                 messages.append({"role": m.role, "content": m.content})
         
+        # No native JSON mode: prefill the reply so it starts as an object
+        prefill = "{" if request.json_mode and messages and messages[-1]["role"] == "user" else ""
+        if prefill:
+            messages.append({"role": "assistant", "content": prefill})
+        
         logger.info(
             "anthropic_completion_request",
             model=self.model,
@@ -64,11 +83,13 @@ class AnthropicProvider(BaseAIProvider):
             max_tokens=request.max_tokens
         )
         
-        response = await self.client.messages.create(
-            model=self.model,
-            max_tokens=request.max_tokens,
-            system=system_message if system_message else None,
-            messages=messages,
+        response = await self.pool.request(
+            lambda client: client.messages.with_raw_response.create(
+                model=self.model,
+                max_tokens=request.max_tokens,
+                system=system_message if system_message else None,
+                messages=messages,
+            )
         )
         
         usage = {
@@ -80,7 +101,7 @@ class AnthropicProvider(BaseAIProvider):
         logger.info("anthropic_completion_response", usage=usage)
         
         # Extract text content from response
-        content = ""
+        content = prefill
         for block in response.content:
             if hasattr(block, 'text'):
                 content += block.text
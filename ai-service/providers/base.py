@@ -6,6 +6,7 @@ Abstract base class for all AI providers.
 Built by Carphatian
 """
 
+import asyncio
 from abc import ABC, abstractmethod
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
@@ -23,6 +24,7 @@ class CompletionRequest(BaseModel):
     max_tokens: int = 2000
     temperature: float = 0.7
     stream: bool = False
+    json_mode: bool = False  # ask for a single JSON object where supported
 
 
 class CompletionResponse(BaseModel):
@@ -37,6 +39,7 @@ class EmbeddingRequest(BaseModel):
     """Request for text embedding."""
     text: str
     model: Optional[str] = None
+    dimensions: Optional[int] = None  # shorter output, where the model supports it natively
 
 
 class EmbeddingResponse(BaseModel):
@@ -44,6 +47,39 @@ class EmbeddingResponse(BaseModel):
     embedding: List[float]
     model: str
     dimensions: int
+    provider: Optional[str] = None
+    usage: Dict[str, int] = {}  # tokens used
+
+
+class EmbeddingBatchRequest(BaseModel):
+    """Request for embedding several texts in one call."""
+    texts: List[str]
+    model: Optional[str] = None
+    dimensions: Optional[int] = None
+
+
+class EmbeddingBatchResponse(BaseModel):
+    """Response from batch embedding (embeddings in request order)."""
+    embeddings: List[List[float]]
+    model: str
+    dimensions: int
+    provider: Optional[str] = None
+    usage: Dict[str, int] = {}  # tokens used by the whole batch
+
+
+def truncate_embedding(embedding: List[float], dimensions: int) -> List[float]:
+    """
+    First `dimensions` components, re-normalized to unit length.
+    
+    Matryoshka-trained models (e.g. OpenAI text-embedding-3) put the most
+    information in the leading components, so this approximates asking
+    the model for fewer dimensions.
+    """
+    if len(embedding) <= dimensions:
+        return embedding
+    head = embedding[:dimensions]
+    norm = sum(value * value for value in head) ** 0.5
+    return [value / norm for value in head] if norm > 0 else head
 
 
 class BaseAIProvider(ABC):
@@ -51,6 +87,7 @@ class BaseAIProvider(ABC):
     
     name: str = "base"
     supports_embeddings: bool = False
+    supports_completions: bool = True
     
     @abstractmethod
     async def complete(self, request: CompletionRequest) -> CompletionResponse:
@@ -62,6 +99,29 @@ class BaseAIProvider(ABC):
         """Generate text embedding."""
         pass
     
+    async def embed_batch(self, request: EmbeddingBatchRequest) -> EmbeddingBatchResponse:
+        """
+        Generate embeddings for several texts.
+        
+        The default makes one concurrent embed() call per text; providers
+        with a batch API override it to make a single call.
+        """
+        responses = await asyncio.gather(*(
+            self.embed(EmbeddingRequest(text=text, model=request.model, dimensions=request.dimensions))
+            for text in request.texts
+        ))
+        usage: Dict[str, int] = {}
+        for response in responses:
+            for name, value in response.usage.items():
+                usage[name] = usage.get(name, 0) + value
+        return EmbeddingBatchResponse(
+            embeddings=[response.embedding for response in responses],
+            model=responses[0].model,
+            dimensions=responses[0].dimensions,
+            provider=responses[0].provider,
+            usage=usage,
+        )
+    
     @abstractmethod
     async def is_available(self) -> bool:
         """Check if provider is available and configured."""
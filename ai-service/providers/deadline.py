@@ -0,0 +1,162 @@
+"""
+Carphatian AI Microservice - Deadlines & Retries
+
+End-to-end request deadlines and jittered retries for provider calls.
+
+Built by Carphatian
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import httpx
+import structlog
+from tenacity import (
+    AsyncRetrying,
+    RetryCallState,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+
+from config import get_settings
+from metrics import PROVIDER_RETRIES
+from tracing import span
+
+logger = structlog.get_logger()
+
+T = TypeVar("T")
+
+# HTTP statuses worth retrying: timeouts, conflicts, throttling and 5xx
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+# SDK exception names shared by openai, anthropic and groq
+RETRYABLE_ERROR_NAMES = {"APITimeoutError", "APIConnectionError"}
+
+
+class DeadlineExceeded(RuntimeError):
+    """Raised when a request runs out of time budget."""
+
+
+class Deadline:
+    """
+    Absolute point in time by which a request must finish.
+
+    Created once per request and passed down through the factory so every
+    retry and fallback attempt shares the same budget.
+    """
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+
+    @classmethod
+    def from_header(cls, value: Optional[str], default: float) -> "Deadline":
+        """
+        Build a deadline from a millisecond budget header.
+
+        Falls back to the endpoint default when the header is missing or
+        invalid, and never exceeds that default.
+        """
+        settings = get_settings()
+        timeout = default
+        if value:
+            try:
+                timeout = min(default, int(value) / 1000)
+            except ValueError:
+                logger.warning("invalid_deadline_header", value=value)
+        return cls(max(0.0, timeout - settings.deadline_safety_margin))
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline (never negative)."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def __repr__(self) -> str:
+        return f"<Deadline remaining={self.remaining():.3f}s>"
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Check whether a provider error is transient and worth retrying."""
+    if isinstance(error, (asyncio.TimeoutError, httpx.TransportError)):
+        return True
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    status_code = getattr(error, "status_code", None)
+    return status_code in RETRYABLE_STATUS_CODES
+
+
+async def call_with_retry(
+    operation: Callable[[], Awaitable[T]],
+    deadline: Deadline,
+    provider: str,
+) -> T:
+    """
+    Run a provider call with jittered exponential backoff.
+
+    Each attempt is bounded by the per-attempt timeout and the remaining
+    deadline, so one hung call cannot use up the whole budget. Only retryable
+    errors are retried, and only while enough budget is left to make
+    another attempt worthwhile.
+
+    Args:
+        operation: Zero-argument coroutine factory performing one attempt
+        deadline: Request deadline shared across attempts
+        provider: Provider name for logging
+
+    Returns:
+        Result of the first successful attempt
+
+    Raises:
+        DeadlineExceeded: If the budget runs out before an attempt succeeds
+    """
+    settings = get_settings()
+    min_attempt = settings.provider_min_attempt_time
+    backoff = wait_random_exponential(
+        multiplier=settings.provider_retry_base_delay,
+        max=settings.provider_retry_max_delay,
+    )
+
+    def stop_at_deadline(retry_state: RetryCallState) -> bool:
+        return deadline.remaining() < min_attempt
+
+    def wait_within_deadline(retry_state: RetryCallState) -> float:
+        return max(0.0, min(backoff(retry_state), deadline.remaining() - min_attempt))
+
+    def log_retry(retry_state: RetryCallState) -> None:
+        PROVIDER_RETRIES.labels(provider).inc()
+        logger.warning(
+            "provider_retry",
+            provider=provider,
+            attempt=retry_state.attempt_number,
+            sleep=round(retry_state.next_action.sleep, 3),
+            error=repr(retry_state.outcome.exception()),
+        )
+
+    retrying = AsyncRetrying(
+        stop=stop_after_attempt(settings.provider_max_attempts) | stop_at_deadline,
+        wait=wait_within_deadline,
+        retry=retry_if_exception(is_retryable),
+        before_sleep=log_retry,
+        reraise=True,
+    )
+
+    async for attempt in retrying:
+        with attempt, span(
+            "provider.attempt", provider=provider, attempt=attempt.retry_state.attempt_number
+        ):
+            remaining = deadline.remaining()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"Deadline exceeded before calling {provider}")
+            try:
+                return await asyncio.wait_for(
+                    operation(), timeout=min(remaining, settings.provider_attempt_timeout)
+                )
+            except asyncio.TimeoutError:
+                if deadline.expired:
+                    raise DeadlineExceeded(f"Deadline exceeded while calling {provider}")
+                raise
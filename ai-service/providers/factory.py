@@ -6,16 +6,32 @@ Dynamic provider selection with fallback mechanism.
 Built by Carphatian
 """
 
-from typing import Dict, List, Optional, Type
+import asyncio
+import importlib
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Type, TypeVar, Union
 import structlog
 
-from .base import BaseAIProvider, CompletionRequest, CompletionResponse, EmbeddingRequest, EmbeddingResponse
-from .openai_provider import OpenAIProvider
-from .anthropic_provider import AnthropicProvider
-from .groq_provider import GroqProvider
+from .base import (
+    BaseAIProvider,
+    CompletionRequest,
+    CompletionResponse,
+    EmbeddingRequest,
+    EmbeddingResponse,
+    EmbeddingBatchRequest,
+    EmbeddingBatchResponse,
+    truncate_embedding,
+)
+from .deadline import Deadline, DeadlineExceeded, call_with_retry
+from config import get_settings
+from metrics import PROVIDER_ERRORS, PROVIDER_FALLBACKS
+from tracing import span
+from usage_ledger import get_usage_ledger
 
 logger = structlog.get_logger()
 
+T = TypeVar("T")
+
 
 class AIProviderFactory:
     """
@@ -25,32 +41,79 @@ class AIProviderFactory:
     Default priority: OpenAI > Anthropic > Groq
     """
     
-    # Available provider classes
-    PROVIDERS: Dict[str, Type[BaseAIProvider]] = {
-        "openai": OpenAIProvider,
-        "anthropic": AnthropicProvider,
-        "groq": GroqProvider,
+    # Available providers by name. Module paths ("module:Class", relative to
+    # this package) are imported only when the provider has an API key, so
+    # workers do not load SDKs they cannot use. Classes may be registered
+    # directly as well.
+    PROVIDERS: Dict[str, Union[str, Type[BaseAIProvider]]] = {
+        "openai": ".openai_provider:OpenAIProvider",
+        "anthropic": ".anthropic_provider:AnthropicProvider",
+        "groq": ".groq_provider:GroqProvider",
+        "local": ".local_embedding_provider:LocalEmbeddingProvider",
     }
     
     # Default priority order
-    DEFAULT_PRIORITY = ["openai", "anthropic", "groq"]
+    DEFAULT_PRIORITY = ["openai", "anthropic", "groq", "local"]
     
     def __init__(self, priority: Optional[List[str]] = None):
         """Initialize factory with provider priority."""
         self.priority = priority or self.DEFAULT_PRIORITY
         self._providers: Dict[str, BaseAIProvider] = {}
+        # Import and init milliseconds per provider (for the startup report)
+        self.init_timings: Dict[str, Dict[str, float]] = {}
         self._initialize_providers()
     
+    @staticmethod
+    def _is_configured(name: str) -> bool:
+        """Whether a provider is enabled and has an API key or base URLs (if it needs one)."""
+        settings = get_settings()
+        if not getattr(settings, f"{name}_enabled", True):
+            return False
+        # Base URLs alone configure key-less self-hosted endpoints (see KeyPool.build)
+        fields = [f"{name}_api_key", f"{name}_api_keys", f"{name}_base_urls"]
+        if not any(hasattr(settings, field) for field in fields):
+            return True
+        return any(getattr(settings, field, None) for field in fields)
+    
+    @classmethod
+    def resolve(cls, name: str) -> Type[BaseAIProvider]:
+        """Provider class for a name, importing its module if needed."""
+        entry = cls.PROVIDERS[name]
+        if isinstance(entry, str):
+            module_path, class_name = entry.split(":")
+            module = importlib.import_module(module_path, package=__package__)
+            entry = getattr(module, class_name)
+        return entry
+    
     def _initialize_providers(self):
-        """Initialize all available providers."""
+        """Initialize configured providers, importing their SDKs on demand."""
         for name in self.priority:
-            if name in self.PROVIDERS:
-                try:
-                    provider = self.PROVIDERS[name]()
-                    self._providers[name] = provider
-                    logger.info("provider_initialized", provider=name)
-                except Exception as e:
-                    logger.warning("provider_init_failed", provider=name, error=str(e))
+            if name not in self.PROVIDERS:
+                continue
+            if isinstance(self.PROVIDERS[name], str) and not self._is_configured(name):
+                logger.info("provider_skipped", provider=name, reason="disabled or no API key or base URL configured")
+                continue
+            try:
+                started = time.perf_counter()
+                provider_class = self.resolve(name)
+                imported = time.perf_counter()
+                self._providers[name] = provider_class()
+                self.init_timings[name] = {
+                    "import_ms": round((imported - started) * 1000, 1),
+                    "init_ms": round((time.perf_counter() - imported) * 1000, 1),
+                }
+                logger.info("provider_initialized", provider=name)
+            except Exception as e:
+                logger.warning("provider_init_failed", provider=name, error=str(e))
+    
+    async def _is_available(self, provider: BaseAIProvider, deadline: Deadline) -> bool:
+        """Check provider availability without overrunning the deadline."""
+        try:
+            with span("provider.available", provider=provider.name):
+                return await asyncio.wait_for(provider.is_available(), timeout=deadline.remaining())
+        except asyncio.TimeoutError:
+            logger.warning("provider_availability_timeout", provider=provider.name)
+            return False
     
     def get_provider(self, name: str) -> Optional[BaseAIProvider]:
         """Get a specific provider by name."""
@@ -60,7 +123,7 @@ class AIProviderFactory:
         """Get the first available provider in priority order."""
         for name in self.priority:
             provider = self._providers.get(name)
-            if provider and await provider.is_available():
+            if provider and provider.supports_completions and await provider.is_available():
                 logger.info("provider_selected", provider=name)
                 return provider
         logger.error("no_available_providers")
@@ -68,7 +131,7 @@ class AIProviderFactory:
     
     async def get_embedding_provider(self) -> Optional[BaseAIProvider]:
         """Get a provider that supports embeddings."""
-        for name in self.priority:
+        for name in self._embedding_order():
             provider = self._providers.get(name)
             if provider and provider.supports_embeddings and await provider.is_available():
                 logger.info("embedding_provider_selected", provider=name)
@@ -76,69 +139,238 @@ class AIProviderFactory:
         logger.error("no_embedding_providers")
         return None
     
+    def _embedding_order(self, allow_fallback: bool = True) -> List[str]:
+        """Embedding providers to try: remote ones by priority, local last if it is a fallback."""
+        order = [name for name in self.priority if name != "local"]
+        if allow_fallback and get_settings().local_embedding_fallback:
+            order.append("local")
+        return order
+    
+    def is_embedding_fallback(
+        self, response: Union[EmbeddingResponse, EmbeddingBatchResponse], provider_name: Optional[str] = None
+    ) -> bool:
+        """Whether a response came from the local fallback tier rather than the requested model."""
+        return provider_name is None and response.provider == "local"
+    
+    @staticmethod
+    def _collection_setting(value: str, collection: Optional[str]) -> Optional[str]:
+        """Value for a collection in a 'name=value,...' setting."""
+        if not collection:
+            return None
+        for entry in value.split(","):
+            name, _, setting = entry.partition("=")
+            if name.strip() == collection and setting.strip():
+                return setting.strip()
+        return None
+    
+    def embedding_provider_for(self, collection: Optional[str]) -> Optional[str]:
+        """Provider configured for a collection in EMBEDDING_COLLECTIONS (None: default routing)."""
+        return self._collection_setting(get_settings().embedding_collections, collection)
+    
+    def embedding_dimensions_for(self, collection: Optional[str], requested: Optional[int] = None) -> int:
+        """Output dimensions: requested, else the collection's, else EMBEDDING_DIMENSIONS."""
+        if requested:
+            return requested
+        configured = self._collection_setting(get_settings().embedding_collection_dimensions, collection)
+        return int(configured) if configured else get_settings().embedding_dimensions
+    
     async def complete(
         self, 
         request: CompletionRequest,
-        preferred_provider: Optional[str] = None
+        preferred_provider: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
     ) -> CompletionResponse:
         """
         Generate completion using best available provider.
         
+        Each provider is retried on transient errors while the deadline
+        allows; fallback providers get whatever budget remains. With
+        cost-aware routing and no preferred provider, the cheapest
+        provider is tried first.
+        
         Args:
             request: Completion request
             preferred_provider: Optional preferred provider name
+            deadline: Request deadline (defaults to the completion deadline)
         
         Returns:
             CompletionResponse from the provider
         
         Raises:
+            DeadlineExceeded: If the deadline passes before any provider succeeds
             RuntimeError: If no providers are available
         """
-        # Try preferred provider first
+        if deadline is None:
+            deadline = Deadline(get_settings().deadline_completion)
+        
+        # Try preferred provider first, then fall through priority list
+        order = list(self.priority)
+        if get_settings().cost_aware_routing and not preferred_provider:
+            order = self._by_expected_cost(order)
         if preferred_provider:
-            provider = self._providers.get(preferred_provider)
-            if provider and await provider.is_available():
-                try:
-                    return await provider.complete(request)
-                except Exception as e:
-                    logger.warning(
-                        "preferred_provider_failed",
-                        provider=preferred_provider,
-                        error=str(e)
-                    )
+            order = [preferred_provider] + [name for name in order if name != preferred_provider]
         
-        # Fall through priority list
-        for name in self.priority:
+        for name in order:
+            if deadline.expired:
+                break
             provider = self._providers.get(name)
-            if provider and await provider.is_available():
+            if provider and provider.supports_completions and await self._is_available(provider, deadline):
                 try:
-                    return await provider.complete(request)
+                    return await call_with_retry(
+                        lambda: provider.complete(request), deadline, name
+                    )
                 except Exception as e:
-                    logger.warning("provider_failed", provider=name, error=str(e))
+                    PROVIDER_ERRORS.labels(name, "complete").inc()
+                    PROVIDER_FALLBACKS.labels(name).inc()
+                    logger.warning(
+                        "preferred_provider_failed" if name == preferred_provider else "provider_failed",
+                        provider=name,
+                        error=str(e),
+                        remaining=round(deadline.remaining(), 3),
+                    )
                     continue
         
+        if deadline.expired:
+            raise DeadlineExceeded("Deadline exceeded before any AI provider succeeded")
         raise RuntimeError("No AI providers available")
     
-    async def embed(self, request: EmbeddingRequest) -> EmbeddingResponse:
+    async def _embed_with_fallback(
+        self,
+        call: Callable[[BaseAIProvider], Awaitable[T]],
+        deadline: Deadline,
+        provider_name: Optional[str],
+        allow_fallback: bool,
+    ) -> T:
+        """Run an embedding call on the first embedding provider that succeeds."""
+        order = [provider_name] if provider_name else self._embedding_order(allow_fallback)
+        candidates = [
+            self._providers[name] for name in order
+            if name in self._providers and self._providers[name].supports_embeddings
+        ]
+        if not candidates:
+            raise RuntimeError(f"No embedding providers available{f' ({provider_name})' if provider_name else ''}")
+        
+        error: Optional[Exception] = None
+        for provider in candidates:
+            if deadline.expired:
+                break
+            if not await self._is_available(provider, deadline):
+                continue
+            try:
+                return await call_with_retry(lambda: call(provider), deadline, provider.name)
+            except Exception as e:
+                PROVIDER_ERRORS.labels(provider.name, "embed").inc()
+                if provider is candidates[-1]:
+                    raise
+                PROVIDER_FALLBACKS.labels(provider.name).inc()
+                logger.warning("embedding_provider_failed", provider=provider.name, error=str(e))
+                error = e
+        
+        if deadline.expired:
+            raise DeadlineExceeded("Deadline exceeded before any embedding provider succeeded")
+        if error is not None:
+            raise error
+        raise RuntimeError("No embedding providers available")
+    
+    async def embed(
+        self,
+        request: EmbeddingRequest,
+        deadline: Optional[Deadline] = None,
+        provider_name: Optional[str] = None,
+        allow_fallback: bool = True,
+    ) -> EmbeddingResponse:
         """
         Generate embedding using available embedding provider.
         
-        Currently only OpenAI supports embeddings.
+        With `provider_name` only that provider is used, since vectors
+        from different models are not comparable. Otherwise remote
+        providers are tried by priority, then the local provider if it is
+        configured as the fallback tier. Vectors longer than
+        `request.dimensions` are truncated and re-normalized.
         
         Args:
             request: Embedding request
+            deadline: Request deadline (defaults to the embedding deadline)
+            provider_name: Provider that must serve the request
+            allow_fallback: False when the vector will be compared with
+                stored vectors, which the fallback model cannot match
         
         Returns:
             EmbeddingResponse with vector
         
         Raises:
+            DeadlineExceeded: If the deadline passes before the call succeeds
             RuntimeError: If no embedding providers are available
         """
-        provider = await self.get_embedding_provider()
-        if not provider:
-            raise RuntimeError("No embedding providers available")
+        if deadline is None:
+            deadline = Deadline(get_settings().deadline_embedding)
+        
+        response = await self._embed_with_fallback(
+            lambda provider: provider.embed(request), deadline, provider_name, allow_fallback
+        )
+        if request.dimensions and response.dimensions > request.dimensions:
+            # The model could not shorten natively
+            response.embedding = truncate_embedding(response.embedding, request.dimensions)
+            response.dimensions = request.dimensions
+        return response
+    
+    async def embed_batch(
+        self,
+        request: EmbeddingBatchRequest,
+        deadline: Optional[Deadline] = None,
+        provider_name: Optional[str] = None,
+        allow_fallback: bool = True,
+    ) -> EmbeddingBatchResponse:
+        """
+        Generate embeddings for several texts in one provider call.
         
-        return await provider.embed(request)
+        Providers are chosen as in embed(); all texts are served by the
+        same provider, so the vectors are comparable.
+        
+        Raises:
+            DeadlineExceeded: If the deadline passes before the call succeeds
+            RuntimeError: If no embedding providers are available
+        """
+        if deadline is None:
+            deadline = Deadline(get_settings().deadline_embedding)
+        
+        response = await self._embed_with_fallback(
+            lambda provider: provider.embed_batch(request), deadline, provider_name, allow_fallback
+        )
+        if request.dimensions and response.dimensions > request.dimensions:
+            response.embeddings = [
+                truncate_embedding(embedding, request.dimensions) for embedding in response.embeddings
+            ]
+            response.dimensions = request.dimensions
+        return response
+    
+    def _by_expected_cost(self, names: List[str]) -> List[str]:
+        """Provider names ordered cheapest first (stable, so ties keep priority)."""
+        ledger = get_usage_ledger()
+        return sorted(
+            names,
+            key=lambda name: ledger.expected_cost(name, getattr(self._providers.get(name), "model", "")),
+        )
+    
+    def models(self) -> List[str]:
+        """Completion models of all configured providers."""
+        return [provider.model for provider in self._providers.values() if hasattr(provider, "model")]
+    
+    def model_for(self, preferred_provider: Optional[str] = None) -> str:
+        """Model expected to serve a completion (used for prompt budgeting)."""
+        for name in [preferred_provider] + self.priority:
+            provider = self._providers.get(name) if name else None
+            if provider and getattr(provider, "client", None) is not None:
+                return provider.model
+        return ""
+    
+    def base_urls(self) -> List[str]:
+        """API base URLs of all configured provider clients (for pool warm-up)."""
+        return [
+            str(member.client.base_url)
+            for provider in self._providers.values()
+            for member in getattr(provider, "pool", [])
+        ]
     
     def list_providers(self) -> Dict[str, bool]:
         """List all providers and their initialization status."""
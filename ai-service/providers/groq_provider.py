@@ -17,6 +17,8 @@ from .base import (
     EmbeddingRequest, 
     EmbeddingResponse
 )
+from .http_pool import get_http_client
+from .key_pool import KeyPool, parse_list
 from config import get_settings
 
 logger = structlog.get_logger()
@@ -34,12 +36,24 @@ class GroqProvider(BaseAIProvider):
         self.model = settings.groq_model
         self.client: Optional[AsyncGroq] = None
         
-        if self.api_key:
-            self.client = AsyncGroq(api_key=self.api_key)
+        # One client per key/base URL; retries are handled by the factory
+        self.pool = KeyPool.build(
+            self.name,
+            lambda key, url: AsyncGroq(
+                api_key=key,
+                base_url=url,
+                http_client=get_http_client(),
+                max_retries=0,
+            ),
+            parse_list(settings.groq_api_keys, settings.groq_api_key),
+            parse_list(settings.groq_base_urls),
+        )
+        if self.pool:
+            self.client = self.pool.members[0].client
     
     async def is_available(self) -> bool:
-        """Check if Groq is configured."""
-        return self.client is not None
+        """Check if Groq is configured and has an unthrottled key."""
+        return self.client is not None and self.pool.has_capacity()
     
     async def complete(self, request: CompletionRequest) -> CompletionResponse:
         """Generate completion using Groq's fast inference."""
@@ -47,6 +61,9 @@ class GroqProvider(BaseAIProvider):
             raise ValueError("Groq client not initialized - API key missing")
         
         messages = [{"role": m.role, "content": m.content} for m in request.messages]
+        extra = {}
+        if request.json_mode:
+            extra["response_format"] = {"type": "json_object"}
         
         logger.info(
             "groq_completion_request",
@@ -55,11 +72,14 @@ class GroqProvider(BaseAIProvider):
             max_tokens=request.max_tokens
         )
         
-        response = await self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            max_tokens=request.max_tokens,
-            temperature=request.temperature,
+        response = await self.pool.request(
+            lambda client: client.chat.completions.with_raw_response.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=request.max_tokens,
+                temperature=request.temperature,
+                **extra,
+            )
         )
         
         usage = {
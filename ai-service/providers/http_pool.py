@@ -0,0 +1,192 @@
+"""
+Carphatian AI Microservice - Shared HTTP Connection Pool
+
+One tuned httpx.AsyncClient per worker, injected into every provider SDK.
+
+Sharing a single pool keeps TLS connections to provider APIs warm across
+providers and requests, and lets us bound connections, keep-alive and
+timeouts in one place.
+
+Built by Carphatian
+"""
+
+import asyncio
+import time
+from typing import Dict, Iterable, Optional
+
+import httpx
+import structlog
+
+from config import get_settings
+from metrics import HTTP_POOL_NEW_CONNECTIONS, HTTP_POOL_WAIT
+from tracing import current_request_id, record_span
+
+logger = structlog.get_logger()
+
+
+# Upper bounds (seconds) of the pool-wait histogram buckets
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class PoolStats:
+    """
+    Connection pool statistics for this worker.
+
+    Pool wait is the time between handing a request to the transport and
+    the first network activity for it: acquiring a pooled connection, or
+    starting a new TCP connect when none is free.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.wait_sum = 0.0
+        self.wait_max = 0.0
+        self.wait_buckets: Dict[float, int] = {bound: 0 for bound in POOL_WAIT_BUCKETS}
+
+    def observe_wait(self, seconds: float) -> None:
+        HTTP_POOL_WAIT.observe(seconds)
+        self.requests += 1
+        self.wait_sum += seconds
+        self.wait_max = max(self.wait_max, seconds)
+        for bound in POOL_WAIT_BUCKETS:
+            if seconds <= bound:
+                self.wait_buckets[bound] += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "pool_wait_avg_ms": round(self.wait_sum / self.requests * 1000, 3) if self.requests else 0.0,
+            "pool_wait_max_ms": round(self.wait_max * 1000, 3),
+            "pool_wait_buckets": {f"le_{bound}": count for bound, count in self.wait_buckets.items()},
+        }
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedTransport(httpx.AsyncHTTPTransport):
+    """
+    HTTP transport that measures pool wait via httpcore trace events.
+
+    Also forwards the current request id to provider APIs.
+    """
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request_id = current_request_id()
+        if request_id:
+            request.headers[get_settings().request_id_header] = request_id
+        started = time.perf_counter()
+        waited = False
+        parent_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: dict) -> None:
+            nonlocal waited
+            if not waited and event_name.endswith(
+                ("connect_tcp.started", "send_request_headers.started")
+            ):
+                waited = True
+                now = time.perf_counter()
+                pool_stats.observe_wait(now - started)
+                record_span("http.pool_wait", started, now, host=request.url.host)
+            if event_name == "connection.connect_tcp.complete":
+                pool_stats.new_connections += 1
+                HTTP_POOL_NEW_CONNECTIONS.inc()
+            if parent_trace is not None:
+                await parent_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        return await super().handle_async_request(request)
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional h2 package."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+# Singleton instance
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get or create the shared provider HTTP client for this worker."""
+    global _client
+    if _client is None:
+        settings = get_settings()
+
+        http2 = settings.http2_enabled
+        if http2 and not _http2_available():
+            logger.warning("http2_unavailable", reason="h2 package not installed")
+            http2 = False
+
+        limits = httpx.Limits(
+            max_connections=settings.http_pool_max_connections,
+            max_keepalive_connections=settings.http_pool_max_keepalive,
+            keepalive_expiry=settings.http_pool_keepalive_expiry,
+        )
+        timeout = httpx.Timeout(
+            connect=settings.http_connect_timeout,
+            read=settings.http_read_timeout,
+            write=settings.http_write_timeout,
+            pool=settings.http_pool_timeout,
+        )
+        _client = httpx.AsyncClient(
+            transport=InstrumentedTransport(limits=limits, http2=http2),
+            timeout=timeout,
+            follow_redirects=True,
+        )
+        logger.info(
+            "http_pool_created",
+            max_connections=limits.max_connections,
+            max_keepalive=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            http2=http2,
+        )
+    return _client
+
+
+async def warm_http_pool(base_urls: Iterable[str], connections: Optional[int] = None) -> int:
+    """
+    Open connections to provider hosts ahead of the first request.
+
+    Sends concurrent lightweight HEAD requests per host so the TCP and TLS
+    handshakes happen during startup rather than on user requests. The
+    response status is irrelevant; errors are logged and ignored.
+
+    Args:
+        base_urls: Provider API base URLs
+        connections: Connections to open per host
+
+    Returns:
+        Number of warm-up requests that reached the host
+    """
+    if connections is None:
+        connections = get_settings().http_pool_warm_connections
+    client = get_http_client()
+    urls = sorted({str(url) for url in base_urls})
+
+    async def ping(url: str) -> bool:
+        try:
+            await client.head(url)
+            return True
+        except Exception as e:
+            logger.warning("http_pool_warm_failed", url=url, error=str(e))
+            return False
+
+    results = await asyncio.gather(*(ping(url) for url in urls for _ in range(connections)))
+    warmed = sum(results)
+    logger.info("http_pool_warmed", hosts=len(urls), connections=warmed)
+    return warmed
+
+
+async def close_http_client() -> None:
+    """Close the shared client and its pooled connections."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,289 @@
+"""
+Carphatian AI Microservice - Provider Key Pools
+
+Spread provider traffic across several API keys or base URLs.
+
+Every pool member is a separate SDK client (one per key and base URL,
+all sharing the worker's HTTP pool). Requests go to the member with the
+most rate-limit headroom, as reported by the provider's rate-limit
+response headers. Members that get throttled are taken out of rotation
+until their limit resets.
+
+Built by Carphatian
+"""
+
+import inspect
+import re
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, List, Optional, Sequence
+from urllib.parse import urlparse
+
+import structlog
+
+from config import get_settings
+
+logger = structlog.get_logger()
+
+
+# Cooldown applied to a member whose key is rejected (401/403)
+AUTH_FAILURE_COOLDOWN = 300.0
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_list(value: Optional[str], primary: Optional[str] = None) -> List[str]:
+    """Split a comma-separated setting, keeping order and dropping duplicates."""
+    items = [primary] if primary else []
+    if value:
+        items.extend(item.strip() for item in value.split(","))
+    return list(dict.fromkeys(item for item in items if item))
+
+
+def parse_reset(value: Optional[str], now: float) -> Optional[float]:
+    """
+    Parse a rate-limit reset header into an absolute wall-clock time.
+
+    Accepts OpenAI/Groq durations ("1s", "6m0s", "250ms"), plain seconds
+    and Anthropic RFC 3339 timestamps.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return now + float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if parts and "".join(n + u for n, u in parts) == value:
+        return now + sum(float(n) * _DURATION_UNITS[u] for n, u in parts)
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def _header(headers: Any, *names: str) -> Optional[str]:
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            return value
+    return None
+
+
+def _int_header(headers: Any, *names: str) -> Optional[int]:
+    value = _header(headers, *names)
+    try:
+        return int(float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+class KeyPoolExhausted(RuntimeError):
+    """Raised when every member of a pool is throttled."""
+
+    # Treated like an upstream 429 so the retry/fallback logic applies
+    status_code = 429
+
+
+class _Budget:
+    """Rate-limit state for one dimension (requests or tokens)."""
+
+    __slots__ = ("limit", "remaining", "reset_at")
+
+    def __init__(self):
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset_at = 0.0
+
+    def update(self, limit: Optional[int], remaining: Optional[int], reset_at: Optional[float]):
+        if limit is not None:
+            self.limit = limit
+        if remaining is not None:
+            self.remaining = remaining
+        if reset_at is not None:
+            self.reset_at = reset_at
+
+    def fraction(self, now: float) -> Optional[float]:
+        """Remaining share of the limit, or None if unknown or reset."""
+        if not self.limit or self.remaining is None or now >= self.reset_at:
+            return None
+        return max(0.0, self.remaining / self.limit)
+
+
+class PoolMember:
+    """One SDK client bound to a single API key and base URL."""
+
+    def __init__(self, client: Any, label: str):
+        self.client = client
+        self.label = label
+        self.requests = _Budget()
+        self.tokens = _Budget()
+        self.cooldown_until = 0.0
+        self.inflight = 0
+
+    def available(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+    def headroom(self, now: float) -> float:
+        """Estimated remaining capacity, discounted by in-flight calls."""
+        fractions = [
+            f for f in (self.requests.fraction(now), self.tokens.fraction(now)) if f is not None
+        ]
+        return (min(fractions) if fractions else 1.0) / (1 + self.inflight)
+
+    def update_from_headers(self, headers: Any) -> None:
+        """Record rate-limit state from OpenAI/Groq or Anthropic response headers."""
+        now = time.time()
+        for kind, budget in (("requests", self.requests), ("tokens", self.tokens)):
+            budget.update(
+                _int_header(headers, f"x-ratelimit-limit-{kind}", f"anthropic-ratelimit-{kind}-limit"),
+                _int_header(headers, f"x-ratelimit-remaining-{kind}", f"anthropic-ratelimit-{kind}-remaining"),
+                parse_reset(
+                    _header(headers, f"x-ratelimit-reset-{kind}", f"anthropic-ratelimit-{kind}-reset"), now
+                ),
+            )
+
+    def throttle(self, headers: Any, default: float) -> float:
+        """Take the member out of rotation until its limit resets."""
+        now = time.time()
+        until = None
+        if headers is not None:
+            retry_after = _header(headers, "retry-after-ms")
+            if retry_after is not None:
+                until = parse_reset(f"{retry_after}ms", now)
+            else:
+                until = parse_reset(_header(headers, "retry-after"), now)
+            if until is None:
+                self.update_from_headers(headers)
+                resets = [b.reset_at for b in (self.requests, self.tokens) if b.remaining == 0]
+                until = max(resets) if resets else None
+        self.cooldown_until = until if until and until > now else now + default
+        return self.cooldown_until - now
+
+    def snapshot(self, now: float) -> dict:
+        return {
+            "member": self.label,
+            "available": self.available(now),
+            "headroom": round(self.headroom(now), 3),
+            "inflight": self.inflight,
+            "cooldown_remaining": round(max(0.0, self.cooldown_until - now), 3),
+        }
+
+
+class KeyPool:
+    """
+    Headroom-aware pool of SDK clients for one provider.
+
+    Calls are routed to the least-loaded available member. Throttled
+    (429) members cool down for the provider's Retry-After or reset
+    time; rejected keys (401/403) cool down for several minutes.
+    """
+
+    def __init__(self, provider: str, members: Sequence[PoolMember]):
+        self.provider = provider
+        self.members = list(members)
+        self._cursor = 0
+
+    @classmethod
+    def build(
+        cls,
+        provider: str,
+        create_client: Callable[[str, Optional[str]], Any],
+        keys: Sequence[str],
+        base_urls: Sequence[str] = (),
+    ) -> "KeyPool":
+        """
+        Create one member per key and base URL.
+
+        Self-hosted OpenAI-compatible endpoints often need no key, so base
+        URLs without any configured key get a placeholder key.
+        """
+        if base_urls and not keys:
+            keys = ["not-needed"]
+        members = []
+        for url in base_urls or [None]:
+            host = urlparse(url).netloc if url else "default"
+            for index, key in enumerate(keys):
+                members.append(PoolMember(create_client(key, url), f"{provider}#{index}@{host}"))
+        return cls(provider, members)
+
+    def __bool__(self) -> bool:
+        return bool(self.members)
+
+    def __iter__(self):
+        return iter(self.members)
+
+    def has_capacity(self) -> bool:
+        now = time.time()
+        return any(member.available(now) for member in self.members)
+
+    def acquire(self) -> PoolMember:
+        """
+        Pick the member with the most headroom.
+
+        Ties are broken round-robin so an idle pool still spreads load.
+
+        Raises:
+            KeyPoolExhausted: If every member is cooling down
+        """
+        now = time.time()
+        count = len(self.members)
+        best: Optional[PoolMember] = None
+        best_headroom = -1.0
+        for offset in range(count):
+            member = self.members[(self._cursor + offset) % count]
+            if not member.available(now):
+                continue
+            headroom = member.headroom(now)
+            if headroom > best_headroom:
+                best, best_headroom = member, headroom
+        if best is None:
+            raise KeyPoolExhausted(f"All {self.provider} keys are rate limited")
+        self._cursor = (self.members.index(best) + 1) % count
+        # Spend one request locally until the next response headers arrive
+        if best.requests.remaining:
+            best.requests.remaining -= 1
+        return best
+
+    async def request(self, operation: Callable[[Any], Awaitable[Any]]) -> Any:
+        """
+        Run a raw-response SDK call on the best member and parse it.
+
+        Args:
+            operation: Takes an SDK client and returns the awaitable
+                `with_raw_response` call
+
+        Returns:
+            The parsed SDK response
+        """
+        settings = get_settings()
+        member = self.acquire()
+        member.inflight += 1
+        try:
+            raw = await operation(member.client)
+        except Exception as e:
+            status_code = getattr(e, "status_code", None)
+            response = getattr(e, "response", None)
+            if status_code == 429:
+                cooldown = member.throttle(
+                    getattr(response, "headers", None), settings.key_pool_throttle_cooldown
+                )
+                logger.warning("provider_key_throttled", member=member.label, cooldown=round(cooldown, 3))
+            elif status_code in (401, 403):
+                member.cooldown_until = time.time() + AUTH_FAILURE_COOLDOWN
+                logger.error("provider_key_rejected", member=member.label, status=status_code)
+            raise
+        finally:
+            member.inflight -= 1
+        member.update_from_headers(raw.headers)
+        # Some SDK versions return an async parser (e.g. groq)
+        parsed = raw.parse()
+        if inspect.isawaitable(parsed):
+            parsed = await parsed
+        return parsed
+
+    def snapshot(self) -> List[dict]:
+        now = time.time()
+        return [member.snapshot(now) for member in self.members]
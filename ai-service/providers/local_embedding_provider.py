@@ -0,0 +1,206 @@
+"""
+Carphatian AI Microservice - Local Embedding Provider
+
+Deterministic embeddings computed in-process with NumPy only.
+
+Text is normalized and split into features: character 3-5-grams over the
+word sequence (robust to typos and inflection), words and word bigrams.
+Features are hashed into a fixed number of buckets, weighted by type with
+sublinear term frequency, and mapped to the output dimensions by a fixed
+random +-1 projection (seeded, so every worker and every release with the
+same settings produces identical vectors). Results are L2-normalized, so
+cosine similarity is a dot product.
+
+Quality is well below a trained model for paraphrases, but it needs no
+network, costs nothing and takes about a millisecond, which makes it
+useful for high-volume collections and as a fallback when the remote
+provider is down. Vectors are only comparable with vectors from the same
+model name (which encodes the settings).
+
+Built by Carphatian
+"""
+
+import asyncio
+import hashlib
+import re
+import unicodedata
+from functools import lru_cache
+from typing import List, Tuple
+
+import numpy as np
+import structlog
+
+from .base import (
+    BaseAIProvider,
+    CompletionRequest,
+    CompletionResponse,
+    EmbeddingRequest,
+    EmbeddingResponse,
+    EmbeddingBatchRequest,
+    EmbeddingBatchResponse,
+)
+from config import get_settings
+
+logger = structlog.get_logger()
+
+# Bump when feature extraction changes (part of the model name)
+FEATURE_VERSION = "1"
+
+CHAR_NGRAMS = (3, 4, 5)
+
+# Relative weight of each feature type
+CHAR_WEIGHT = 0.5
+WORD_WEIGHT = 1.0
+BIGRAM_WEIGHT = 0.7
+
+# Longer texts are embedded in a thread to keep the event loop responsive
+INLINE_MAX_CHARS = 2000
+
+_WORD_RE = re.compile(r"\w+")
+
+# Multiplier for polynomial hashing of codepoint windows (odd, 64-bit)
+_BASE = np.uint64(0x100000001B3)
+_POWERS = np.array([_BASE ** np.uint64(i) for i in range(max(CHAR_NGRAMS))], dtype=np.uint64)
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """Finalize 64-bit hashes (splitmix64), spreading low-entropy inputs."""
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def _window_hashes(codepoints: np.ndarray, n: int) -> np.ndarray:
+    """Hash of every window of n codepoints."""
+    windows = np.lib.stride_tricks.sliding_window_view(codepoints, n)
+    return _mix(windows @ _POWERS[:n][::-1] + np.uint64(n))
+
+
+@lru_cache(maxsize=65536)
+def _word_hash(word: str) -> int:
+    return int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+
+
+def extract_features(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Hashed features of a text.
+
+    Returns:
+        (64-bit feature hashes, feature weights)
+    """
+    words = _WORD_RE.findall(unicodedata.normalize("NFKC", text).casefold())
+    if not words:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.float32)
+
+    hashes: List[np.ndarray] = []
+    weights: List[np.ndarray] = []
+
+    # Spaces mark word boundaries inside character n-grams
+    padded = " " + " ".join(words) + " "
+    codepoints = np.frombuffer(padded.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    for n in CHAR_NGRAMS:
+        if len(codepoints) >= n:
+            hashes.append(_window_hashes(codepoints, n))
+            weights.append(np.full(len(codepoints) - n + 1, CHAR_WEIGHT, dtype=np.float32))
+
+    word_hashes = np.array([_word_hash(word) for word in words], dtype=np.uint64)
+    hashes.append(word_hashes)
+    weights.append(np.full(len(words), WORD_WEIGHT, dtype=np.float32))
+    if len(words) > 1:
+        hashes.append(_mix(word_hashes[:-1] * _BASE + word_hashes[1:]))
+        weights.append(np.full(len(words) - 1, BIGRAM_WEIGHT, dtype=np.float32))
+
+    return np.concatenate(hashes), np.concatenate(weights)
+
+
+class HashingEmbedder:
+    """
+    Hashed n-gram features with a fixed random projection.
+
+    Args:
+        dimensions: Output vector size
+        buckets: Hashed feature space size (rows of the projection)
+        seed: Seed of the projection matrix
+    """
+
+    def __init__(self, dimensions: int, buckets: int, seed: int):
+        self.dimensions = dimensions
+        self.buckets = buckets
+        self.seed = seed
+        # +-1 entries stored as int8 (buckets x dimensions bytes)
+        rng = np.random.default_rng(seed)
+        self.projection = (rng.integers(0, 2, size=(buckets, dimensions), dtype=np.int8) * 2 - 1).astype(np.int8)
+
+    @property
+    def model_name(self) -> str:
+        return f"local-hash-v{FEATURE_VERSION}-{self.dimensions}d-{self.buckets}b-s{self.seed}"
+
+    def embed(self, text: str) -> np.ndarray:
+        """Unit-length float32 embedding of `text` (all zeros for text without words)."""
+        hashes, weights = extract_features(text)
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        if not len(hashes):
+            return vector
+        counts = np.bincount((hashes % np.uint64(self.buckets)).astype(np.intp), weights=weights, minlength=self.buckets)
+        active = np.flatnonzero(counts)
+        # Sublinear term frequency
+        vector = np.log1p(counts[active]).astype(np.float32) @ self.projection[active].astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+
+class LocalEmbeddingProvider(BaseAIProvider):
+    """In-process embedding provider (no network, no API key)."""
+
+    name = "local"
+    supports_embeddings = True
+    supports_completions = False
+
+    def __init__(self):
+        settings = get_settings()
+        self.embedder = HashingEmbedder(
+            settings.local_embedding_dimensions,
+            settings.local_embedding_buckets,
+            settings.local_embedding_seed,
+        )
+        self.embedding_model = self.embedder.model_name
+
+    async def is_available(self) -> bool:
+        return True
+
+    async def complete(self, request: CompletionRequest) -> CompletionResponse:
+        raise NotImplementedError("The local provider only supports embeddings")
+
+    async def embed(self, request: EmbeddingRequest) -> EmbeddingResponse:
+        """Embed text in-process (the model in the request is ignored)."""
+        if len(request.text) > INLINE_MAX_CHARS:
+            vector = await asyncio.to_thread(self.embedder.embed, request.text)
+        else:
+            vector = self.embedder.embed(request.text)
+        return EmbeddingResponse(
+            embedding=vector.tolist(),
+            model=self.embedding_model,
+            dimensions=self.embedder.dimensions,
+            provider=self.name,
+            usage={"prompt_tokens": 0, "total_tokens": 0},
+        )
+    
+    async def embed_batch(self, request: EmbeddingBatchRequest) -> EmbeddingBatchResponse:
+        """Embed several texts in-process (in a thread when they are long in total)."""
+        
+        def embed_all() -> List[List[float]]:
+            return [self.embedder.embed(text).tolist() for text in request.texts]
+        
+        if sum(len(text) for text in request.texts) > INLINE_MAX_CHARS:
+            embeddings = await asyncio.to_thread(embed_all)
+        else:
+            embeddings = embed_all()
+        return EmbeddingBatchResponse(
+            embeddings=embeddings,
+            model=self.embedding_model,
+            dimensions=self.embedder.dimensions,
+            provider=self.name,
+            usage={"prompt_tokens": 0, "total_tokens": 0},
+        )
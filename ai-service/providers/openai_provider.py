@@ -15,12 +15,22 @@ from .base import (
     CompletionRequest, 
     CompletionResponse,
     EmbeddingRequest, 
-    EmbeddingResponse
+    EmbeddingResponse,
+    EmbeddingBatchRequest,
+    EmbeddingBatchResponse,
 )
+from .http_pool import get_http_client
+from .key_pool import KeyPool, parse_list
 from config import get_settings
 
 logger = structlog.get_logger()
 
+# Model families that accept response_format={"type": "json_object"}
+JSON_MODE_MODELS = ("gpt-4o", "gpt-4-turbo", "gpt-4-1106", "gpt-4-0125", "gpt-3.5-turbo")
+
+# Embedding models accepting the `dimensions` parameter
+NATIVE_DIMENSIONS_PREFIX = "text-embedding-3"
+
 
 class OpenAIProvider(BaseAIProvider):
     """OpenAI GPT provider with embedding support."""
@@ -35,20 +45,36 @@ class OpenAIProvider(BaseAIProvider):
         self.embedding_model = settings.embedding_model
         self.client: Optional[AsyncOpenAI] = None
         
-        if self.api_key:
-            self.client = AsyncOpenAI(api_key=self.api_key)
+        # One client per key/base URL; retries are handled by the factory
+        self.pool = KeyPool.build(
+            self.name,
+            lambda key, url: AsyncOpenAI(
+                api_key=key,
+                base_url=url,
+                http_client=get_http_client(),
+                max_retries=0,
+            ),
+            parse_list(settings.openai_api_keys, settings.openai_api_key),
+            parse_list(settings.openai_base_urls),
+        )
+        if self.pool:
+            self.client = self.pool.members[0].client
     
     async def is_available(self) -> bool:
         """Check if OpenAI is configured and reachable."""
         if not self.client:
             return False
-        try:
-            # Quick check - list models
-            await self.client.models.list()
-            return True
-        except Exception as e:
-            logger.warning("openai_unavailable", error=str(e))
-            return False
+        # Quick check - list models; a throttled or rejected key is taken
+        # out of rotation by the pool, so move on to the next one
+        for _ in self.pool:
+            try:
+                await self.pool.request(lambda client: client.models.with_raw_response.list())
+                return True
+            except Exception as e:
+                logger.warning("openai_unavailable", error=str(e))
+                if getattr(e, "status_code", None) not in (401, 403, 429):
+                    return False
+        return False
     
     async def complete(self, request: CompletionRequest) -> CompletionResponse:
         """Generate completion using GPT model."""
@@ -56,6 +82,9 @@ class OpenAIProvider(BaseAIProvider):
             raise ValueError("OpenAI client not initialized - API key missing")
         
         messages = [{"role": m.role, "content": m.content} for m in request.messages]
+        extra = {}
+        if request.json_mode and self.model.startswith(JSON_MODE_MODELS):
+            extra["response_format"] = {"type": "json_object"}
         
         logger.info(
             "openai_completion_request",
@@ -64,11 +93,14 @@ class OpenAIProvider(BaseAIProvider):
             max_tokens=request.max_tokens
         )
         
-        response = await self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            max_tokens=request.max_tokens,
-            temperature=request.temperature,
+        response = await self.pool.request(
+            lambda client: client.chat.completions.with_raw_response.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=request.max_tokens,
+                temperature=request.temperature,
+                **extra,
+            )
         )
         
         usage = {
@@ -86,6 +118,13 @@ class OpenAIProvider(BaseAIProvider):
             usage=usage
         )
     
+    @staticmethod
+    def _dimensions_param(model: str, dimensions: Optional[int]) -> dict:
+        """`dimensions` argument where the model shortens natively (text-embedding-3, not ada-002)."""
+        if dimensions and model.startswith(NATIVE_DIMENSIONS_PREFIX):
+            return {"dimensions": dimensions}
+        return {}
+    
     async def embed(self, request: EmbeddingRequest) -> EmbeddingResponse:
         """Generate embedding using OpenAI embedding model."""
         if not self.client:
@@ -99,9 +138,12 @@ class OpenAIProvider(BaseAIProvider):
             text_length=len(request.text)
         )
         
-        response = await self.client.embeddings.create(
-            model=model,
-            input=request.text,
+        response = await self.pool.request(
+            lambda client: client.embeddings.with_raw_response.create(
+                model=model,
+                input=request.text,
+                **self._dimensions_param(model, request.dimensions),
+            )
         )
         
         embedding = response.data[0].embedding
@@ -114,5 +156,45 @@ class OpenAIProvider(BaseAIProvider):
         return EmbeddingResponse(
             embedding=embedding,
             model=model,
-            dimensions=len(embedding)
+            dimensions=len(embedding),
+            provider=self.name,
+            usage={
+                "prompt_tokens": response.usage.prompt_tokens,
+                "total_tokens": response.usage.total_tokens,
+            },
+        )
+    
+    async def embed_batch(self, request: EmbeddingBatchRequest) -> EmbeddingBatchResponse:
+        """Generate embeddings for several texts in one API call."""
+        if not self.client:
+            raise ValueError("OpenAI client not initialized - API key missing")
+        
+        model = request.model or self.embedding_model
+        
+        logger.info(
+            "openai_embedding_batch_request",
+            model=model,
+            texts=len(request.texts),
+            text_length=sum(len(text) for text in request.texts)
+        )
+        
+        response = await self.pool.request(
+            lambda client: client.embeddings.with_raw_response.create(
+                model=model,
+                input=request.texts,
+                **self._dimensions_param(model, request.dimensions),
+            )
+        )
+        
+        embeddings = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        
+        return EmbeddingBatchResponse(
+            embeddings=embeddings,
+            model=model,
+            dimensions=len(embeddings[0]),
+            provider=self.name,
+            usage={
+                "prompt_tokens": response.usage.prompt_tokens,
+                "total_tokens": response.usage.total_tokens,
+            },
         )
@@ -0,0 +1,296 @@
+"""
+Carphatian AI Microservice - Rate Limiting
+
+Token bucket rate limiter keyed per client and per endpoint (route
+template, so /ai/batch/jobs/{job_id} is one endpoint for all job ids).
+
+Client identity headers (X-User-Id, X-API-Key, X-Forwarded-For) are only
+trusted from RATE_LIMIT_TRUSTED_PROXIES or with the shared
+RATE_LIMIT_IDENTITY_SECRET; other requests are keyed by client address,
+so a client cannot get fresh buckets by rotating headers.
+
+Buckets live in Redis and are updated atomically by a Lua script, so all
+workers share one budget per client. When Redis is not connected the
+limiter falls back to an in-process bucket per worker.
+
+Built by Carphatian
+"""
+
+import hashlib
+import hmac
+import ipaddress
+import math
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Union
+
+import structlog
+from cachetools import TTLCache
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from cache import get_cache
+from config import get_settings
+from metrics import RATE_LIMITED, route_label
+
+logger = structlog.get_logger()
+
+
+# KEYS[1] = bucket key
+# ARGV = capacity, refill rate (tokens/sec), now (sec), cost
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil or ts == nil then
+    tokens = capacity
+    ts = now
+end
+
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+
+return {allowed, tostring(tokens)}
+"""
+
+
+@dataclass
+class RateLimitResult:
+    """Outcome of a single bucket check."""
+    allowed: bool
+    limit: int
+    remaining: int
+    reset: int  # seconds until the bucket is full again
+    retry_after: int  # seconds until the next request would be allowed
+
+
+class _LocalBucket:
+    """In-process token bucket used when Redis is unavailable."""
+
+    __slots__ = ("tokens", "ts")
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.ts = now
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter.
+
+    Each bucket holds up to `capacity` tokens and refills at
+    `capacity / window` tokens per second. Every request costs one token.
+    """
+
+    def __init__(self, capacity: Optional[int] = None, window: Optional[int] = None):
+        settings = get_settings()
+        self.capacity = capacity or settings.rate_limit_requests
+        self.window = window or settings.rate_limit_window
+        self.rate = self.capacity / self.window
+        self._script = None
+        self._script_client = None
+        self._local: TTLCache = TTLCache(maxsize=10000, ttl=self.window)
+
+    def _result(self, allowed: bool, tokens: float, cost: int) -> RateLimitResult:
+        """Build a result from the remaining token count."""
+        retry_after = 0 if allowed else math.ceil((cost - tokens) / self.rate)
+        return RateLimitResult(
+            allowed=allowed,
+            limit=self.capacity,
+            remaining=max(0, int(tokens)),
+            reset=math.ceil((self.capacity - tokens) / self.rate),
+            retry_after=retry_after,
+        )
+
+    async def _hit_redis(self, client, key: str, now: float, cost: int) -> RateLimitResult:
+        """Consume tokens from the shared Redis bucket in one round-trip."""
+        if self._script is None or self._script_client is not client:
+            self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+            self._script_client = client
+
+        allowed, tokens = await self._script(
+            keys=[key],
+            args=[self.capacity, self.rate, now, cost],
+        )
+        return self._result(bool(int(allowed)), float(tokens), cost)
+
+    def _hit_local(self, key: str, now: float, cost: int) -> RateLimitResult:
+        """Consume tokens from the per-worker fallback bucket."""
+        bucket = self._local.get(key)
+        if bucket is None:
+            bucket = _LocalBucket(self.capacity, now)
+
+        bucket.tokens = min(self.capacity, bucket.tokens + max(0.0, now - bucket.ts) * self.rate)
+        bucket.ts = now
+
+        allowed = bucket.tokens >= cost
+        if allowed:
+            bucket.tokens -= cost
+
+        # Re-insert so the TTL tracks the last hit
+        self._local[key] = bucket
+        return self._result(allowed, bucket.tokens, cost)
+
+    async def hit(self, identity: str, endpoint: str, cost: int = 1) -> RateLimitResult:
+        """
+        Consume tokens for a client on an endpoint.
+
+        Args:
+            identity: Client identifier (user, API client or IP)
+            endpoint: Route path template
+            cost: Number of tokens to consume
+
+        Returns:
+            RateLimitResult describing the bucket state
+        """
+        key = f"rl:{identity}:{endpoint}"
+        now = time.time()
+
+        cache = await get_cache()
+        if cache._client is not None:
+            try:
+                return await self._hit_redis(cache._client, key, now, cost)
+            except Exception as e:
+                logger.warning("rate_limit_redis_error", error=str(e))
+
+        return self._hit_local(key, now, cost)
+
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def parse_networks(value: str) -> List[Network]:
+    """Parse a comma-separated list of IPs/CIDRs (invalid entries are logged and skipped)."""
+    networks = []
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(entry, strict=False))
+        except ValueError:
+            logger.warning("rate_limit_invalid_proxy", entry=entry)
+    return networks
+
+
+def is_trusted(headers: Headers, scope: Scope, networks: List[Network], secret: Optional[str]) -> bool:
+    """Whether identity headers of a request may be trusted."""
+    if secret:
+        provided = headers.get("x-identity-secret")
+        if provided and hmac.compare_digest(provided.encode(), secret.encode()):
+            return True
+    client = scope.get("client")
+    if not client or not networks:
+        return False
+    try:
+        address = ipaddress.ip_address(client[0])
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+
+def client_identity(headers: Headers, scope: Scope, trusted: bool = False) -> str:
+    """
+    Resolve the rate limit identity for a request.
+
+    From a trusted proxy, prefers the authenticated user id forwarded by
+    the Next.js app, then an API client key (hashed, never stored raw),
+    then the forwarded client address. Otherwise the identity is the
+    connection's client address.
+    """
+    if trusted:
+        user_id = headers.get("x-user-id")
+        if user_id:
+            return f"user:{user_id}"
+
+        api_key = headers.get("x-api-key")
+        if api_key:
+            return f"key:{hashlib.sha256(api_key.encode()).hexdigest()[:16]}"
+
+        # The proxy appends the address it received the request from
+        forwarded = headers.get("x-forwarded-for")
+        if forwarded and forwarded.split(",")[-1].strip():
+            return f"ip:{forwarded.split(',')[-1].strip()}"
+
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware enforcing the token bucket on every HTTP request.
+
+    Adds RateLimit-Limit / RateLimit-Remaining / RateLimit-Reset headers to
+    responses and rejects exhausted clients with 429 and Retry-After.
+    """
+
+    def __init__(self, app: ASGIApp, limiter: Optional[RateLimiter] = None):
+        settings = get_settings()
+        self.app = app
+        self.limiter = limiter or RateLimiter()
+        self.enabled = settings.rate_limit_enabled
+        self.exempt_paths = {
+            path.strip() for path in settings.rate_limit_exempt_paths.split(",") if path.strip()
+        }
+        self.trusted_networks = parse_networks(settings.rate_limit_trusted_proxies)
+        self.identity_secret = settings.rate_limit_identity_secret
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or not self.enabled
+            or scope["method"] == "OPTIONS"
+            or scope["path"] in self.exempt_paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        trusted = is_trusted(headers, scope, self.trusted_networks, self.identity_secret)
+        identity = client_identity(headers, scope, trusted)
+        endpoint = route_label(scope)
+        result = await self.limiter.hit(identity, endpoint)
+
+        rate_headers = [
+            (b"ratelimit-limit", str(result.limit).encode()),
+            (b"ratelimit-remaining", str(result.remaining).encode()),
+            (b"ratelimit-reset", str(result.reset).encode()),
+        ]
+
+        if not result.allowed:
+            RATE_LIMITED.labels(endpoint).inc()
+            logger.warning(
+                "rate_limit_exceeded",
+                identity=identity,
+                path=scope["path"],
+                retry_after=result.retry_after,
+            )
+            response = JSONResponse(
+                status_code=429,
+                content={"detail": "Rate limit exceeded"},
+                headers={"Retry-After": str(result.retry_after)},
+            )
+            response.raw_headers.extend(rate_headers)
+            await response(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + rate_headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -0,0 +1,79 @@
+"""
+Carphatian AI Microservice - Fast Responses
+
+Serialization path for large responses (embeddings, search results).
+
+Returning a pydantic model makes FastAPI validate it against the
+response_model again and encode it with jsonable_encoder and json.dumps,
+which is slow for thousands of floats. Endpoints can instead return
+fast_response(Model, **fields): values are trusted (built by our own
+code), only field names are checked, and the body is encoded with orjson,
+which writes NumPy float arrays straight from their buffers. The route
+keeps its response_model, so the OpenAPI schema is unchanged.
+
+Falls back to the standard json module when orjson is not installed.
+
+Built by Carphatian
+"""
+
+import json
+from typing import Any, Type
+
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    """Encode NumPy arrays and scalars for the json module fallback."""
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode `content` as compact JSON, NumPy arrays included."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded with orjson (NumPy arrays supported)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def fast_response(response_model: Type[BaseModel], /, **fields: Any) -> FastJSONResponse:
+    """
+    Build a response shaped like `response_model` without validating the values.
+
+    Missing optional fields get their defaults; unknown or missing
+    required fields raise, so the body cannot drift from the schema.
+
+    Args:
+        response_model: The route's response_model
+        **fields: Field values (NumPy arrays allowed for float lists)
+
+    Raises:
+        TypeError: If a field is unknown or a required field is missing
+    """
+    model_fields = response_model.model_fields
+    unknown = fields.keys() - model_fields.keys()
+    if unknown:
+        raise TypeError(f"{response_model.__name__} has no fields {sorted(unknown)}")
+
+    content = {}
+    for name, field in model_fields.items():
+        if name in fields:
+            content[name] = fields[name]
+        elif field.is_required():
+            raise TypeError(f"{response_model.__name__} requires field {name!r}")
+        else:
+            content[name] = field.get_default(call_default_factory=True)
+    return FastJSONResponse(content)
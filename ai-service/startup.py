@@ -0,0 +1,60 @@
+"""
+Carphatian AI Microservice - Startup Report
+
+Times how long a worker takes to become ready: module imports, then each
+lifespan phase (providers, cache, pool warm-up, tokenizers, workers), and
+logs them together as one "startup_report" event.
+
+Slow cold starts delay rolling deploys and autoscaling; the report shows
+which phase to look at.
+
+Built by Carphatian
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+
+class StartupReport:
+    """Durations (milliseconds) of the phases of one worker start."""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.started = time.perf_counter()
+
+    def record(self, name: str, seconds: float) -> None:
+        self.phases[name] = round(seconds * 1000, 1)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as phase `name`."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def log(self, **extra) -> None:
+        logger.info(
+            "startup_report",
+            total_ms=round((time.perf_counter() - self.started) * 1000, 1),
+            phases=self.phases,
+            **extra,
+        )
+
+
+# Singleton instance (created on first import, i.e. when main starts loading)
+_report: Optional[StartupReport] = None
+
+
+def get_startup_report() -> StartupReport:
+    """Get or create the startup report for this worker."""
+    global _report
+    if _report is None:
+        _report = StartupReport()
+    return _report
@@ -0,0 +1,224 @@
+"""
+Carphatian AI Microservice - Structured Output
+
+Extraction, repair and validation of JSON produced by LLMs.
+
+Parsing never triggers a new provider call: the first balanced JSON
+object is extracted in a single pass, common defects are repaired
+locally, and the result is validated against an output model. Only when
+all of that fails does the caller get its fallback.
+
+Built by Carphatian
+"""
+
+import json
+import re
+from collections import Counter
+from typing import Callable, List, Optional, Tuple, Type, TypeVar
+
+import structlog
+from pydantic import BaseModel, ValidationError, field_validator
+
+from metrics import STRUCTURED_OUTPUT
+
+logger = structlog.get_logger()
+
+T = TypeVar("T", bound=BaseModel)
+
+# Outcome counters keyed by (schema, outcome): "parsed", "repaired", "fallback"
+# (per worker; ai_structured_output_total aggregates across workers)
+stats: Counter = Counter()
+
+
+# ============================================================================
+# Output Models
+# ============================================================================
+
+def _as_list(value):
+    """Accept a single string or newline/bullet list where a list is expected."""
+    if isinstance(value, str):
+        items = [re.sub(r"^\s*(?:[-*•]|\d+[.)])\s*", "", line) for line in value.splitlines()]
+        return [item.strip() for item in items if item.strip()]
+    return value
+
+
+class JobDraftOutput(BaseModel):
+    """Expected JSON from the job draft prompt."""
+    description: str
+    requirements: List[str] = []
+    nice_to_have: List[str] = []
+
+    @field_validator("requirements", "nice_to_have", mode="before")
+    @classmethod
+    def _split_lists(cls, value):
+        return _as_list(value)
+
+
+class CoverLetterOutput(BaseModel):
+    """Expected JSON from the cover letter prompt."""
+    cover_letter: str
+    highlights: List[str] = []
+
+    @field_validator("highlights", mode="before")
+    @classmethod
+    def _split_lists(cls, value):
+        return _as_list(value)
+
+
+# ============================================================================
+# Extraction & Repair
+# ============================================================================
+
+def extract_json_object(text: str) -> Tuple[Optional[str], bool]:
+    """
+    Find the first balanced JSON object in text in a single pass.
+
+    Skips any prose or code fences before the object and tracks string
+    literals so braces inside strings are ignored.
+
+    Returns:
+        (object text, complete). If the text ends before the object is
+        closed, returns the partial object with complete=False so it can
+        be repaired. (None, False) if there is no object at all.
+    """
+    start = text.find("{")
+    if start == -1:
+        return None, False
+
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1], True
+    return text[start:], False
+
+
+_TRAILING_COMMA_RE = re.compile(r",(\s*[}\]])")
+_PY_LITERAL_RE = re.compile(r"([:,\[]\s*)(True|False|None)(\s*[,}\]])")
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+# An object key left without its value at the end of a truncated fragment
+_DANGLING_KEY_RE = re.compile(r'(?:,|(?<=\{))\s*"(?:[^"\\]|\\.)*"\s*:?\s*$')
+
+
+def _close_truncated(fragment: str) -> str:
+    """Close strings, arrays and objects left open by a truncated response."""
+    stack: List[str] = []
+    in_string = False
+    escaped = False
+    for ch in fragment:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+
+    repaired = fragment
+    if escaped:
+        repaired = repaired[:-1]
+    if in_string:
+        repaired += '"'
+    if stack and stack[-1] == "}":
+        repaired = _DANGLING_KEY_RE.sub("", repaired)
+    repaired = repaired.rstrip().rstrip(",:")
+    return repaired + "".join(reversed(stack))
+
+
+def repair_json(fragment: str, complete: bool) -> str:
+    """
+    Fix common LLM JSON defects.
+
+    Handles Python literals, trailing commas and output cut off by
+    max_tokens. Raw newlines inside strings are accepted by the
+    non-strict decoder and need no repair.
+    """
+    repaired = _PY_LITERAL_RE.sub(
+        lambda m: m.group(1) + _PY_LITERALS[m.group(2)] + m.group(3), fragment
+    )
+    if not complete:
+        repaired = _close_truncated(repaired)
+    return _TRAILING_COMMA_RE.sub(r"\1", repaired)
+
+
+def _validate(text: str, model: Type[T]) -> Optional[T]:
+    """Decode and validate one candidate, or None if it does not fit."""
+    try:
+        data = json.loads(text, strict=False)
+        return model.model_validate(data) if isinstance(data, dict) else None
+    except (json.JSONDecodeError, ValidationError) as e:
+        logger.debug("structured_output_invalid", schema=model.__name__, error=str(e))
+        return None
+
+
+def parse_structured(
+    content: str,
+    model: Type[T],
+    fallback: Callable[[], T],
+) -> Tuple[T, str]:
+    """
+    Parse LLM output into a validated model without regenerating.
+
+    Args:
+        content: Raw completion text
+        model: Output model to validate against
+        fallback: Builds a degraded result when the output is unusable
+
+    Returns:
+        (result, outcome) where outcome is "parsed", "repaired" or "fallback"
+    """
+    schema = model.__name__
+    fragment, complete = extract_json_object(content)
+
+    outcome = "fallback"
+    result: Optional[T] = None
+    if fragment is not None:
+        result = _validate(fragment, model) if complete else None
+        if result is not None:
+            outcome = "parsed"
+        else:
+            result = _validate(repair_json(fragment, complete), model)
+            if result is not None:
+                outcome = "repaired"
+
+    stats[(schema, outcome)] += 1
+    STRUCTURED_OUTPUT.labels(schema, outcome).inc()
+    if outcome == "fallback":
+        logger.warning("structured_output_fallback", schema=schema, length=len(content))
+        return fallback(), outcome
+    if outcome == "repaired":
+        logger.info("structured_output_repaired", schema=schema, truncated=not complete)
+    return result, outcome
+
+
+def snapshot() -> dict:
+    """Outcome counts and rates per schema in this worker (reported by /health)."""
+    report = {}
+    for (schema, outcome), count in stats.items():
+        report.setdefault(schema, {})[outcome] = count
+    for counts in report.values():
+        total = sum(counts.values())
+        counts["repair_rate"] = round(counts.get("repaired", 0) / total, 4)
+        counts["fallback_rate"] = round(counts.get("fallback", 0) / total, 4)
+    return report
@@ -0,0 +1,15 @@
+"""
+Carphatian AI Microservice - Test Setup
+
+Makes the service modules importable from the tests. Install the test
+dependencies and run from ai-service/:
+    pip install -r requirements-test.txt
+    python -m pytest -q tests
+
+Built by Carphatian
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
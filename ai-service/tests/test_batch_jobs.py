@@ -0,0 +1,119 @@
+"""
+Carphatian AI Microservice - Batch Job Tests
+
+Exactly-once recording of redelivered items, items of expired jobs, and
+reclaiming the items of dead consumers in batches, against fakeredis.
+
+Built by Carphatian
+"""
+
+import asyncio
+import json
+
+import pytest
+from pydantic import BaseModel
+
+import batch_jobs
+from batch_jobs import EVENTS_KEY, GROUP_NAME, JOB_KEY, STREAM_KEY, BatchWorker
+from cache import AICache
+from config import get_settings
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+class EchoItem(BaseModel):
+    text: str
+
+
+async def echo(item: EchoItem, tenant):
+    if item.text == "fail":
+        raise ValueError("cannot echo")
+    return item
+
+
+@pytest.fixture
+def client(monkeypatch):
+    cache = AICache()
+    cache._client = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer(), decode_responses=True)
+
+    async def get_cache():
+        return cache
+
+    monkeypatch.setattr(batch_jobs, "get_cache", get_cache)
+    monkeypatch.setitem(batch_jobs.HANDLERS, "echo", batch_jobs.BatchHandler(model=EchoItem, run=echo))
+    return cache._client
+
+
+async def submit(client, texts, consumer: str = "worker-0"):
+    """Submit a job and deliver all its items to one consumer."""
+    job = await batch_jobs.submit_job("echo", [EchoItem(text=text) for text in texts])
+    response = await client.xreadgroup(GROUP_NAME, consumer, {STREAM_KEY: ">"}, count=100)
+    return job["job_id"], response[0][1]
+
+
+async def events(client, job_id: str):
+    return [fields["event"] for _, fields in await client.xrange(EVENTS_KEY.format(job_id))]
+
+
+def test_redelivered_items_are_recorded_once(client):
+    async def run():
+        worker = BatchWorker(concurrency=1)
+        job_id, entries = await submit(client, ["a", "fail", "c"])
+        for entry_id, fields in entries:
+            await worker._process(client, entry_id, fields)
+        # A consumer that died before its ACK gets the item again
+        entry_id, fields = entries[0]
+        await worker._process(client, entry_id, fields)
+
+        job = await batch_jobs.get_job(job_id, include_results=True)
+        assert (job["status"], job["completed"], job["failed"]) == ("completed_with_errors", 2, 1)
+        assert [result["status"] for result in job["results"]] == ["ok", "error", "ok"]
+        assert await events(client, job_id) == ["item", "item", "item", "done"]
+        done = (await client.xrange(EVENTS_KEY.format(job_id)))[-1][1]
+        assert json.loads(done["data"]) == {"status": "completed_with_errors", "completed": 2, "failed": 1}
+        assert await client.xlen(STREAM_KEY) == 0
+
+    asyncio.run(run())
+
+
+def test_items_of_expired_jobs_are_dropped(client):
+    async def run():
+        worker = BatchWorker(concurrency=1)
+        job_id, entries = await submit(client, ["a", "b"])
+        await worker._process(client, *entries[0])
+        await client.delete(JOB_KEY.format(job_id))
+
+        await worker._process(client, *entries[1])
+        # Acked and deleted, without recreating the job hash
+        assert await client.xpending(STREAM_KEY, GROUP_NAME) == {
+            "pending": 0, "min": None, "max": None, "consumers": [],
+        }
+        assert await client.xlen(STREAM_KEY) == 0
+        assert not await client.exists(JOB_KEY.format(job_id))
+
+        # Recording into an expired job does not recreate it either
+        await worker._record(client, job_id, "1", {"status": "ok", "result": {}})
+        assert not await client.exists(JOB_KEY.format(job_id))
+
+    asyncio.run(run())
+
+
+def test_dead_consumer_items_are_claimed_in_batches(client, monkeypatch):
+    monkeypatch.setattr(get_settings(), "batch_claim_idle", 0.0)
+
+    async def run():
+        worker = BatchWorker(concurrency=2)
+        job_id, entries = await submit(client, [f"item {n}" for n in range(25)], consumer="dead")
+        claimed, calls, cursor = [], 0, "0-0"
+        while True:
+            cursor, batch = await worker._claim(client, "worker-0", cursor)
+            claimed.extend(entry_id for entry_id, _ in batch)
+            calls += 1
+            if cursor is None:
+                break
+        assert sorted(claimed) == sorted(entry_id for entry_id, _ in entries)
+        assert calls <= 4
+        pending = await client.xpending(STREAM_KEY, GROUP_NAME)
+        assert [(consumer["name"], consumer["pending"]) for consumer in pending["consumers"]] == [("worker-0", 25)]
+
+    asyncio.run(run())
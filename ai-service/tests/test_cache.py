@@ -0,0 +1,263 @@
+"""
+Carphatian AI Microservice - Cache Tests
+
+Batched reads and writes (chunking, partial failures) against fakeredis,
+and the connection state machine: degraded mode on the local cache,
+outages confirmed by a health ping, and reconnecting (which clears the
+local cache) against a fakeredis TCP server.
+
+Built by Carphatian
+"""
+
+import asyncio
+import threading
+
+import pytest
+import redis.asyncio as redis
+
+from cache import AICache
+from config import get_settings
+from metrics import CACHE_REQUESTS
+
+fakeredis = pytest.importorskip("fakeredis")
+
+BATCH_SIZE = 4
+
+
+def make_cache() -> AICache:
+    cache = AICache()
+    cache.batch_size = BATCH_SIZE
+    cache._client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    return cache
+
+
+def counts(prefix: str) -> dict:
+    return {result: CACHE_REQUESTS.labels(prefix, result)._value.get() for result in ("hit", "miss", "error")}
+
+
+def items(count: int):
+    return [{"text": f"item {number}"} for number in range(count)]
+
+
+def test_get_many_reads_in_chunks():
+    async def run():
+        cache = make_cache()
+        entries = [(data, {"value": number}) for number, data in enumerate(items(10)) if number % 3 == 0]
+        assert await cache.set_many("chunked", entries) == 4
+
+        calls = []
+        mget = cache._client.mget
+
+        async def counting_mget(keys):
+            calls.append(len(keys))
+            return await mget(keys)
+
+        cache._client.mget = counting_mget
+        results = await cache.get_many("chunked", items(10))
+        return calls, results
+
+    calls, results = asyncio.run(run())
+    assert calls == [4, 4, 2]
+    assert [result and result["value"] for result in results] == [0, None, None, 3, None, None, 6, None, None, 9]
+    assert counts("chunked") == {"hit": 4, "miss": 6, "error": 0}
+
+
+def test_get_many_failed_chunk_counts_as_errors_only():
+    async def run():
+        cache = make_cache()
+        await cache.set_many("partial", [(data, {"value": number}) for number, data in enumerate(items(10))])
+
+        mget = cache._client.mget
+        calls = []
+
+        async def flaky_mget(keys):
+            calls.append(1)
+            if len(calls) == 2:
+                raise redis.ResponseError("chunk failed")
+            return await mget(keys)
+
+        cache._client.mget = flaky_mget
+        return cache, await cache.get_many("partial", items(10))
+
+    cache, results = asyncio.run(run())
+    assert [result and result["value"] for result in results] == [0, 1, 2, 3, None, None, None, None, 8, 9]
+    assert counts("partial") == {"hit": 6, "miss": 0, "error": 4}
+    # A bad command is not an outage
+    assert cache.connected
+
+
+def test_set_many_writes_chunks_and_tags():
+    async def run():
+        cache = make_cache()
+        stored = await cache.set_many(
+            "tagged", [(data, {"value": number}) for number, data in enumerate(items(9))], tags=["tenant:acme"]
+        )
+        members = await cache._client.scard(cache._tag_key("tenant:acme"))
+        ttl = await cache._client.ttl(cache._generate_key("tagged", items(9)[0]))
+        return stored, members, ttl, cache
+
+    stored, members, ttl, cache = asyncio.run(run())
+    assert stored == 9 and members == 9
+    assert 0 < ttl <= cache.ttl
+
+
+def test_set_many_skips_failed_chunks():
+    async def run():
+        cache = make_cache()
+        pipeline = cache._client.pipeline
+        calls = []
+
+        def flaky_pipeline(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            calls.append(1)
+            if len(calls) == 1:
+                async def fail(*args, **kwargs):
+                    raise redis.ResponseError("chunk failed")
+                pipe.execute = fail
+            return pipe
+
+        cache._client.pipeline = flaky_pipeline
+        stored = await cache.set_many("skipped", [(data, {"value": number}) for number, data in enumerate(items(10))])
+        cache._client.pipeline = pipeline
+        return stored, await cache.get_many("skipped", items(10))
+
+    stored, results = asyncio.run(run())
+    assert stored == 6
+    assert [result is not None for result in results] == [False] * 4 + [True] * 6
+
+
+def test_batch_operations_use_local_cache_while_down():
+    async def run():
+        cache = make_cache()
+        cache._client = None
+        stored = await cache.set_many("local", [(data, {"value": number}) for number, data in enumerate(items(5))])
+        return stored, await cache.get_many("local", items(6))
+
+    stored, results = asyncio.run(run())
+    assert stored == 5
+    assert [result and result["value"] for result in results] == [0, 1, 2, 3, 4, None]
+
+
+# ============================================================================
+# Connection state
+# ============================================================================
+
+UNREACHABLE_URL = "redis://127.0.0.1:1/0"
+
+
+@pytest.fixture
+def fast_reconnect(monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "redis_connect_timeout", 0.5)
+    monkeypatch.setattr(settings, "redis_reconnect_base_delay", 0.05)
+    monkeypatch.setattr(settings, "redis_reconnect_max_delay", 0.1)
+    monkeypatch.setattr(settings, "redis_health_check_interval", 60.0)
+
+
+@pytest.fixture
+def redis_server():
+    server = fakeredis.TcpFakeServer(("127.0.0.1", 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "redis://127.0.0.1:{}/0".format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+async def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condition not reached"
+        await asyncio.sleep(0.01)
+
+
+def test_degraded_mode_uses_local_cache(fast_reconnect):
+    async def run():
+        cache = AICache()
+        cache.redis_url = UNREACHABLE_URL
+        await cache.connect()
+        try:
+            assert not cache.connected
+            assert await cache.set("degraded", {"q": 1}, {"answer": 42})
+            assert await cache.get("degraded", {"q": 1}) == {"answer": 42}
+            state = cache.state()
+            assert state["backend"] == "local" and state["local_entries"] == 1 and state["last_error"]
+            # The watcher keeps retrying in the background
+            await wait_for(lambda: cache.state()["reconnect_attempts"] >= 2)
+        finally:
+            await cache.disconnect()
+
+    asyncio.run(run())
+
+
+def test_reconnect_clears_local_cache(fast_reconnect, redis_server):
+    async def run():
+        cache = AICache()
+        cache.redis_url = UNREACHABLE_URL
+        await cache.connect()
+        try:
+            await cache.set("reconnect", {"q": 1}, {"answer": "stale"})
+            cache.redis_url = redis_server
+            await wait_for(lambda: cache.connected)
+            assert cache.state()["local_entries"] == 0 and cache.state()["last_error"] is None
+            assert await cache.get("reconnect", {"q": 1}) is None
+            assert await cache.set("reconnect", {"q": 1}, {"answer": "fresh"})
+            assert await cache._client.exists(cache._generate_key("reconnect", {"q": 1}))
+            assert await cache._streams.ping() and await cache._worker_streams.ping()
+            # Batch workers do not share the event viewers' pool
+            pool = cache._worker_streams.connection_pool
+            assert pool is not cache._streams.connection_pool
+            assert pool.max_connections == get_settings().batch_worker_concurrency
+        finally:
+            await cache.disconnect()
+
+    asyncio.run(run())
+
+
+def test_failed_command_is_not_an_outage_if_ping_succeeds(fast_reconnect, redis_server):
+    async def run():
+        cache = AICache()
+        cache.redis_url = redis_server
+        await cache.connect()
+        try:
+            assert cache.connected
+            # A slow command or an exhausted pool, while Redis itself answers
+            cache._failed(asyncio.TimeoutError())
+            cache._failed(redis.ConnectionError("Too many connections"))
+            await wait_for(lambda: not cache._ping_now.is_set())
+            await asyncio.sleep(0.05)
+            assert cache.connected
+            # Errors that are not about the connection do not even ping
+            cache._failed(redis.ResponseError("WRONGTYPE"))
+            assert not cache._ping_now.is_set()
+        finally:
+            await cache.disconnect()
+
+    asyncio.run(run())
+
+
+def test_failed_ping_switches_to_local_cache(fast_reconnect, redis_server):
+    async def run():
+        cache = AICache()
+        cache.redis_url = redis_server
+        await cache.connect()
+        try:
+            async def refuse():
+                raise redis.ConnectionError("Connection refused")
+
+            cache._probe.ping = refuse
+            cache.redis_url = UNREACHABLE_URL
+            cache._failed(redis.ConnectionError("Connection reset by peer"))
+            await wait_for(lambda: not cache.connected)
+            assert cache._streams is None and cache._worker_streams is None
+            assert cache.state()["last_error"] == "Connection refused"
+            assert await cache.set("failover", {"q": 1}, {"answer": 1})
+            assert cache.state()["local_entries"] == 1
+            # Once Redis is reachable again the watcher reconnects (with a new probe)
+            cache.redis_url = redis_server
+            await wait_for(lambda: cache.connected)
+            assert cache.state()["local_entries"] == 0
+        finally:
+            await cache.disconnect()
+
+    asyncio.run(run())
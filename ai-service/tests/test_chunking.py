@@ -0,0 +1,177 @@
+"""
+Carphatian AI Microservice - Document Chunking Tests
+
+Chunk boundaries and sizes, the overlap limit, splitting of over-long
+sentences and words, stability of chunk cache keys under edits, and pooling.
+
+Built by Carphatian
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+from cache_keys import embedding_key
+from chunking import chunk_text, pool_embeddings
+from prompt_budget import get_prompt_budget, preload_encodings
+
+MODEL = "text-embedding-3-small"
+MAX_TOKENS = 120
+OVERLAP_TOKENS = 30
+
+
+def make_document(paragraphs: int = 12, seed: int = 3) -> str:
+    """Paragraphs of 3-8 sentences of 5-15 words."""
+    rng = random.Random(seed)
+    words = ["react", "stripe", "checkout", "design", "deadline", "budget", "mobile", "api",
+             "database", "client", "deliver", "support", "testing", "landing", "page", "python"]
+    document = []
+    for _ in range(paragraphs):
+        sentences = [
+            " ".join(rng.choice(words) for _ in range(rng.randint(5, 15))).capitalize() + "."
+            for _ in range(rng.randint(3, 8))
+        ]
+        document.append(" ".join(sentences))
+    return "\n\n".join(document)
+
+
+def chunk(text: str, max_tokens: int = MAX_TOKENS, overlap_tokens: int = OVERLAP_TOKENS):
+    return chunk_text(text, max_tokens, overlap_tokens, MODEL)
+
+
+def test_short_text_is_one_chunk():
+    chunks = chunk("Need a logo for a coffee shop.")
+    assert len(chunks) == 1
+    assert chunks[0].text == "Need a logo for a coffee shop." and (chunks[0].start, chunks[0].end) == (0, 30)
+
+
+def test_chunks_are_bounded_ordered_and_cover_the_text():
+    text = make_document()
+    chunks = chunk(text)
+    budget = get_prompt_budget(MODEL)
+    assert len(chunks) > 3
+    assert [c.index for c in chunks] == list(range(len(chunks)))
+    for c in chunks:
+        assert c.tokens <= MAX_TOKENS
+        assert c.text == text[c.start:c.end]
+        # Token counts are per sentence, so they stay close to the chunk's own count
+        assert abs(budget.count(c.text) - c.tokens) <= 0.1 * c.tokens + 5
+    assert chunks[0].start == 0 and chunks[-1].end == len(text.rstrip())
+    for previous, current in zip(chunks, chunks[1:]):
+        # No gaps: each chunk starts at or before the end of the previous one
+        assert previous.start < current.start <= previous.end + 2
+
+
+def test_chunks_end_at_paragraph_breaks_once_half_full():
+    text = make_document()
+    paragraph_ends = {index for index in range(len(text)) if text.startswith("\n\n", index)} | {len(text)}
+    chunks = chunk(text)
+    for c in chunks[:-1]:
+        if c.tokens < MAX_TOKENS // 2:
+            continue
+        # A chunk ends mid-paragraph only when the next sentence would not fit
+        if c.end not in paragraph_ends:
+            next_sentence = text[c.end:].split(".")[0]
+            assert c.tokens + get_prompt_budget(MODEL).count(next_sentence) > MAX_TOKENS * 0.9
+
+
+def test_overlap_is_limited():
+    text = make_document()
+    for overlap in (0, OVERLAP_TOKENS, MAX_TOKENS):
+        chunks = chunk(text, overlap_tokens=overlap)
+        limit = min(overlap, MAX_TOKENS // 2)
+        for previous, current in zip(chunks, chunks[1:]):
+            shared = max(0, previous.end - current.start)
+            assert get_prompt_budget(MODEL).count(text[current.start:current.start + shared]) <= limit + 2
+            if overlap == 0:
+                assert shared == 0
+
+
+def test_overlap_repeats_whole_sentences():
+    text = " ".join(f"Sentence number {n} is about the job." for n in range(40))
+    chunks = chunk(text)
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current.text.startswith("Sentence number")
+        assert current.start < previous.end
+
+
+def test_over_long_sentence_is_split_into_word_runs():
+    sentence = " ".join(f"word{n}" for n in range(400)) + "."
+    chunks = chunk(f"Intro sentence.\n\n{sentence}\n\nOutro sentence.")
+    assert len(chunks) > 3
+    assert all(c.tokens <= MAX_TOKENS for c in chunks)
+    # Runs break between words, never inside one
+    words = set(sentence.rstrip(".").split())
+    for c in chunks:
+        for token in c.text.replace(".", " ").split():
+            assert token in words or token in {"Intro", "sentence", "Outro"}
+
+
+def test_over_long_word_is_split_on_token_boundaries():
+    blob = "x" * 40000
+    text = f"See {blob} end.\n\nNext paragraph."
+    chunks = chunk(text, max_tokens=512, overlap_tokens=64)
+    budget = get_prompt_budget(MODEL)
+    assert all(c.tokens <= 512 and budget.count(c.text) <= 512 for c in chunks)
+    # Every character of the blob is in some chunk, in order
+    covered = sorted({i for c in chunks for i in range(max(c.start, 4), min(c.end, 4 + len(blob)))})
+    assert covered == list(range(4, 4 + len(blob)))
+    assert chunks[-1].text.endswith("Next paragraph.")
+
+
+def test_token_windows_with_tiktoken():
+    if not preload_encodings([MODEL]):
+        pytest.skip("tiktoken encodings are not available offline")
+    budget = get_prompt_budget(MODEL)
+    text = "https://example.com/" + "aZ9-_" * 3000
+    spans = budget.windows(text, 100)
+    assert spans[0][0] == 0 and spans[-1][1] == len(text)
+    assert all(previous[1] == current[0] for previous, current in zip(spans, spans[1:]))
+    assert all(budget.count(text[start:end]) <= 100 for start, end in spans)
+
+
+def test_editing_a_paragraph_keeps_other_chunk_keys():
+    text = make_document(paragraphs=16)
+    paragraphs = text.split("\n\n")
+    edited_paragraphs = list(paragraphs)
+    edited_paragraphs[8] = edited_paragraphs[8].replace(".", " with a rewritten ending.", 1)
+    edited = "\n\n".join(edited_paragraphs)
+
+    def keys(document):
+        return [str(embedding_key(c.text, MODEL, None, 512)) for c in chunk(document)]
+
+    before, after = keys(text), keys(edited)
+    unchanged = set(before) & set(after)
+    # Only the chunks around the edited paragraph change
+    assert len(before) - len(unchanged) <= 3
+    assert len(after) - len(unchanged) <= 3
+    assert before[:2] == after[:2] and before[-2:] == after[-2:]
+
+
+def test_text_without_words_has_no_chunks():
+    assert chunk("") == []
+    assert chunk("....  !!! ???") == []
+    assert chunk("\n\n---\n\n") == []
+    # Punctuation-only sentences are dropped from real documents too
+    assert [c.text for c in chunk("Build the API.\n\n---\n\nShip it.", max_tokens=4)] == ["Build the API.", "Ship it."]
+
+
+def test_pool_mean_is_token_weighted_and_unit_length():
+    embeddings = [[1.0, 0.0], [0.0, 1.0]]
+    pooled = pool_embeddings(embeddings, [3, 1])
+    assert np.linalg.norm(pooled) == pytest.approx(1.0)
+    assert pooled == pytest.approx(np.array([3.0, 1.0]) / np.sqrt(10))
+
+
+def test_pool_max_is_element_wise():
+    pooled = pool_embeddings([[0.6, -0.8], [-0.6, 0.8]], [1, 1], method="max")
+    assert pooled == pytest.approx(np.array([0.6, 0.8]))
+
+
+def test_pool_of_a_single_chunk_is_the_chunk():
+    vector = np.array([0.2, 0.4, 0.4, 0.8])
+    vector /= np.linalg.norm(vector)
+    assert pool_embeddings([vector], [17]) == pytest.approx(vector)
+    # Opposite vectors cancel out: no normalization of a zero vector
+    assert pool_embeddings([[1.0, 0.0], [-1.0, 0.0]], [1, 1]).tolist() == [0.0, 0.0]
@@ -0,0 +1,267 @@
+"""
+Carphatian AI Microservice - Job Clustering Tests
+
+Mini-batch k-means updates, k-means++ seeding, weighted category and
+skill suggestions, and the model shared by workers through fakeredis.
+
+Built by Carphatian
+"""
+
+import asyncio
+import time
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import clustering
+from cache import AICache
+from clustering import (
+    ClusterMismatch,
+    ClustersUnavailable,
+    JobClusters,
+    kmeans_plus_plus,
+    minibatch_step,
+)
+
+fakeredis = pytest.importorskip("fakeredis")
+
+DIMENSIONS = 8
+MODEL = "text-embedding-3-small"
+
+
+def make_clusters(server=None, k: int = 3, init_points: int = 30, lock_timeout: float = 5.0) -> JobClusters:
+    """Clusters on a fakeredis server; a new client per call, like a new worker."""
+    cache = AICache()
+    cache._client = fakeredis.FakeAsyncRedis(server=server or fakeredis.FakeServer(), decode_responses=True)
+    return JobClusters(cache, "ai:clusters:test", k=k, init_points=init_points, batch_size=16, init_epochs=3,
+                       min_learning_rate=0.01, refresh_interval=0.0, lock_timeout=lock_timeout, seed=1)
+
+
+def unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def make_jobs(per_cluster: int = 10, noise: float = 0.05, seed: int = 3):
+    """Jobs around three orthogonal directions, labelled by direction."""
+    rng = np.random.default_rng(seed)
+    groups = [
+        (0, "Web Development", ["React", "Next.js"]),
+        (1, "Design", ["Figma", "Logo Design"]),
+        (2, "Writing", ["Copywriting", "SEO"]),
+    ]
+    vectors, categories, skills = [], [], []
+    for axis, category, group_skills in groups:
+        for _ in range(per_cluster):
+            vector = rng.normal(0, noise, DIMENSIONS)
+            vector[axis] += 1
+            vectors.append(unit(vector).tolist())
+            categories.append(category)
+            skills.append(group_skills)
+    return vectors, categories, skills
+
+
+# ============================================================================
+# Mini-batch k-means
+# ============================================================================
+
+def test_minibatch_step_moves_assigned_centroids_only():
+    centroids = np.stack([unit([1, 0, 0]), unit([0, 1, 0]), unit([0, 0, 1])])
+    counts = np.array([3, 5, 0], dtype=np.int64)
+    points = np.stack([unit([1, 0.2, 0]), unit([1, -0.1, 0.1]), unit([0.1, 1, 0])])
+    before = centroids.copy(), counts.copy()
+
+    new_centroids, new_counts, labels = minibatch_step(centroids, counts, points, min_learning_rate=0.0)
+
+    # Inputs are not modified
+    assert np.array_equal(centroids, before[0]) and np.array_equal(counts, before[1])
+    assert labels.tolist() == [0, 0, 1]
+    assert new_counts.tolist() == [5, 6, 0]
+    # Two of five points seen: centroid 0 moves 2/5 of the way to the batch mean
+    expected = unit(centroids[0] + 0.4 * (points[:2].mean(axis=0) - centroids[0]))
+    assert new_centroids[0] == pytest.approx(expected, abs=1e-6)
+    assert new_centroids[1] == pytest.approx(unit(centroids[1] + (points[2] - centroids[1]) / 6), abs=1e-6)
+    assert np.array_equal(new_centroids[2], centroids[2])
+    assert np.linalg.norm(new_centroids, axis=1) == pytest.approx(np.ones(3), abs=1e-6)
+
+
+def test_minibatch_step_learning_rate_floor():
+    centroids = np.stack([unit([1, 0]), unit([0, 1])])
+    counts = np.array([1, 100000], dtype=np.int64)
+    point = unit([1, 1.2])[None, :]
+    # Without a floor the centroid barely moves after 100000 points
+    slow, _, _ = minibatch_step(centroids, counts, point, min_learning_rate=0.0)
+    fast, _, _ = minibatch_step(centroids, counts, point, min_learning_rate=0.1)
+    assert fast[1] == pytest.approx(unit(centroids[1] + 0.1 * (point[0] - centroids[1])), abs=1e-6)
+    assert fast[1] @ point[0] > slow[1] @ point[0]
+
+
+def test_kmeans_plus_plus_seeds_each_separated_cluster():
+    vectors, _, _ = make_jobs(noise=0.01)
+    points = np.asarray(vectors, dtype=np.float32)
+    for seed in range(10):
+        seeds = kmeans_plus_plus(points, 3, np.random.default_rng(seed))
+        # Seeds are data points, one per direction
+        assert all(any(np.array_equal(seed_point, point) for point in points) for seed_point in seeds)
+        assert sorted(np.argmax(seeds, axis=1).tolist()) == [0, 1, 2]
+
+
+def test_kmeans_plus_plus_with_duplicate_points():
+    points = np.repeat(unit([1, 0, 0])[None, :], 4, axis=0)
+    # All distances are zero: seeds are drawn uniformly instead of failing
+    seeds = kmeans_plus_plus(points, 3, np.random.default_rng(0))
+    assert seeds.shape == (3, 3) and np.allclose(seeds, points[0])
+
+
+# ============================================================================
+# Suggestions
+# ============================================================================
+
+def fitted_clusters() -> JobClusters:
+    clusters = make_clusters()
+    clusters.model, clusters.dimensions = MODEL, 3
+    clusters.centroids = np.stack([unit([1, 0, 0]), unit([0, 1, 0]), unit([-1, 0, 0])])
+    clusters.counts = np.array([4, 2, 5], dtype=np.int64)
+    clusters.categories = [Counter({"Web Development": 4}), Counter({"Design": 2}), Counter({"Writing": 5})]
+    clusters.skills = [Counter({"react": 4, "stripe": 1}), Counter({"figma": 2}), Counter({"seo": 5})]
+    clusters._skill_names = {"react": "React", "stripe": "Stripe", "figma": "Figma", "seo": "SEO"}
+    return clusters
+
+
+def test_suggest_weights_clusters_by_similarity():
+    clusters = fitted_clusters()
+    # Cosine 0.8 with cluster 0, 0.6 with cluster 1
+    suggestions = clusters.suggest([0.8, 0.6, 0.0], clusters=2, limit=10)
+    assert [match["cluster"] for match in suggestions["clusters"]] == [0, 1]
+    assert suggestions["categories"] == [
+        {"name": "Web Development", "score": round(0.8 / 1.4, 4)},
+        {"name": "Design", "score": round(0.6 / 1.4, 4)},
+    ]
+    # Share of the cluster's jobs with the skill, times the cluster's weight
+    assert suggestions["skills"] == [
+        {"name": "React", "score": round(0.8 / 1.4, 4)},
+        {"name": "Figma", "score": round(0.6 / 1.4, 4)},
+        {"name": "Stripe", "score": round(0.8 / 1.4 / 4, 4)},
+    ]
+
+
+def test_suggest_skips_dissimilar_and_empty_clusters():
+    clusters = fitted_clusters()
+    clusters.counts[1] = 0
+    suggestions = clusters.suggest([1.0, 0.0, 0.0], clusters=3, limit=1)
+    # The empty cluster is not a neighbour; the opposite one has no weight
+    assert [match["cluster"] for match in suggestions["clusters"]] == [0, 2]
+    assert suggestions["categories"] == [{"name": "Web Development", "score": 1.0}]
+    assert suggestions["skills"] == [{"name": "React", "score": 1.0}]
+
+
+# ============================================================================
+# Shared model
+# ============================================================================
+
+def test_workers_share_the_model():
+    async def run():
+        server = fakeredis.FakeServer()
+        worker, other_worker = make_clusters(server), make_clusters(server)
+        vectors, categories, skills = make_jobs()
+
+        await worker.add(vectors[:20], MODEL, categories[:20], skills[:20])
+        await other_worker.add(vectors[20:], MODEL, categories[20:], skills[20:])
+        # The second batch completed the buffer of both workers' jobs
+        assert other_worker.ready and other_worker.jobs == 30
+        await worker.refresh()
+        assert worker.ready and worker.version == other_worker.version
+        assert np.array_equal(worker.centroids, other_worker.centroids)
+        assert sorted(worker.counts.tolist()) == [10, 10, 10]
+        design = worker.nearest(vectors[10], 1)[0][0]
+        assert worker.categories[design] == Counter({"Design": 10})
+        assert worker.label(design) == ["Figma", "Logo Design"]
+
+        # Incremental updates reach the other worker too
+        await worker.add(vectors[:5], MODEL, ["Web Development"] * 5, [["react", "Stripe"]] * 5)
+        await other_worker.refresh()
+        assert other_worker.jobs == 35 and np.array_equal(other_worker.centroids, worker.centroids)
+        web = other_worker.nearest(vectors[0], 1)[0][0]
+        assert other_worker.skills[web]["react"] == 15 and other_worker.label(web) == ["React", "Next.js", "Stripe"]
+
+        # A restarted worker loads the model, and cache clearing keeps it
+        await worker.cache.clear_all()
+        restarted = make_clusters(server)
+        await restarted.refresh()
+        assert restarted.summary() == other_worker.summary()
+
+        with pytest.raises(ClusterMismatch):
+            await restarted.add([[1.0] * 4], MODEL, [None], [[]])
+
+    asyncio.run(run())
+
+
+def test_unavailable_without_redis():
+    async def run():
+        clusters = make_clusters()
+        clusters.cache._client = None
+        with pytest.raises(ClustersUnavailable):
+            await clusters.refresh()
+        vectors, categories, skills = make_jobs(per_cluster=1)
+        with pytest.raises(ClustersUnavailable):
+            await clusters.add(vectors, MODEL, categories, skills)
+
+    asyncio.run(run())
+
+
+def slow_steps(monkeypatch, seconds: float) -> None:
+    """Make every mini-batch step take at least `seconds` (runs in a thread)."""
+    step = clustering.minibatch_step
+
+    def slow_step(*args):
+        time.sleep(seconds)
+        return step(*args)
+
+    monkeypatch.setattr(clustering, "minibatch_step", slow_step)
+
+
+def test_lock_is_extended_during_long_updates(monkeypatch):
+    async def run():
+        server = fakeredis.FakeServer()
+        worker, other_worker = make_clusters(server, lock_timeout=0.3), make_clusters(server, lock_timeout=2.0)
+        vectors, categories, skills = make_jobs()
+        await worker.add(vectors, MODEL, categories, skills)
+
+        # Four batches of 0.15s: twice the lock timeout
+        slow_steps(monkeypatch, 0.15)
+        await asyncio.gather(
+            worker.add(vectors * 2, MODEL, categories * 2, skills * 2),
+            other_worker.add(vectors[:1], MODEL, categories[:1], skills[:1]),
+        )
+        await worker.refresh()
+        # Neither update overwrote the other
+        assert worker.jobs == 30 + 60 + 1
+
+    asyncio.run(run())
+
+
+def test_lost_lock_writes_nothing(monkeypatch):
+    async def run():
+        clusters = make_clusters()
+        client = clusters.cache._client
+        vectors, categories, skills = make_jobs()
+        await clusters.add(vectors, MODEL, categories, skills)
+        version = clusters.version
+
+        loop = asyncio.get_running_loop()
+        step = clustering.minibatch_step
+
+        def step_losing_the_lock(*args):
+            # Another worker takes the lock while the update runs
+            asyncio.run_coroutine_threadsafe(client.set("ai:clusters:test:lock", "other"), loop).result()
+            return step(*args)
+
+        monkeypatch.setattr(clustering, "minibatch_step", step_losing_the_lock)
+        with pytest.raises(ClustersUnavailable):
+            await clusters.add(vectors[:1], MODEL, categories[:1], skills[:1])
+        await clusters.refresh(force=True)
+        assert clusters.version == version and clusters.jobs == 30
+        assert await client.get("ai:clusters:test:lock") == "other"
+
+    asyncio.run(run())
@@ -0,0 +1,109 @@
+"""
+Carphatian AI Microservice - Deadline & Retry Tests
+
+Deadline header parsing, and when call_with_retry retries or gives up.
+
+Built by Carphatian
+"""
+
+import asyncio
+
+import pytest
+
+from config import get_settings
+from providers.deadline import Deadline, DeadlineExceeded, call_with_retry, is_retryable
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "deadline_safety_margin", 0.25)
+    monkeypatch.setattr(settings, "provider_max_attempts", 3)
+    monkeypatch.setattr(settings, "provider_retry_base_delay", 0.0)
+    monkeypatch.setattr(settings, "provider_retry_max_delay", 0.0)
+    monkeypatch.setattr(settings, "provider_min_attempt_time", 0.05)
+    monkeypatch.setattr(settings, "provider_attempt_timeout", 5.0)
+    return settings
+
+
+def failing(*errors):
+    """Operation raising the given errors in turn, then returning "ok"; counts its calls."""
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return "ok"
+
+    return operation, calls
+
+
+def test_deadline_from_header(settings):
+    assert Deadline.from_header("2000", default=30.0).timeout == pytest.approx(1.75)
+    # Never more than the endpoint default
+    assert Deadline.from_header("60000", default=30.0).timeout == pytest.approx(29.75)
+    assert Deadline.from_header(None, default=10.0).timeout == pytest.approx(9.75)
+    assert Deadline.from_header("soon", default=10.0).timeout == pytest.approx(9.75)
+    # Budgets below the safety margin are already expired
+    deadline = Deadline.from_header("100", default=30.0)
+    assert deadline.timeout == 0.0 and deadline.expired
+
+
+def test_retryable_errors():
+    assert is_retryable(asyncio.TimeoutError())
+    assert is_retryable(ProviderError(429))
+    assert is_retryable(ProviderError(503))
+    assert not is_retryable(ProviderError(400))
+    assert not is_retryable(ProviderError(401))
+    assert not is_retryable(ValueError("bad"))
+
+
+def test_retries_transient_errors(settings):
+    operation, calls = failing(ProviderError(503), ProviderError(429))
+    assert asyncio.run(call_with_retry(operation, Deadline(5.0), "test")) == "ok"
+    assert len(calls) == 3
+
+
+def test_gives_up_after_max_attempts(settings):
+    operation, calls = failing(*[ProviderError(503)] * 5)
+    with pytest.raises(ProviderError):
+        asyncio.run(call_with_retry(operation, Deadline(5.0), "test"))
+    assert len(calls) == 3
+
+
+def test_does_not_retry_client_errors(settings):
+    operation, calls = failing(ProviderError(400))
+    with pytest.raises(ProviderError):
+        asyncio.run(call_with_retry(operation, Deadline(5.0), "test"))
+    assert len(calls) == 1
+
+
+def test_expired_deadline_is_not_called(settings):
+    operation, calls = failing()
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(call_with_retry(operation, Deadline(0.0), "test"))
+    assert calls == []
+
+
+def test_stops_retrying_when_budget_is_short(settings):
+    # Less than provider_min_attempt_time is left after the first failure
+    settings.provider_min_attempt_time = 1.0
+    operation, calls = failing(ProviderError(503))
+    with pytest.raises(ProviderError):
+        asyncio.run(call_with_retry(operation, Deadline(0.5), "test"))
+    assert len(calls) == 1
+
+
+def test_hung_attempt_hits_the_deadline(settings):
+    async def hang():
+        await asyncio.sleep(10)
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(call_with_retry(hang, Deadline(0.2), "test"))
@@ -0,0 +1,229 @@
+"""
+Carphatian AI Microservice - Duplicate Detection Tests
+
+MinHash estimates and LSH candidates are checked against exact Jaccard
+similarity of the shingle sets on a synthetic corpus of texts and edited
+copies of them. Indexes are stored in fakeredis; workers share them
+through the same server.
+
+Built by Carphatian
+"""
+
+import asyncio
+import random
+
+import numpy as np
+import pytest
+
+import dedup
+from cache import AICache
+from dedup import DedupUnavailable, MinHashIndex, estimate_similarity, jaccard, shingles
+
+fakeredis = pytest.importorskip("fakeredis")
+
+NUM_PERM = 128
+BANDS = 16
+SHINGLE_SIZE = 5
+THRESHOLD = 0.8
+
+# Pairs clearly above / below the threshold
+DUPLICATE_MIN_JACCARD = 0.9
+DISTINCT_MAX_JACCARD = 0.6
+
+
+def make_cache(server=None) -> AICache:
+    cache = AICache()
+    cache._client = fakeredis.FakeAsyncRedis(server=server or fakeredis.FakeServer(), decode_responses=True)
+    return cache
+
+
+def make_index(server=None, max_items: int = 10000) -> MinHashIndex:
+    """Index on a fakeredis server; a new client per call, like a new worker."""
+    return MinHashIndex(make_cache(server), "ai:dedup:jobs:-:test", NUM_PERM, BANDS, SHINGLE_SIZE,
+                        seed=1337, max_items=max_items)
+
+
+async def query_all(index: MinHashIndex, texts, limit: int = 100):
+    return [await index.query(index.signature(text), THRESHOLD, limit) for text in texts]
+
+
+def make_corpus(documents: int = 200, words: int = 80, seed: int = 7):
+    """Random documents, and per document an edited copy with 0-40% of its words replaced."""
+    rng = random.Random(seed)
+    vocabulary = ["".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(3, 9))) for _ in range(3000)]
+    originals = [[rng.choice(vocabulary) for _ in range(words)] for _ in range(documents)]
+    edited = []
+    for text in originals:
+        copy = list(text)
+        for position in rng.sample(range(words), int(words * rng.uniform(0, 0.4))):
+            copy[position] = rng.choice(vocabulary)
+        edited.append(copy)
+    return [" ".join(text) for text in originals], [" ".join(text) for text in edited]
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    originals, edited = make_corpus()
+    server = fakeredis.FakeServer()
+
+    async def fill():
+        index = make_index(server)
+        for number, text in enumerate(originals):
+            await index.insert(f"doc-{number}", index.signature(text))
+
+    asyncio.run(fill())
+    original_shingles = [shingles(text, SHINGLE_SIZE) for text in originals]
+    edited_shingles = [shingles(text, SHINGLE_SIZE) for text in edited]
+    exact = np.array([[jaccard(query, doc) for doc in original_shingles] for query in edited_shingles])
+    return server, edited, exact
+
+
+def test_signature_estimates_jaccard():
+    originals, edited = make_corpus(documents=60)
+    hasher = make_index().hasher
+    errors = []
+    for a, b in zip(originals, edited):
+        sa, sb = shingles(a, SHINGLE_SIZE), shingles(b, SHINGLE_SIZE)
+        errors.append(abs(estimate_similarity(hasher.signature(sa), hasher.signature(sb)) - jaccard(sa, sb)))
+    # Standard error of a 128-permutation estimate is at most ~0.044
+    assert np.mean(errors) < 0.05
+    assert np.max(errors) < 0.2
+
+
+def test_false_negative_rate(corpus):
+    server, edited, exact = corpus
+    results = asyncio.run(query_all(make_index(server), edited))
+    duplicates = found = 0
+    for number, matches in enumerate(results):
+        returned = {item_id for item_id, _ in matches}
+        for doc in np.flatnonzero(exact[number] >= DUPLICATE_MIN_JACCARD):
+            duplicates += 1
+            found += f"doc-{doc}" in returned
+    assert duplicates >= 20, "corpus should contain clear duplicates"
+    assert 1 - found / duplicates <= 0.05
+
+
+def test_false_positive_rate(corpus):
+    server, edited, exact = corpus
+    results = asyncio.run(query_all(make_index(server), edited))
+    distinct = exact < DISTINCT_MAX_JACCARD
+    false_positives = 0
+    for number, matches in enumerate(results):
+        for item_id, _ in matches:
+            false_positives += distinct[number, int(item_id.split("-")[1])]
+    assert false_positives / distinct.sum() <= 0.001
+
+
+def test_candidates_are_sublinear(corpus):
+    server, edited, exact = corpus
+
+    async def run():
+        index = make_index(server)
+        # Unrelated queries read only their own buckets
+        return [len(await index.candidates(index.signature(text))) for text in edited], await index.count()
+
+    sizes, indexed = asyncio.run(run())
+    assert indexed == len(exact[0])
+    assert np.mean(sizes) < 0.05 * indexed
+
+
+def test_insert_remove_and_replace():
+    async def run():
+        server = fakeredis.FakeServer()
+        index, other_worker = make_index(server), make_index(server)
+        text = "Senior React developer needed for an e-commerce storefront with Next.js and Stripe checkout."
+        signature = index.signature(text)
+        await index.insert("job-1", signature)
+        await other_worker.insert("job-2", index.signature(text + " Remote, full time."))
+        assert await index.count() == 2
+        assert [item_id for item_id, _ in await index.query(signature, THRESHOLD, 10)] == ["job-1", "job-2"]
+        assert (await other_worker.query(signature, THRESHOLD, 10, exclude={"job-1"}))[0][0] == "job-2"
+
+        # Replacing an item moves it to its new buckets
+        await other_worker.insert("job-1", index.signature("Logo and packaging design for a coffee roastery."))
+        assert [item_id for item_id, _ in await index.query(signature, THRESHOLD, 10)] == ["job-2"]
+
+        assert await index.remove("job-2")
+        assert not await other_worker.remove("job-2")
+        assert await index.query(signature, THRESHOLD, 10) == []
+        assert await index.remove("job-1")
+        # No buckets, signatures or order entries are left behind
+        assert await index.count() == 0 and await index.client.keys("ai:dedup:*") == []
+
+    asyncio.run(run())
+
+
+def test_oldest_items_are_evicted():
+    async def run():
+        index = make_index(max_items=3)
+        for number in range(5):
+            await index.insert(f"job-{number}", index.signature(f"posting number {number} " * 5))
+        assert await index.count() == 3
+        assert not await index.contains("job-0") and not await index.contains("job-1")
+        assert await index.contains("job-4")
+
+    asyncio.run(run())
+
+
+def test_index_is_kept_by_cache_clear():
+    async def run():
+        index = make_index()
+        await index.insert("job-1", index.signature("Bookkeeping for a small bakery, monthly."))
+        await index.cache.clear_all()
+        assert await index.count() == 1
+
+    asyncio.run(run())
+
+
+def test_unavailable_without_redis(monkeypatch):
+    async def run():
+        cache = make_cache()
+        cache._client = None
+
+        async def get_cache():
+            return cache
+
+        monkeypatch.setattr(dedup, "get_cache", get_cache)
+        with pytest.raises(DedupUnavailable):
+            await dedup.get_dedup_index("jobs", "acme")
+
+        # Connection errors on a command are reported to the cache
+        cache = make_cache()
+        index = await dedup.get_dedup_index("jobs", "acme")
+
+        async def refuse(*args, **kwargs):
+            raise ConnectionError("Connection refused")
+
+        index.client.hlen = refuse
+        with pytest.raises(DedupUnavailable):
+            await index.count()
+        assert cache._ping_now.is_set()
+
+        # So are commands that outlast the cache's command timeout
+        cache = make_cache()
+        cache.command_timeout = 0.05
+        index = await dedup.get_dedup_index("jobs", "acme")
+
+        async def hang(*args, **kwargs):
+            await asyncio.sleep(10)
+
+        index.client.hlen = hang
+        with pytest.raises(DedupUnavailable):
+            await index.count()
+        assert cache._ping_now.is_set()
+
+    asyncio.run(run())
+
+
+def test_normalization():
+    assert shingles("Hello   World", SHINGLE_SIZE).tolist() == shingles("hello world\n", SHINGLE_SIZE).tolist()
+    assert len(shingles("", SHINGLE_SIZE)) == 0
+    assert len(shingles("abc", SHINGLE_SIZE)) == 1
+
+
+def test_texts_without_characters_are_rejected():
+    index = make_index()
+    # An empty shingle set would match every other empty text
+    for text in ["", " \n\t "]:
+        with pytest.raises(ValueError):
+            index.signature(text)
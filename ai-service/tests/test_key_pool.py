@@ -0,0 +1,137 @@
+"""
+Carphatian AI Microservice - Key Pool Tests
+
+Member selection by headroom, and cooldown of throttled (429) and
+rejected (401/403) keys.
+
+Built by Carphatian
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from config import get_settings
+from providers.key_pool import (
+    AUTH_FAILURE_COOLDOWN,
+    KeyPool,
+    KeyPoolExhausted,
+    PoolMember,
+    parse_reset,
+)
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code: int, headers: dict = None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": headers or {}})()
+
+
+class RawResponse:
+    def __init__(self, headers: dict, value: str):
+        self.headers = headers
+        self.value = value
+
+    def parse(self):
+        return self.value
+
+
+def make_pool(size: int = 2) -> KeyPool:
+    return KeyPool.build("test", lambda key, url: key, [f"key-{n}" for n in range(size)])
+
+
+def fail_with(error):
+    async def operation(client):
+        raise error
+    return operation
+
+
+def call(pool: KeyPool, operation):
+    return asyncio.run(pool.request(operation))
+
+
+def test_parse_reset():
+    assert parse_reset("1s", 100.0) == 101.0
+    assert parse_reset("6m0s", 100.0) == 460.0
+    assert parse_reset("250ms", 100.0) == pytest.approx(100.25)
+    assert parse_reset("20", 100.0) == 120.0
+    assert parse_reset("2030-01-01T00:00:00Z", 0.0) == 1893456000.0
+    assert parse_reset("soon", 100.0) is None
+    assert parse_reset(None, 100.0) is None
+
+
+def test_acquire_prefers_headroom():
+    pool = make_pool(3)
+    pool.members[0].update_from_headers({"x-ratelimit-limit-requests": "100", "x-ratelimit-remaining-requests": "5",
+                                         "x-ratelimit-reset-requests": "30s"})
+    pool.members[1].update_from_headers({"x-ratelimit-limit-requests": "100", "x-ratelimit-remaining-requests": "90",
+                                         "x-ratelimit-reset-requests": "30s"})
+    pool.members[2].inflight = 3
+    assert pool.acquire() is pool.members[1]
+
+
+def test_throttled_member_cools_down_for_retry_after():
+    pool = make_pool()
+    with pytest.raises(ProviderError):
+        call(pool, fail_with(ProviderError(429, {"retry-after": "20"})))
+    throttled = [member for member in pool if not member.available(time.time())]
+    assert len(throttled) == 1
+    assert throttled[0].cooldown_until - time.time() == pytest.approx(20, abs=1)
+    # The other key takes the traffic
+    assert pool.acquire() is not throttled[0]
+
+
+def test_throttle_uses_reset_headers_then_default():
+    now = time.time()
+    member = PoolMember(None, "test#0")
+    member.throttle({"x-ratelimit-limit-tokens": "1000", "x-ratelimit-remaining-tokens": "0",
+                     "x-ratelimit-reset-tokens": "7s"}, default=60.0)
+    assert member.cooldown_until - now == pytest.approx(7, abs=1)
+
+    member = PoolMember(None, "test#1")
+    member.throttle({}, default=60.0)
+    assert member.cooldown_until - now == pytest.approx(60, abs=1)
+    member.throttle(None, default=get_settings().key_pool_throttle_cooldown)
+    assert member.cooldown_until - now == pytest.approx(get_settings().key_pool_throttle_cooldown, abs=1)
+
+
+@pytest.mark.parametrize("status_code", [401, 403])
+def test_rejected_key_cools_down(status_code):
+    pool = make_pool()
+    with pytest.raises(ProviderError):
+        call(pool, fail_with(ProviderError(status_code)))
+    rejected = [member for member in pool if not member.available(time.time())]
+    assert len(rejected) == 1
+    assert rejected[0].cooldown_until - time.time() == pytest.approx(AUTH_FAILURE_COOLDOWN, abs=1)
+
+
+def test_other_errors_keep_the_member():
+    pool = make_pool(1)
+    with pytest.raises(ProviderError):
+        call(pool, fail_with(ProviderError(500)))
+    assert pool.has_capacity()
+    assert pool.members[0].inflight == 0
+
+
+def test_exhausted_pool():
+    pool = make_pool()
+    for _ in range(2):
+        with pytest.raises(ProviderError):
+            call(pool, fail_with(ProviderError(429, {"retry-after": "30"})))
+    assert not pool.has_capacity()
+    with pytest.raises(KeyPoolExhausted) as error:
+        pool.acquire()
+    assert error.value.status_code == 429
+
+
+def test_successful_request_records_headers():
+    pool = make_pool(1)
+
+    async def operation(client):
+        return RawResponse({"x-ratelimit-limit-requests": "100", "x-ratelimit-remaining-requests": "40",
+                            "x-ratelimit-reset-requests": "10s"}, f"parsed by {client}")
+
+    assert call(pool, operation) == "parsed by key-0"
+    assert pool.members[0].headroom(time.time()) == pytest.approx(0.4)
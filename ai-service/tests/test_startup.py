@@ -0,0 +1,90 @@
+"""
+Carphatian AI Microservice - Startup Tests
+
+Cold-start budget: importing the app must stay fast and must not load
+provider SDKs that are not configured.
+
+IMPORT_TIME_BUDGET_MS overrides the import budget on slow machines.
+
+Built by Carphatian
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("IMPORT_TIME_BUDGET_MS", "2500"))
+
+HEAVY_MODULES = ["openai", "anthropic", "groq", "sentry_sdk"]
+
+PROVIDER_ENV = [
+    f"{name.upper()}_{suffix}"
+    for name in ("openai", "anthropic", "groq")
+    for suffix in ("API_KEY", "API_KEYS", "BASE_URLS")
+]
+
+
+def run_python(code: str, **env) -> dict:
+    """Run `code` in a fresh interpreter from ai-service/ and return its JSON output."""
+    clean_env = {key: value for key, value in os.environ.items() if key not in PROVIDER_ENV and key != "SENTRY_DSN"}
+    clean_env.update(env)
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=SERVICE_DIR,
+        env=clean_env,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+IMPORT_MAIN = f"""
+import json, sys, time
+started = time.perf_counter()
+import main
+elapsed = (time.perf_counter() - started) * 1000
+print(json.dumps({{"ms": elapsed, "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def test_import_main_skips_provider_sdks():
+    result = run_python(IMPORT_MAIN)
+    assert result["loaded"] == []
+
+
+def test_import_main_within_budget():
+    # Best of three to ignore a cold filesystem cache
+    best = min(run_python(IMPORT_MAIN)["ms"] for _ in range(3))
+    assert best < IMPORT_TIME_BUDGET_MS, f"import main took {best:.0f}ms (budget {IMPORT_TIME_BUDGET_MS:.0f}ms)"
+
+
+START_FACTORY = """
+import json, sys
+from providers import get_ai_factory
+factory = get_ai_factory()
+print(json.dumps({
+    "providers": factory.list_providers(),
+    "timings": sorted(factory.init_timings),
+    "loaded": [m for m in ("openai", "anthropic", "groq") if m in sys.modules],
+}))
+"""
+
+
+def test_factory_imports_only_configured_providers():
+    result = run_python(START_FACTORY, OPENAI_API_KEY="sk-test")
+    assert result["providers"] == {"openai": True, "anthropic": False, "groq": False, "local": True}
+    assert result["timings"] == ["local", "openai"]
+    assert "openai" in result["loaded"]
+    assert "anthropic" not in result["loaded"] and "groq" not in result["loaded"]
+
+
+def test_factory_starts_keyless_provider_with_base_urls():
+    # Self-hosted OpenAI-compatible endpoints need no key
+    result = run_python(START_FACTORY, OPENAI_BASE_URLS="http://localhost:8001/v1")
+    assert result["providers"]["openai"] and result["timings"] == ["local", "openai"]
+    assert result["loaded"] == ["openai"]
@@ -0,0 +1,92 @@
+"""
+Carphatian AI Microservice - Structured Output Tests
+
+Single-pass JSON object extraction, local repairs of common LLM defects,
+and the parse outcomes reported by /health.
+
+Built by Carphatian
+"""
+
+import json
+
+import pytest
+
+import structured_output
+from structured_output import (
+    CoverLetterOutput,
+    JobDraftOutput,
+    extract_json_object,
+    parse_structured,
+    repair_json,
+)
+
+
+@pytest.fixture(autouse=True)
+def clean_stats():
+    structured_output.stats.clear()
+    yield
+    structured_output.stats.clear()
+
+
+def fallback() -> JobDraftOutput:
+    return JobDraftOutput(description="fallback")
+
+
+def test_extracts_first_balanced_object():
+    text = 'Sure! Here it is:\n```json\n{"a": {"b": [1, 2]}, "c": "x"}\n```\nAnd another {"d": 1}'
+    assert extract_json_object(text) == ('{"a": {"b": [1, 2]}, "c": "x"}', True)
+
+
+def test_ignores_braces_in_strings():
+    text = '{"text": "use } and { and \\" freely", "n": 1} trailing'
+    fragment, complete = extract_json_object(text)
+    assert complete and json.loads(fragment) == {"text": 'use } and { and " freely', "n": 1}
+
+
+def test_truncated_and_missing_objects():
+    assert extract_json_object('prefix {"a": [1, 2') == ('{"a": [1, 2', False)
+    assert extract_json_object("no json here") == (None, False)
+
+
+@pytest.mark.parametrize("fragment, complete, expected", [
+    ('{"a": True, "b": None, "c": [False]}', True, {"a": True, "b": None, "c": [False]}),
+    ('{"a": [1, 2,], "b": 3,}', True, {"a": [1, 2], "b": 3}),
+    ('{"a": "unfinished str', False, {"a": "unfinished str"}),
+    ('{"a": [1, 2, ', False, {"a": [1, 2]}),
+    ('{"a": {"b": "x"}, "c":', False, {"a": {"b": "x"}}),
+    ('{"a": 1, "ke', False, {"a": 1}),
+    ('{"ke', False, {}),
+    ('{"a": ["x", "y', False, {"a": ["x", "y"]}),
+    ('{"a": "ends with escape \\', False, {"a": "ends with escape "}),
+])
+def test_repairs(fragment, complete, expected):
+    assert json.loads(repair_json(fragment, complete)) == expected
+
+
+def test_repair_keeps_literals_inside_strings():
+    fragment = '{"a": "True story, None of it"}'
+    assert json.loads(repair_json(fragment, True)) == {"a": "True story, None of it"}
+
+
+def test_parse_outcomes_and_snapshot():
+    result, outcome = parse_structured('{"description": "Build a shop", "requirements": ["React"]}',
+                                       JobDraftOutput, fallback)
+    assert outcome == "parsed" and result.requirements == ["React"]
+
+    result, outcome = parse_structured('{"description": "Build a shop", "requirements": "- React\\n- Stripe",',
+                                       JobDraftOutput, fallback)
+    assert outcome == "repaired" and result.requirements == ["React", "Stripe"]
+
+    result, outcome = parse_structured("I cannot help with that.", JobDraftOutput, fallback)
+    assert outcome == "fallback" and result.description == "fallback"
+
+    # Valid JSON of the wrong shape falls back too
+    _, outcome = parse_structured('{"highlights": []}', CoverLetterOutput,
+                                  lambda: CoverLetterOutput(cover_letter=""))
+    assert outcome == "fallback"
+
+    report = structured_output.snapshot()
+    assert report["JobDraftOutput"] == {
+        "parsed": 1, "repaired": 1, "fallback": 1, "repair_rate": 0.3333, "fallback_rate": 0.3333,
+    }
+    assert report["CoverLetterOutput"]["fallback_rate"] == 1.0
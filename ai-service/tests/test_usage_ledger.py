@@ -0,0 +1,74 @@
+"""
+Carphatian AI Microservice - Usage Ledger Tests
+
+Pending counts are flushed under the day they were recorded on, to Redis
+(fakeredis) and to the ledger file.
+
+Built by Carphatian
+"""
+
+import asyncio
+import json
+
+import pytest
+
+import usage_ledger
+from cache import AICache
+from config import get_settings
+from usage_ledger import USAGE_KEY, UsageLedger
+
+fakeredis = pytest.importorskip("fakeredis")
+
+USAGE = {"prompt_tokens": 1000, "completion_tokens": 0}
+
+
+def record_over_midnight(monkeypatch, ledger: UsageLedger) -> None:
+    """One call before midnight, one after, with no flush in between."""
+    monkeypatch.setattr(usage_ledger, "_today", lambda: "2026-03-01")
+    ledger.record_call("embed", "acme", "openai", "text-embedding-3-small", USAGE)
+    monkeypatch.setattr(usage_ledger, "_today", lambda: "2026-03-02")
+    ledger.record_call("embed", "acme", "openai", "text-embedding-3-small", USAGE)
+    ledger.record_call("embed", "acme", "openai", "text-embedding-3-small", USAGE)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = AICache()
+    cache._client = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer(), decode_responses=True)
+
+    async def get_cache():
+        return cache
+
+    monkeypatch.setattr(usage_ledger, "get_cache", get_cache)
+    monkeypatch.setattr(get_settings(), "usage_ledger_enabled", True)
+    return cache
+
+
+def test_flush_keeps_the_day_of_each_call(monkeypatch, cache):
+    async def run():
+        ledger = UsageLedger()
+        record_over_midnight(monkeypatch, ledger)
+        await ledger.flush()
+
+        field = "embed|openai|text-embedding-3-small|acme|calls"
+        assert await cache._client.hget(USAGE_KEY.format("2026-03-01"), field) == "1"
+        assert await cache._client.hget(USAGE_KEY.format("2026-03-02"), field) == "2"
+        assert await cache._client.ttl(USAGE_KEY.format("2026-03-01")) > 0
+
+    asyncio.run(run())
+
+
+def test_file_flush_keeps_the_day_of_each_call(monkeypatch, cache, tmp_path):
+    path = tmp_path / "usage.jsonl"
+    monkeypatch.setattr(get_settings(), "usage_ledger_file", str(path))
+    cache._client = None
+
+    async def run():
+        ledger = UsageLedger()
+        record_over_midnight(monkeypatch, ledger)
+        await ledger.flush()
+
+        entries = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [(entry["day"], entry["calls"]) for entry in entries] == [("2026-03-01", 1), ("2026-03-02", 2)]
+
+    asyncio.run(run())
@@ -0,0 +1,309 @@
+"""
+Carphatian AI Microservice - Request Tracing
+
+Per-request spans with a propagated request id.
+
+Every request gets a trace holding the spans recorded while it is handled
+(cache lookups, provider availability checks, provider attempts, parsing).
+The request id is taken from the incoming request header (or generated),
+bound to every log line, sent to provider APIs and echoed back.
+
+Spans are reported in a Server-Timing response header and can be
+exported as OTLP/JSON, appended to a local file and/or posted to a
+collector, for diagnosing individual slow requests.
+
+Built by Carphatian
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+import structlog
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import get_settings
+
+logger = structlog.get_logger()
+
+
+# Longest Server-Timing header we send (proxies commonly cap headers at 8KB)
+MAX_SERVER_TIMING_LENGTH = 2048
+
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+
+@dataclass
+class Span:
+    """One timed operation within a request."""
+    name: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float
+    end: Optional[float] = None
+    start_unix_ns: int = 0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+
+@dataclass
+class Trace:
+    """Spans recorded for one request."""
+    request_id: str
+    trace_id: str
+    start: float = field(default_factory=time.perf_counter)
+    start_unix_ns: int = field(default_factory=time.time_ns)
+    spans: List[Span] = field(default_factory=list)
+
+    def new_span(self, name: str, parent_id: Optional[str], start: float, **attributes) -> Span:
+        span = Span(
+            name=name,
+            span_id=os.urandom(8).hex(),
+            parent_id=parent_id,
+            start=start,
+            start_unix_ns=self.start_unix_ns + int((start - self.start) * 1e9),
+            attributes=attributes,
+        )
+        self.spans.append(span)
+        return span
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_request_id() -> Optional[str]:
+    """Request id of the request being handled, if any."""
+    trace = _current_trace.get()
+    return trace.request_id if trace else None
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """
+    Record a block as a span of the current request.
+
+    Spans nest: a span opened inside another becomes its child. Outside
+    a request (startup, batch workers) nothing is recorded.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    parent = _current_span.get()
+    current = trace.new_span(
+        name, parent.span_id if parent else None, time.perf_counter(), **attributes
+    )
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def record_span(name: str, start: float, end: float, **attributes) -> None:
+    """Record an already-measured interval (perf_counter times) as a span."""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    parent = _current_span.get()
+    trace.new_span(name, parent.span_id if parent else None, start, **attributes).end = end
+
+
+# ============================================================================
+# Server-Timing
+# ============================================================================
+
+def server_timing(trace: Trace, total: float) -> str:
+    """
+    Server-Timing header value for a trace.
+
+    Spans with the same name (e.g. one per provider attempt) are summed
+    into one metric whose description lists the providers involved.
+    """
+    durations: Dict[str, float] = {}
+    providers: Dict[str, List[str]] = {}
+    for item in trace.spans:
+        if item.end is None:
+            continue
+        durations[item.name] = durations.get(item.name, 0.0) + item.duration
+        provider = item.attributes.get("provider")
+        if provider and provider not in providers.setdefault(item.name, []):
+            providers[item.name].append(provider)
+
+    entries = [f"total;dur={total * 1000:.1f}"]
+    length = len(entries[0])
+    for name, duration in durations.items():
+        entry = f"{name};dur={duration * 1000:.1f}"
+        if providers.get(name):
+            entry += f';desc="{",".join(providers[name])}"'
+        length += len(entry) + 2
+        if length > MAX_SERVER_TIMING_LENGTH:
+            break
+        entries.append(entry)
+    return ", ".join(entries)
+
+
+# ============================================================================
+# OTLP/JSON Export
+# ============================================================================
+
+def _attribute(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def to_otlp(trace: Trace, root: Span) -> dict:
+    """Trace as an OTLP/JSON ExportTraceServiceRequest."""
+    settings = get_settings()
+    spans = []
+    for item in [root] + trace.spans:
+        data = {
+            "traceId": trace.trace_id,
+            "spanId": item.span_id,
+            "name": item.name,
+            # SPAN_KIND_SERVER for the request, SPAN_KIND_INTERNAL otherwise
+            "kind": 2 if item is root else 1,
+            "startTimeUnixNano": str(item.start_unix_ns),
+            "endTimeUnixNano": str(item.start_unix_ns + int(item.duration * 1e9)),
+            "attributes": [_attribute(k, v) for k, v in item.attributes.items()],
+            # STATUS_CODE_ERROR / STATUS_CODE_UNSET
+            "status": {"code": 2, "message": item.error} if item.error else {"code": 0},
+        }
+        if item.parent_id:
+            data["parentSpanId"] = item.parent_id
+        spans.append(data)
+
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                _attribute("service.name", settings.trace_service_name),
+                _attribute("service.version", settings.app_version),
+            ]},
+            "scopeSpans": [{"scope": {"name": "carphatian.ai"}, "spans": spans}],
+        }]
+    }
+
+
+def _append_line(path: str, line: str) -> None:
+    with open(path, "a") as f:
+        f.write(line + "\n")
+
+
+# Export tasks in flight (kept referenced until done)
+_exports: Set[asyncio.Task] = set()
+
+
+async def export_trace(payload: dict) -> None:
+    """Write a trace to the configured file and/or collector."""
+    settings = get_settings()
+    try:
+        if settings.trace_export_file:
+            await asyncio.to_thread(
+                _append_line, settings.trace_export_file, json.dumps(payload, separators=(",", ":"))
+            )
+        if settings.trace_export_endpoint:
+            from providers.http_pool import get_http_client
+            await get_http_client().post(settings.trace_export_endpoint, json=payload, timeout=5.0)
+    except Exception as e:
+        logger.warning("trace_export_failed", error=str(e))
+
+
+# ============================================================================
+# Middleware
+# ============================================================================
+
+class TracingMiddleware:
+    """
+    ASGI middleware starting a trace for each request.
+
+    Adds the request id and Server-Timing headers to the response and
+    exports requests slower than the configured threshold.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        settings = get_settings()
+        self.header = settings.request_id_header.lower()
+        self.export = bool(settings.trace_export_file or settings.trace_export_endpoint)
+        self.export_threshold = settings.trace_export_min_duration_ms / 1000
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = Headers(scope=scope).get(self.header)
+        request_id = incoming if incoming and _REQUEST_ID_RE.match(incoming) else uuid.uuid4().hex
+        trace_id = request_id if re.fullmatch(r"[0-9a-f]{32}", request_id) else (
+            hashlib.sha256(request_id.encode()).hexdigest()[:32]
+        )
+        trace = Trace(request_id=request_id, trace_id=trace_id)
+        trace_token = _current_trace.set(trace)
+        span_token = _current_span.set(None)
+        structlog.contextvars.bind_contextvars(request_id=request_id)
+        status_code = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                total = time.perf_counter() - trace.start
+                message["headers"] = list(message.get("headers", [])) + [
+                    (self.header.encode(), request_id.encode()),
+                    (b"server-timing", server_timing(trace, total).encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            structlog.contextvars.unbind_contextvars("request_id")
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+            duration = time.perf_counter() - trace.start
+            if self.export and duration >= self.export_threshold:
+                root = Span(
+                    name=f"{scope['method']} {scope['path']}",
+                    span_id=os.urandom(8).hex(),
+                    parent_id=None,
+                    start=trace.start,
+                    end=trace.start + duration,
+                    start_unix_ns=trace.start_unix_ns,
+                    attributes={
+                        "http.method": scope["method"],
+                        "http.target": scope["path"],
+                        "http.status_code": status_code,
+                        "request.id": request_id,
+                    },
+                    error=None if status_code < 500 else f"HTTP {status_code}",
+                )
+                for item in trace.spans:
+                    if item.parent_id is None:
+                        item.parent_id = root.span_id
+                task = asyncio.create_task(export_trace(to_otlp(trace, root)))
+                _exports.add(task)
+                task.add_done_callback(_exports.discard)
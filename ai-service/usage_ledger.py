@@ -0,0 +1,394 @@
+"""
+Carphatian AI Microservice - Usage & Cost Ledger
+
+Token usage and estimated spend per endpoint, provider, model and tenant,
+including the cost avoided by cache hits.
+
+Calls are aggregated in memory and flushed periodically in one pipeline
+of HINCRBY commands to the Redis hash of the day they were recorded on,
+or appended to a local JSONL file when Redis is unavailable. Lifetime totals of this process also feed
+cost-aware provider routing.
+
+Tenant ids come from a client header, so they are bounded before they
+become hash fields: unknown, malformed or excess tenants are accounted
+as "other" (see UsageLedger.tenant).
+
+Redis layout:
+    ai:usage:{YYYY-MM-DD}    "{endpoint}|{provider}|{model}|{tenant}|{metric}" -> count
+
+Built by Carphatian
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+import structlog
+
+from cache import get_cache
+from config import get_settings
+
+logger = structlog.get_logger()
+
+
+USAGE_KEY = "ai:usage:{}"
+
+# List prices in USD per million tokens: (input, output). Matched by the
+# longest model-name prefix; override with USAGE_PRICE_OVERRIDES.
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "claude-3-5-sonnet": (3.00, 15.00),
+    "claude-3-5-haiku": (0.80, 4.00),
+    "claude-3-opus": (15.00, 75.00),
+    "claude-3-sonnet": (3.00, 15.00),
+    "claude-3-haiku": (0.25, 1.25),
+    "llama-3.1-70b": (0.59, 0.79),
+    "llama-3.1-8b": (0.05, 0.08),
+    "mixtral-8x7b": (0.24, 0.24),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+    "text-embedding-ada-002": (0.10, 0.0),
+}
+
+# Call shape used to compare providers before any calls were observed
+REFERENCE_PROMPT_TOKENS = 1000
+REFERENCE_COMPLETION_TOKENS = 500
+
+METRICS = ("calls", "prompt_tokens", "completion_tokens", "cost_micros", "cache_hits", "avoided_cost_micros")
+
+# (endpoint, provider, model, tenant)
+Dimensions = Tuple[str, str, str, str]
+
+# Tenant of requests whose tenant header is unknown, malformed or over the cap
+OTHER_TENANT = "other"
+
+_TENANT_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.:-]{0,63}")
+
+
+@lru_cache(maxsize=4)
+def _parse_prices(overrides: Optional[str]) -> Dict[str, Tuple[float, float]]:
+    if not overrides:
+        return MODEL_PRICES
+    try:
+        return {**MODEL_PRICES, **{model: tuple(price) for model, price in json.loads(overrides).items()}}
+    except (ValueError, TypeError) as e:
+        logger.warning("usage_price_overrides_invalid", error=str(e))
+        return MODEL_PRICES
+
+
+def _prices() -> Dict[str, Tuple[float, float]]:
+    # Parsed once per override value, not on every call
+    return _parse_prices(get_settings().usage_price_overrides)
+
+
+@lru_cache(maxsize=4)
+def _known_tenants(value: Optional[str]) -> FrozenSet[str]:
+    return frozenset(item.strip() for item in (value or "").split(",") if item.strip())
+
+
+def model_price(model: str) -> Optional[Tuple[float, float]]:
+    """(input, output) USD per million tokens for a model, if known."""
+    prices = _prices()
+    matches = [prefix for prefix in prices if model.startswith(prefix)]
+    return prices[max(matches, key=len)] if matches else None
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimated cost of one call in USD (0 for unknown models)."""
+    price = model_price(model)
+    if price is None:
+        return 0.0
+    return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+
+
+def _clean(value: Optional[str], default: str) -> str:
+    """Dimension value safe to embed in a Redis field name."""
+    return (value or default).replace("|", "_")[:64]
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def _summarize(counts: Counter) -> dict:
+    summary = {metric: counts.get(metric, 0) for metric in METRICS}
+    summary["cost_usd"] = round(summary.pop("cost_micros") / 1_000_000, 6)
+    summary["avoided_cost_usd"] = round(summary.pop("avoided_cost_micros") / 1_000_000, 6)
+    return summary
+
+
+class UsageLedger:
+    """Batched usage and cost accounting for this process."""
+
+    def __init__(self):
+        # Not yet flushed, by the day the calls were recorded on
+        self._pending: Dict[str, Dict[Dimensions, Counter]] = {}
+        self._totals: Dict[Dimensions, Counter] = {}
+        # Per-day counts of this process, for reports without Redis or a ledger file
+        self._days: Dict[str, Dict[Dimensions, Counter]] = {}
+        # Tenants accepted so far when USAGE_TENANTS is not set
+        self._tenants: Set[str] = set()
+        self.enabled = get_settings().usage_ledger_enabled
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+
+    def tenant(self, value: Optional[str]) -> Optional[str]:
+        """
+        Bounded tenant id for a tenant header value.
+
+        Tenants must look like identifiers and be listed in USAGE_TENANTS,
+        or, without that list, be among the first USAGE_MAX_TENANTS seen by
+        this worker; anything else is OTHER_TENANT. None (no header) stays None.
+        """
+        if not value:
+            return None
+        if not _TENANT_RE.fullmatch(value):
+            return OTHER_TENANT
+        settings = get_settings()
+        known = _known_tenants(settings.usage_tenants)
+        if known:
+            return value if value in known else OTHER_TENANT
+        if value not in self._tenants:
+            if len(self._tenants) >= settings.usage_max_tenants:
+                return OTHER_TENANT
+            self._tenants.add(value)
+        return value
+
+    def _add(self, dimensions: Dimensions, counts: Dict[str, int]) -> None:
+        day = _today()
+        if day not in self._days:
+            self._days[day] = {}
+            retention = get_settings().usage_retention_days
+            for old in sorted(self._days)[:-retention]:
+                del self._days[old]
+        for store in (self._pending.setdefault(day, {}), self._totals, self._days[day]):
+            store.setdefault(dimensions, Counter()).update(counts)
+
+    def record_call(
+        self,
+        endpoint: str,
+        tenant: Optional[str],
+        provider: str,
+        model: str,
+        usage: Dict[str, int],
+    ) -> float:
+        """
+        Record one provider call.
+
+        Returns:
+            The estimated cost in USD
+        """
+        if not self.enabled:
+            return 0.0
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        cost = estimate_cost(model, prompt_tokens, completion_tokens)
+        self._add(
+            (endpoint, _clean(provider, "unknown"), _clean(model, "unknown"), _clean(tenant, "default")),
+            {
+                "calls": 1,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "cost_micros": round(cost * 1_000_000),
+            },
+        )
+        return cost
+
+    def record_cache_hit(self, endpoint: str, tenant: Optional[str], cached: dict) -> None:
+        """Record a cache hit and the cost of the call it replaced."""
+        if not self.enabled:
+            return
+        model = cached.get("model", "unknown")
+        usage = cached.get("usage") or {}
+        avoided = estimate_cost(model, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+        self._add(
+            (endpoint, _clean(cached.get("provider"), "unknown"), _clean(model, "unknown"), _clean(tenant, "default")),
+            {"cache_hits": 1, "avoided_cost_micros": round(avoided * 1_000_000)},
+        )
+
+    # ------------------------------------------------------------------
+    # Routing
+    # ------------------------------------------------------------------
+
+    def expected_cost(self, provider: str, model: str) -> float:
+        """
+        Expected cost of a call to a provider's model in USD.
+
+        Uses the mean observed cost of this process's calls to the model,
+        or the list price of a reference-sized call before any were made.
+        """
+        calls = cost_micros = 0
+        for (_, name, model_name, _), counts in self._totals.items():
+            if name == provider and model_name == model:
+                calls += counts["calls"]
+                cost_micros += counts["cost_micros"]
+        if calls:
+            return cost_micros / calls / 1_000_000
+        return estimate_cost(model, REFERENCE_PROMPT_TOKENS, REFERENCE_COMPLETION_TOKENS)
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    async def flush(self) -> None:
+        """Write pending counts to Redis (or the ledger file)."""
+        async with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            settings = get_settings()
+
+            try:
+                cache = await get_cache()
+                if cache._client is not None:
+                    async with cache._client.pipeline(transaction=False) as pipe:
+                        # Counts recorded before midnight go to that day's hash
+                        for day, day_pending in pending.items():
+                            key = USAGE_KEY.format(day)
+                            for dimensions, counts in day_pending.items():
+                                prefix = "|".join(dimensions)
+                                for metric, value in counts.items():
+                                    if value:
+                                        pipe.hincrby(key, f"{prefix}|{metric}", value)
+                            pipe.expire(key, settings.usage_retention_days * 86400)
+                        await pipe.execute()
+                    return
+
+                if settings.usage_ledger_file:
+                    lines = [
+                        json.dumps({
+                            "day": day,
+                            "ts": time.time(),
+                            "endpoint": dimensions[0],
+                            "provider": dimensions[1],
+                            "model": dimensions[2],
+                            "tenant": dimensions[3],
+                            **counts,
+                        })
+                        for day, day_pending in pending.items()
+                        for dimensions, counts in day_pending.items()
+                    ]
+                    await asyncio.to_thread(_append_lines, settings.usage_ledger_file, lines)
+                    return
+            except Exception as e:
+                logger.warning("usage_flush_failed", error=str(e))
+
+            # Nowhere to write: keep the counts for the next flush
+            for day, day_pending in pending.items():
+                for dimensions, counts in day_pending.items():
+                    self._pending.setdefault(day, {}).setdefault(dimensions, Counter()).update(counts)
+
+    async def _load(self, days: int) -> Tuple[str, Dict[Dimensions, Counter]]:
+        """Stored counts for the last `days` days and where they came from."""
+        settings = get_settings()
+        today = datetime.now(timezone.utc).date()
+        wanted = [(today - timedelta(days=offset)).strftime("%Y-%m-%d") for offset in range(days)]
+        rows: Dict[Dimensions, Counter] = {}
+
+        cache = await get_cache()
+        if cache._client is not None:
+            async with cache._client.pipeline(transaction=False) as pipe:
+                for day in wanted:
+                    pipe.hgetall(USAGE_KEY.format(day))
+                hashes = await pipe.execute()
+            for fields in hashes:
+                for field, value in fields.items():
+                    *dimensions, metric = field.split("|")
+                    rows.setdefault(tuple(dimensions), Counter())[metric] += int(value)
+            return "redis", rows
+
+        if settings.usage_ledger_file and os.path.exists(settings.usage_ledger_file):
+            lines = await asyncio.to_thread(_read_lines, settings.usage_ledger_file)
+            for line in lines:
+                entry = json.loads(line)
+                if entry["day"] in wanted:
+                    dimensions = (entry["endpoint"], entry["provider"], entry["model"], entry["tenant"])
+                    rows.setdefault(dimensions, Counter()).update(
+                        {metric: entry.get(metric, 0) for metric in METRICS}
+                    )
+            return "file", rows
+
+        for day in wanted:
+            for dimensions, counts in self._days.get(day, {}).items():
+                rows.setdefault(dimensions, Counter()).update(counts)
+        return "memory", rows
+
+    async def report(self, days: int = 1) -> dict:
+        """Usage and cost totals, broken down by endpoint, provider, model and tenant."""
+        await self.flush()
+        source, rows = await self._load(days)
+
+        totals: Counter = Counter()
+        breakdowns: Dict[str, Dict[str, Counter]] = {
+            "by_endpoint": {}, "by_provider": {}, "by_model": {}, "by_tenant": {},
+        }
+        for dimensions, counts in rows.items():
+            totals.update(counts)
+            for breakdown, value in zip(breakdowns.values(), dimensions):
+                breakdown.setdefault(value, Counter()).update(counts)
+
+        return {
+            "source": source,
+            "days": days,
+            "totals": _summarize(totals),
+            **{
+                name: {value: _summarize(counts) for value, counts in sorted(breakdown.items())}
+                for name, breakdown in breakdowns.items()
+            },
+        }
+
+    # ------------------------------------------------------------------
+    # Background flushing
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        interval = get_settings().usage_flush_interval
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+
+def _append_lines(path: str, lines: List[str]) -> None:
+    with open(path, "a") as f:
+        f.write("".join(line + "\n" for line in lines))
+
+
+def _read_lines(path: str) -> List[str]:
+    with open(path) as f:
+        return [line for line in f if line.strip()]
+
+
+# Singleton instance
+_ledger: Optional[UsageLedger] = None
+
+
+def get_usage_ledger() -> UsageLedger:
+    """Get or create the usage ledger for this process."""
+    global _ledger
+    if _ledger is None:
+        _ledger = UsageLedger()
+    return _ledger